@@ -3,11 +3,31 @@ import pandas as pd
 import openpyxl
 from openpyxl import load_workbook
 from PIL import Image
-import pytesseract
-from pdf2image import convert_from_bytes
+import io
 import re
 import json
 
+from utils import ocr
+from utils.duplicate_index import get_duplicate_index, upload_signatures
+from utils.einvoice_xml import (is_einvoice_file, iter_einvoice_zip, parse_einvoice_xml, to_invoice_items,
+                                to_invoice_record)
+from utils.image_input import show_quality
+from utils.image_quality import assess as assess_quality
+from utils.invoice_bands import EARLY_EXIT_CONF, ocr_bands
+from utils.invoice_layout import parse_invoice_words, parse_region_texts
+from utils.invoice_split import extract_invoices, split_pdf
+from utils.invoice_table import (COLUMNS as ITEM_FIELDS, ITEM_COLUMNS, ITEM_HEADERS, extract_table,
+                                 items_to_content, to_detail_rows)
+from utils.layout_templates import apply_template, get_template_store, page_layout, table_words
+from utils.ocr_engines import engine_for
+from utils.ocr_profiles import PROFILES, profile_for, resolve as resolve_profile
+from utils.ocr_profiles import format_stats as format_profile_stats
+from utils.pdf_pipeline import ocr_pdf
+from utils.pdf_render import get_renderer, has_text_layer
+from utils.session_memo import session_memo, upload_key
+from utils.ocr_scheduler import format_stats
+from utils.upload_store import open_image, preview_bytes, spool
+
 # Import OpenAI (optional)
 try:
     from openai import OpenAI
@@ -28,13 +48,19 @@ st.set_page_config(
 )
 
 st.title("📄 HÓA ĐƠN BÁN RA")
+# Tải OCR chung của máy chủ (số job đang chạy/chờ và thời gian chờ)
+st.sidebar.caption(format_stats())
+st.sidebar.caption(format_profile_stats())
 st.markdown("---")
 
-# Cấu hình tesseract (nếu cần)
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
 EXCEL_FILE = "Ket_qua_Hoa_don_ban_ra.xlsx"
 SHEET_NAME = "HD_BR"
+# Engine OCR cho hóa đơn (OCR_ENGINE_INVOICE, xem utils.ocr_engines)
+OCR_ENGINE = engine_for('invoice')
+# Loại chứng từ để chọn hồ sơ OCR mặc định (OCR_PROFILE_SALES_INVOICE, xem utils.ocr_profiles)
+DOCUMENT_TYPE = 'sales_invoice'
+# Sheet chi tiết dòng hàng hóa (mỗi dòng một mặt hàng, nối với sheet chính qua SỐ HĐ)
+DETAIL_SHEET_NAME = f"{SHEET_NAME}_CT"
 
 def fix_vietnamese_accents(text):
     """Sửa lại dấu tiếng Việt bị OCR đọc sai"""
@@ -61,15 +87,70 @@ def fix_vietnamese_accents(text):
     return result
 
 
-def extract_invoice_info(image):
-    """Trích xuất thông tin từ ảnh hóa đơn sử dụng OCR"""
+def invoice_complete(text, words):
+    """Đã đủ các trường cần lưu, trường đọc theo nhãn có độ tin cậy OCR tốt (để dừng OCR sớm)"""
+    layout = parse_invoice_words(words, party='buyer', min_conf=EARLY_EXIT_CONF)
+    return all(layout.values()) and bool(parse_invoice_text(text, fix_accents=False)['NỘI DUNG'])
+
+def extract_invoice_info(page, profile=None):
+    """Trích xuất text và word boxes từ ảnh hóa đơn (đã qua ocr.prepare_image) sử dụng OCR.
+
+    Trả về (text, words, stage): stage 'header_footer' nếu chỉ cần OCR dải đầu và cuối trang.
+    """
     try:
-        # Sử dụng OCR cơ bản với ngôn ngữ tiếng Việt và tiếng Anh
-        text = pytesseract.image_to_string(image, lang='vie+eng')
-        return text
+        # OCR tiếng Việt và tiếng Anh (có cache theo nội dung ảnh), dải đầu/cuối trang trước
+        return ocr_bands(page, invoice_complete, lang='vie+eng', engine=OCR_ENGINE, profile=profile)
     except Exception as e:
         st.error(f"Lỗi khi đọc OCR: {str(e)}")
-        return None
+        return None, {}, None
+
+def extract_with_template(page, profile=None):
+    """Áp mẫu bố cục đã học của nhà cung cấp quen (nếu có): chỉ OCR các vùng đã lưu.
+
+    Trả về (dữ liệu hóa đơn, text các vùng, mẫu) hoặc (None, None, None) nếu không có mẫu
+    khớp hoặc không đọc đủ các trường từ vùng của mẫu.
+    """
+    store = get_template_store()
+    try:
+        template, texts = apply_template(store, SHEET_NAME, page, lang='vie+eng', engine=OCR_ENGINE,
+                                         profile=profile)
+    except Exception as e:
+        st.warning(f"Không áp dụng được mẫu bố cục: {str(e)}")
+        return None, None, None
+    if template is None:
+        return None, None, None
+    values = parse_region_texts(texts)
+    if not all(values.values()):
+        store.record(template, hit=False)
+        return None, None, None
+    store.record(template, hit=True)
+    data = {
+        'SỐ HĐ': values['number'],
+        'NGÀY': values['date'],
+        'NỘI DUNG': parse_invoice_text(texts.get('content', ''), fix_accents=False)['NỘI DUNG'],
+        'ĐƠN VỊ NHẬN': template['anchor_value'],
+        'GIÁ TRỊ SAU THUẾ': values['total'],
+    }
+    return data, '\n\n'.join(texts.values()), template
+
+def render_scanned_page(pdf_bytes, dpi=200):
+    """Trang của PDF scan một trang (không có lớp text dùng được) render ở dpi, None nếu không phải"""
+    with get_renderer(pdf_bytes) as renderer:
+        if renderer.page_count() != 1 or has_text_layer(renderer.extract_words(0, dpi)):
+            return None
+        return renderer.render_page(0, dpi)
+
+def learn_template(layout, data):
+    """Học mẫu bố cục từ hóa đơn người dùng đã kiểm tra và lưu, để lần sau chỉ OCR các vùng"""
+    values = {
+        'number': data['SỐ HĐ'],
+        'date': data['NGÀY'],
+        'party': data['ĐƠN VỊ NHẬN'],
+        'total': data['GIÁ TRỊ SAU THUẾ'],
+        'content': data['NỘI DUNG'],
+    }
+    # Bảng hàng hóa dài ngắn khác nhau: vùng nội dung kéo dài xuống sát dòng tổng tiền
+    return get_template_store().learn(SHEET_NAME, layout, values, anchor='party', stretch={'content': 'total'})
 
 def extract_with_openai(text, api_key):
     """Sử dụng OpenAI API để trích xuất thông tin từ text OCR"""
@@ -145,7 +226,7 @@ Chỉ trả về JSON, không có text thêm."""
         st.error(f"Lỗi khi gọi OpenAI API: {str(e)}")
         return None
 
-def process_extracted_text(extracted_text, use_openai, api_key):
+def process_extracted_text(extracted_text, use_openai, api_key, fix_accents=True, words=None):
     """Xử lý text đã trích xuất bằng OCR, có thể dùng OpenAI nếu được bật"""
     if not extracted_text:
         return None
@@ -160,12 +241,16 @@ def process_extracted_text(extracted_text, use_openai, api_key):
             else:
                 # Fallback về phương pháp cũ
                 st.info("ℹ️ Sử dụng phương pháp OCR thông thường")
-                return parse_invoice_text(extracted_text)
+                return parse_invoice_text(extracted_text, fix_accents, words)
     else:
-        return parse_invoice_text(extracted_text)
+        return parse_invoice_text(extracted_text, fix_accents, words)
+
+def parse_invoice_text(text, fix_accents=True, words=None):
+    """Phân tích text OCR để trích xuất thông tin hóa đơn.
 
-def parse_invoice_text(text):
-    """Phân tích text OCR để trích xuất thông tin hóa đơn"""
+    fix_accents=False khi text lấy trực tiếp từ lớp text của PDF (dấu tiếng Việt đã chính xác).
+    Có words (word boxes OCR) thì các trường đọc được theo vị trí nhãn được ưu tiên hơn regex.
+    """
     info = {
         'SỐ HĐ': '',
         'NGÀY': '',
@@ -271,7 +356,8 @@ def parse_invoice_text(text):
             # Chỉ lấy nếu có ít nhất 3 ký tự và có chữ cái
             if len(don_vi) >= 3 and re.search(r'[A-Za-zÀ-ỹ]', don_vi):
                 # Sửa lại dấu tiếng Việt bị OCR đọc sai
-                don_vi = fix_vietnamese_accents(don_vi)
+                if fix_accents:
+                    don_vi = fix_vietnamese_accents(don_vi)
                 info['ĐƠN VỊ NHẬN'] = don_vi
                 break
     
@@ -397,8 +483,245 @@ def parse_invoice_text(text):
                 info['GIÁ TRỊ SAU THUẾ'] = value
                 break
     
+    # Đọc theo vị trí nhãn trên word boxes: giá trị nằm cạnh/dưới đúng nhãn của nó,
+    # không phụ thuộc thứ tự Tesseract ghép các khối thành text
+    if words:
+        layout = parse_invoice_words(words, party='buyer')
+        if layout['party'] and fix_accents:
+            layout['party'] = fix_vietnamese_accents(layout['party'])
+        for column, field in (('SỐ HĐ', 'number'), ('NGÀY', 'date'), ('ĐƠN VỊ NHẬN', 'party'),
+                              ('GIÁ TRỊ SAU THUẾ', 'total')):
+            if layout[field]:
+                info[column] = layout[field]
+    
     return info
 
+def extract_uploaded_invoice(uploaded_file, use_openai, api_key, dpi_mode='adaptive', profile_name=None,
+                             signatures=()):
+    """Đọc file upload, OCR và trích xuất thông tin hóa đơn (chỉ chạy một lần cho mỗi file).
+
+    signatures là chữ ký các trang (find_duplicate) để nhận ra từng hóa đơn đã lưu trong PDF nhiều hóa đơn.
+    """
+    profile = resolve_profile(profile_name or profile_for(DOCUMENT_TYPE), DOCUMENT_TYPE)
+    result = {'preview': None, 'caption': '', 'text': None, 'data': None, 'quality': None, 'layout': None,
+              'items': [], 'invoices': []}
+    if is_einvoice_file(uploaded_file.name):
+        # Hóa đơn điện tử XML: đọc trực tiếp các trường, không cần OCR/OpenAI
+        try:
+            invoice = parse_einvoice_xml(io.BytesIO(uploaded_file.getvalue()))
+            result['data'] = to_invoice_record(invoice, 'ĐƠN VỊ NHẬN')
+            result['items'] = to_invoice_items(invoice)
+        except Exception as e:
+            st.error(f"Lỗi khi đọc file XML: {str(e)}")
+    elif uploaded_file.type == 'application/pdf':
+        # Đọc lớp text nếu PDF có sẵn, nếu không thì raster hóa và OCR tất cả các trang,
+        # hiển thị từng trang khi xử lý xong
+        progress = st.progress(0.0, text="Đang OCR các trang PDF...")
+        partial = st.empty()
+        
+        def show_page(done_count, page_count, page_index, page_text):
+            progress.progress(done_count / page_count, text=f"Đã OCR {done_count}/{page_count} trang")
+            partial.text_area(f"Trang {page_index + 1}", page_text, height=150, disabled=True)
+        
+        pdf_bytes = uploaded_file.getvalue()
+        try:
+            # PDF nhiều hóa đơn (bảng kê cả tháng): dò ranh giới bằng dải đầu/cuối trang rồi
+            # trích xuất song song từng hóa đơn, mỗi hóa đơn một dòng
+            split = split_pdf(pdf_bytes, lang='vie+eng', engine=OCR_ENGINE, profile=profile,
+                              on_page=lambda done, total: progress.progress(
+                                  done / total, text=f"Đang tìm ranh giới hóa đơn {done}/{total} trang"))
+            if len(split['invoices']) > 1:
+                with get_renderer(pdf_bytes) as renderer:
+                    result['preview'] = preview_bytes(renderer.render_page(0, 100))
+                result['caption'] = (f"Trang đầu của PDF ({split['page_count']} trang, "
+                                     f"{len(split['invoices'])} hóa đơn)")
+                result['invoices'] = extract_statement(pdf_bytes, split, dpi_mode, profile, progress, signatures)
+                return result
+            # PDF scan một trang của nhà cung cấp quen: áp mẫu bố cục như với ảnh chụp
+            image = render_scanned_page(pdf_bytes)
+            if image is not None:
+                page = ocr.prepare_image(image, preprocess=True, engine=OCR_ENGINE)
+                result['data'], region_text, template = extract_with_template(page, profile)
+                if result['data']:
+                    result['preview'] = preview_bytes(image)
+                    result['caption'] = "Trang PDF scan - dùng mẫu bố cục đã học, chỉ OCR các vùng cần thiết"
+                    result['text'] = region_text
+                    result['items'] = extract_items(None, page=page, profile=profile, template=template)
+                    use_items_content(result)
+                    return result
+            document = ocr_pdf(pdf_bytes, dpi=200, lang='vie+eng', on_page=show_page,
+                               dpi_mode=dpi_mode, engine=OCR_ENGINE, profile=profile)
+            if document['page_count']:
+                # Giao diện chỉ nhận ảnh xem trước nhỏ, không giữ trang 200 DPI trong session
+                if document['preview'] is not None:
+                    result['preview'] = preview_bytes(document['preview'])
+                result['caption'] = f"Trang đầu của PDF ({document['page_count']} trang)"
+                ocr_stats = [stats for stats in document['dpi_stats'] if stats]
+                if document['source'] == 'text':
+                    result['caption'] += " - đọc trực tiếp lớp text, không cần OCR"
+                elif ocr_stats:
+                    result['caption'] += (f" - OCR ở {max(stats['dpi'] for stats in ocr_stats)} DPI, "
+                                          f"render lại {sum(stats['rerenders'] for stats in ocr_stats)} vùng")
+                result['text'] = document['text']
+                result['data'] = process_extracted_text(result['text'], use_openai, api_key,
+                                                        fix_accents=document['source'] != 'text',
+                                                        words=document['words'])
+                result['items'] = extract_items(document['words'], profile=profile)
+                use_items_content(result)
+            else:
+                st.error("Không thể đọc file PDF")
+        except Exception as e:
+            st.error(f"Lỗi khi xử lý PDF: {str(e)}")
+        finally:
+            progress.empty()
+            partial.empty()
+    else:
+        # Xử lý ảnh
+        # JPEG lớn được giải mã thu nhỏ (draft), giao diện chỉ nhận ảnh xem trước nhỏ
+        image = open_image(uploaded_file)
+        result['preview'] = preview_bytes(image)
+        result['caption'] = "Ảnh hóa đơn"
+        # Ảnh mờ/lóa/độ phân giải quá thấp: không OCR, yêu cầu chụp lại
+        result['quality'] = assess_quality(image, 'a4')
+        if not result['quality']['ok']:
+            return result
+        # Nhà cung cấp quen (đã có mẫu bố cục): chỉ OCR các vùng, bỏ qua OCR toàn trang và OpenAI
+        page = ocr.prepare_image(image, preprocess=True, engine=OCR_ENGINE)
+        result['data'], region_text, template = extract_with_template(page, profile)
+        if result['data']:
+            result['text'] = region_text
+            result['caption'] += " - dùng mẫu bố cục đã học, chỉ OCR các vùng cần thiết"
+            # Bảng hàng hóa: chỉ OCR thêm vùng bảng của mẫu
+            result['items'] = extract_items(None, page=page, profile=profile, template=template)
+            use_items_content(result)
+            return result
+        result['text'], words, stage = extract_invoice_info(page, profile)
+        if stage == 'header_footer':
+            result['caption'] += " - đủ thông tin từ đầu và cuối trang, bỏ qua OCR phần giữa"
+        if words:
+            # Giữ bố cục trang để học mẫu khi người dùng lưu hóa đơn
+            result['layout'] = page_layout(page, words)
+            # Bảng hàng hóa: cắt ô theo đường kẻ hoặc gióng cột theo tiêu đề, phần giữa trang
+            # chưa OCR (dừng sớm) thì chỉ OCR thêm vùng bảng
+            result['items'] = extract_items(words, page=page, ocr_region=stage == 'header_footer',
+                                            profile=profile)
+        result['data'] = process_extracted_text(result['text'], use_openai, api_key, words=words)
+        use_items_content(result)
+    return result
+
+def extract_split_invoice(text, words, source, profile=None):
+    """Trích xuất một hóa đơn của PDF nhiều hóa đơn, trả về (dữ liệu hóa đơn, dòng hàng hóa).
+
+    Chạy song song trên thread phụ (utils.invoice_split) nên không gọi st.* và không dùng OpenAI.
+    """
+    data = parse_invoice_text(text, fix_accents=source != 'text', words=words)
+    items = extract_table(words, lang='vie+eng', engine=OCR_ENGINE, profile=profile)
+    if items:
+        data['NỘI DUNG'] = items_to_content(items)
+    return data, items
+
+def extract_statement(pdf_bytes, split, dpi_mode, profile, progress, signatures=()):
+    """OCR và trích xuất song song các hóa đơn đã tách, trả về danh sách {'data', 'items', 'pages', 'duplicate'}.
+
+    Hóa đơn đã lưu trước đó (so khớp chữ ký các trang của riêng hóa đơn đó) không OCR lại,
+    duplicate là bản ghi trùng (xem find_duplicate) hoặc None.
+    """
+    index = get_duplicate_index()
+    invoices = []
+    pending = []
+    for invoice in split['invoices']:
+        duplicate = index.find_document(SHEET_NAME, invoice_signatures(signatures, invoice['pages']))
+        entry = {'data': duplicate['record'] if duplicate else None, 'items': [], 'pages': invoice['pages'],
+                 'duplicate': duplicate}
+        invoices.append(entry)
+        if duplicate is None:
+            pending.append((entry, invoice))
+    results = extract_invoices(
+        pdf_bytes, [invoice for _, invoice in pending],
+        lambda text, words, source: extract_split_invoice(text, words, source, profile),
+        dpi=200, lang='vie+eng', dpi_mode=dpi_mode, engine=OCR_ENGINE, profile=profile,
+        on_invoice=lambda done, total, _: progress.progress(done / total, text=f"Đã trích xuất {done}/{total} hóa đơn"))
+    for (entry, _), extracted in zip(pending, results):
+        if extracted['error']:
+            st.warning(f"Hóa đơn {page_range(extracted['pages'])}: {extracted['error']}")
+        entry['data'], entry['items'] = extracted['result'] or (parse_invoice_text(''), [])
+    return invoices
+
+def invoice_signatures(signatures, pages):
+    """Chữ ký các trang của một hóa đơn đã tách (trang ngoài phạm vi đã tính hash thì bỏ qua)"""
+    return [signatures[page] for page in pages if page < len(signatures)]
+
+def page_range(pages):
+    """Chuỗi trang hiển thị của một hóa đơn đã tách (ví dụ: trang 3-4)"""
+    first, last = pages[0] + 1, pages[-1] + 1
+    return f"trang {first}" if first == last else f"trang {first}-{last}"
+
+def extract_items(words, page=None, ocr_region=False, profile=None, template=None):
+    """Tách bảng hàng hóa; lỗi ở bước này không làm mất các trường chính đã trích xuất.
+
+    Có template (mẫu bố cục đã áp) thì words lấy từ OCR riêng vùng bảng của mẫu trên page.
+    """
+    try:
+        if template is not None:
+            words = table_words(page, template, lang='vie+eng', engine=OCR_ENGINE, profile=profile)
+            if not words:
+                return []
+        return extract_table(words, page=page, ocr_region=ocr_region, engine=OCR_ENGINE, profile=profile)
+    except Exception as e:
+        st.warning(f"Không tách được bảng hàng hóa: {str(e)}")
+        return []
+
+def use_items_content(result):
+    """Tách được bảng hàng hóa thì lấy NỘI DUNG từ các dòng của bảng (chính xác hơn dò text)"""
+    if result['items'] and result['data']:
+        result['data']['NỘI DUNG'] = items_to_content(result['items'])
+
+def import_einvoice_zip(uploaded_file):
+    """Đọc tất cả hóa đơn XML trong file ZIP, trả về (danh sách bản ghi, dòng hàng hóa, danh sách lỗi)"""
+    rows = []
+    item_rows = []
+    errors = []
+    try:
+        # ZIP lớn được spool ra đĩa thay vì thêm một bản sao trong bộ nhớ
+        with spool(uploaded_file) as zip_file:
+            for filename, invoice, error in iter_einvoice_zip(zip_file):
+                if invoice is None:
+                    errors.append(f"{filename}: {error}")
+                else:
+                    record = to_invoice_record(invoice, 'ĐƠN VỊ NHẬN')
+                    rows.append(record)
+                    item_rows.extend(to_detail_rows(record['SỐ HĐ'], record['NGÀY'], to_invoice_items(invoice)))
+    except Exception as e:
+        errors.append(f"Lỗi khi đọc file ZIP: {str(e)}")
+    return rows, item_rows, errors
+
+def find_duplicate(uploaded_file):
+    """Tìm hóa đơn đã lưu trùng với file upload (bản scan/chụp lại) theo hash cảm quan các trang.
+
+    Trả về (chữ ký các trang, bản ghi trùng hoặc None); chỉ coi là trùng khi phần lớn các trang
+    khớp cùng một hóa đơn đã lưu. Chỉ mục chỉ được ghi khi người dùng xác nhận liên kết hoặc
+    lưu hóa đơn. XML không cần kiểm tra (số HĐ đọc chính xác).
+    """
+    if is_einvoice_file(uploaded_file.name):
+        return [], None
+    try:
+        signatures = upload_signatures(uploaded_file, uploaded_file.type == 'application/pdf')
+    except Exception:
+        return [], None
+    return signatures, get_duplicate_index().find_document(SHEET_NAME, signatures)
+
+def show_duplicate(duplicate, signatures, source):
+    """Hiển thị hóa đơn đã lưu trùng với file upload, cho phép liên kết file vào bản ghi đó"""
+    record = duplicate['record']
+    st.warning(f"♻️ File này trùng với hóa đơn đã lưu: số {record.get('SỐ HĐ', '')} ngày {record.get('NGÀY', '')} "
+               f"(file {duplicate['source'] or 'không rõ'}, lưu lúc {duplicate['created']}, "
+               f"khớp {duplicate['matched']}/{duplicate['pages']} trang) - bỏ qua OCR")
+    st.dataframe(pd.DataFrame([record]), use_container_width=True)
+    # Liên kết để lần upload sau (ảnh chụp khác của cùng hóa đơn) nhận ra ngay
+    if duplicate['distance'] > 0 and st.button("🔗 Liên kết file này với hóa đơn đã lưu"):
+        get_duplicate_index().add(SHEET_NAME, signatures, record, source)
+        st.success("✅ Đã liên kết file với hóa đơn đã lưu")
+
 def load_excel_data():
     """Đọc dữ liệu từ file Excel"""
     try:
@@ -436,8 +759,57 @@ def load_excel_data():
         st.error(f"Lỗi khi đọc file Excel: {str(e)}")
         return pd.DataFrame(columns=['SỐ HĐ', 'NGÀY', 'NỘI DUNG', 'ĐƠN VỊ NHẬN', 'GIÁ TRỊ SAU THUẾ'])
 
-def save_to_excel(new_data):
+def save_to_excel(new_data, items=()):
     """Ghi dữ liệu mới vào file Excel với định dạng font tiếng Việt và độ rộng cột"""
+    return save_rows_to_excel([new_data], to_detail_rows(new_data['SỐ HĐ'], new_data['NGÀY'], items))
+
+def save_detail_rows(wb, item_rows):
+    """Ghi các dòng hàng hóa vào sheet chi tiết (DETAIL_SHEET_NAME) của workbook đang mở"""
+    from openpyxl.styles import Font, Alignment, PatternFill
+    
+    if DETAIL_SHEET_NAME not in wb.sheetnames:
+        ws = wb.create_sheet(DETAIL_SHEET_NAME)
+    else:
+        ws = wb[DETAIL_SHEET_NAME]
+    if ws.max_row == 0 or ws.cell(1, 1).value is None:
+        ws.append(ITEM_HEADERS)
+    
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(name="Arial", size=11, bold=True, color="FFFFFF")
+    for col_idx in range(1, len(ITEM_HEADERS) + 1):
+        cell = ws.cell(1, col_idx)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    
+    first_new_row = ws.max_row + 1
+    for item_row in item_rows:
+        ws.append([item_row.get(header, '') for header in ITEM_HEADERS])
+    
+    # SỐ HĐ, NGÀY, STT, TÊN HÀNG HÓA, ĐVT, SỐ LƯỢNG, ĐƠN GIÁ, THÀNH TIỀN
+    for col_letter, width in zip('ABCDEFGH', (15, 15, 8, 50, 10, 12, 15, 18)):
+        ws.column_dimensions[col_letter].width = width
+    
+    data_font = Font(name="Arial", size=10)
+    for new_row in range(first_new_row, ws.max_row + 1):
+        for col_idx in range(1, len(ITEM_HEADERS) + 1):
+            cell = ws.cell(new_row, col_idx)
+            cell.font = data_font
+            cell.alignment = Alignment(horizontal="left", vertical="top", wrap_text=col_idx == 4)
+
+def load_detail_data():
+    """Đọc các dòng hàng hóa đã lưu ở sheet chi tiết (rỗng nếu chưa có)"""
+    try:
+        wb = load_workbook(EXCEL_FILE, read_only=True)
+        if DETAIL_SHEET_NAME not in wb.sheetnames:
+            return pd.DataFrame(columns=ITEM_HEADERS)
+        data = [row for row in wb[DETAIL_SHEET_NAME].iter_rows(min_row=2, values_only=True) if any(row)]
+        return pd.DataFrame(data, columns=ITEM_HEADERS)
+    except FileNotFoundError:
+        return pd.DataFrame(columns=ITEM_HEADERS)
+
+def save_rows_to_excel(rows, item_rows=()):
+    """Ghi nhiều hóa đơn (và dòng hàng hóa của chúng) vào file Excel trong một lần mở/lưu file (dùng khi nhập ZIP XML)"""
     try:
         from openpyxl.styles import Font, Alignment, PatternFill
         
@@ -466,13 +838,9 @@ def save_to_excel(new_data):
             cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
         
         # Thêm dữ liệu mới
-        ws.append([
-            new_data.get('SỐ HĐ', ''),
-            new_data.get('NGÀY', ''),
-            new_data.get('NỘI DUNG', ''),
-            new_data.get('ĐƠN VỊ NHẬN', ''),
-            new_data.get('GIÁ TRỊ SAU THUẾ', '')
-        ])
+        first_new_row = ws.max_row + 1
+        for new_data in rows:
+            ws.append([new_data.get(header, '') for header in headers])
         
         # Định dạng dữ liệu: font tiếng Việt, wrap text cho các cột dài
         data_font = Font(name="Arial", size=10)
@@ -488,16 +856,19 @@ def save_to_excel(new_data):
         for col_letter, width in column_widths.items():
             ws.column_dimensions[col_letter].width = width
         
-        # Định dạng dữ liệu cho hàng mới
-        new_row = ws.max_row
-        for col_idx in range(1, len(headers) + 1):
-            cell = ws.cell(new_row, col_idx)
-            cell.font = data_font
-            # Wrap text cho các cột nội dung dài
-            if col_idx in [3, 4]:  # NỘI DUNG, ĐƠN VỊ NHẬN
-                cell.alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
-            else:
-                cell.alignment = Alignment(horizontal="left", vertical="center")
+        # Định dạng dữ liệu cho các hàng mới
+        for new_row in range(first_new_row, ws.max_row + 1):
+            for col_idx in range(1, len(headers) + 1):
+                cell = ws.cell(new_row, col_idx)
+                cell.font = data_font
+                # Wrap text cho các cột nội dung dài
+                if col_idx in [3, 4]:  # NỘI DUNG, ĐƠN VỊ NHẬN
+                    cell.alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
+                else:
+                    cell.alignment = Alignment(horizontal="left", vertical="center")
+        
+        if item_rows:
+            save_detail_rows(wb, item_rows)
         
         wb.save(EXCEL_FILE)
         return True
@@ -511,7 +882,7 @@ def save_to_excel(new_data):
 tab1, tab2 = st.tabs(["📤 Nhập hóa đơn mới", "📋 Danh sách hóa đơn"])
 
 with tab1:
-    st.header("Nhập hóa đơn từ file PDF hoặc ảnh")
+    st.header("Nhập hóa đơn từ file PDF, ảnh hoặc XML hóa đơn điện tử")
     
     # Cấu hình OpenAI (nếu có)
     with st.expander("🔧 Cấu hình nâng cao (OpenAI API)", expanded=False):
@@ -536,6 +907,35 @@ with tab1:
             api_key = None
             use_openai = False
     
+    with st.expander("⚙️ Cấu hình OCR", expanded=False):
+        dpi_mode = st.selectbox(
+            "Độ phân giải khi OCR PDF scan",
+            options=['adaptive', 'fixed'],
+            format_func=lambda mode: {
+                'adaptive': "Thích ứng (150 DPI, render lại vùng chữ mờ ở 300 DPI)",
+                'fixed': "Cố định 200 DPI",
+            }[mode],
+            help="Chế độ thích ứng nhanh hơn với trang rõ nét và chính xác hơn với chữ nhỏ"
+        )
+        profile_name = st.selectbox(
+            "Hồ sơ OCR",
+            options=list(PROFILES),
+            index=list(PROFILES).index(profile_for(DOCUMENT_TYPE)),
+            format_func=lambda name: {
+                'fast': "Nhanh (mô hình fast, chỉ tiếng Việt, không phân tích bố cục)",
+                'balanced': "Cân bằng (mặc định)",
+                'accurate': "Chính xác (mô hình best, thêm mẫu số/ngày/số tiền)",
+            }[name],
+            help="Thời gian OCR trung bình của từng hồ sơ hiển thị ở sidebar"
+        )
+        template_stats = get_template_store().stats(SHEET_NAME)
+        if template_stats:
+            hits = sum(t['hits'] for t in template_stats)
+            uses = hits + sum(t['misses'] for t in template_stats)
+            st.caption(f"🧩 {len(template_stats)} mẫu bố cục nhà cung cấp đã học, "
+                       f"dùng được {hits}/{uses} lần áp mẫu")
+            st.dataframe(pd.DataFrame(template_stats), use_container_width=True)
+    
     # Khởi tạo biến nếu chưa có
     if 'use_openai' not in locals():
         use_openai = False
@@ -543,46 +943,112 @@ with tab1:
         api_key = st.session_state.get('openai_api_key', DEFAULT_API_KEY)
     
     uploaded_file = st.file_uploader(
-        "Chọn file PDF hoặc ảnh hóa đơn",
-        type=['pdf', 'png', 'jpg', 'jpeg'],
-        help="Hỗ trợ file PDF hoặc ảnh (PNG, JPG, JPEG)"
+        "Chọn file PDF, ảnh hoặc XML hóa đơn điện tử",
+        type=['pdf', 'png', 'jpg', 'jpeg', 'xml', 'zip'],
+        help="Hỗ trợ file PDF, ảnh (PNG, JPG, JPEG), XML hóa đơn điện tử hoặc file ZIP chứa nhiều XML"
     )
+    # Chụp trực tiếp bằng camera (điện thoại/webcam) thay cho file upload, chụp lại ngay nếu ảnh không đạt
+    if st.checkbox("📷 Chụp ảnh hóa đơn bằng camera", key=f"invoice_camera_{SHEET_NAME}"):
+        camera_photo = st.camera_input("Chụp ảnh hóa đơn")
+        if camera_photo is not None:
+            uploaded_file = camera_photo
+    
+    # Bản scan/chụp lại của hóa đơn đã lưu: nhận ra trước khi OCR (tính hash một lần cho mỗi file)
+    signatures, duplicate = [], None
+    if uploaded_file is not None and not uploaded_file.name.lower().endswith('.zip'):
+        signatures, duplicate = session_memo(
+            f"invoice_duplicate_{SHEET_NAME}",
+            upload_key(uploaded_file),
+            lambda: find_duplicate(uploaded_file)
+        )
+    
+    if uploaded_file is not None and uploaded_file.name.lower().endswith('.zip'):
+        # Nhập hàng loạt hóa đơn XML trong file ZIP
+        zip_rows, zip_item_rows, zip_errors = session_memo(
+            f"invoice_zip_{SHEET_NAME}",
+            upload_key(uploaded_file),
+            lambda: import_einvoice_zip(uploaded_file)
+        )
+        st.info(f"🗂️ Đọc được {len(zip_rows)} hóa đơn XML từ file ZIP")
+        if zip_errors:
+            with st.expander(f"⚠️ {len(zip_errors)} file không đọc được"):
+                st.text("\n".join(zip_errors))
+        if zip_rows:
+            st.dataframe(pd.DataFrame(zip_rows), use_container_width=True)
+            st.caption(f"🧾 {len(zip_item_rows)} dòng hàng hóa sẽ được lưu vào sheet {DETAIL_SHEET_NAME}")
+            if st.button("💾 Lưu tất cả hóa đơn vào Excel", type="primary"):
+                if save_rows_to_excel(zip_rows, zip_item_rows):
+                    st.success(f"✅ Đã lưu {len(zip_rows)} hóa đơn thành công!")
+                    st.balloons()
+                else:
+                    st.error("❌ Lỗi khi lưu hóa đơn")
+    
+    elif duplicate is not None and not st.checkbox("Vẫn xử lý như hóa đơn mới", key=f"invoice_not_duplicate_{SHEET_NAME}"):
+        show_duplicate(duplicate, signatures, uploaded_file.name)
     
-    if uploaded_file is not None:
+    elif uploaded_file is not None:
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("Xem trước file")
-            if uploaded_file.type == 'application/pdf':
+            if is_einvoice_file(uploaded_file.name):
+                st.info("🧾 File XML hóa đơn điện tử đã được tải lên - đọc trực tiếp, không cần OCR")
+            elif uploaded_file.type == 'application/pdf':
                 st.info("📄 File PDF đã được tải lên")
-                # Chuyển đổi PDF thành ảnh
-                try:
-                    pdf_bytes = uploaded_file.read()
-                    images = convert_from_bytes(pdf_bytes, dpi=200)
-                    if images:
-                        st.image(images[0], caption="Trang đầu của PDF", use_container_width=True)
-                        extracted_text = extract_invoice_info(images[0])
-                        invoice_data = process_extracted_text(extracted_text, use_openai, api_key)
-                    else:
-                        st.error("Không thể đọc file PDF")
-                        invoice_data = None
-                except Exception as e:
-                    st.error(f"Lỗi khi xử lý PDF: {str(e)}")
-                    invoice_data = None
-            else:
-                # Xử lý ảnh
-                image = Image.open(uploaded_file)
-                st.image(image, caption="Ảnh hóa đơn", use_container_width=True)
-                extracted_text = extract_invoice_info(image)
-                invoice_data = process_extracted_text(extracted_text, use_openai, api_key)
+            # OCR + OpenAI chỉ chạy một lần cho mỗi file; khi sửa form (rerun) sẽ dùng lại kết quả
+            extraction = session_memo(
+                f"invoice_extraction_{SHEET_NAME}",
+                upload_key(uploaded_file, bool(use_openai and api_key), dpi_mode, profile_name),
+                lambda: extract_uploaded_invoice(uploaded_file, use_openai, api_key, dpi_mode, profile_name, signatures)
+            )
+            if extraction['preview'] is not None:
+                st.image(extraction['preview'], caption=extraction['caption'], use_container_width=True)
+            if extraction['quality']:
+                show_quality(extraction['quality'])
+            extracted_text = extraction['text']
+            invoice_data = extraction['data']
         
         with col2:
             st.subheader("Thông tin trích xuất")
             
-            if invoice_data:
+            if extraction['invoices']:
+                # PDF nhiều hóa đơn: mỗi hóa đơn một dòng, kiểm tra/sửa rồi lưu tất cả trong một lần
+                invoices = [invoice for invoice in extraction['invoices'] if invoice['duplicate'] is None]
+                duplicates = [invoice for invoice in extraction['invoices'] if invoice['duplicate'] is not None]
+                st.info(f"🗂️ Tách được {len(extraction['invoices'])} hóa đơn từ file PDF")
+                if duplicates:
+                    with st.expander(f"♻️ {len(duplicates)} hóa đơn đã lưu trước đó - bỏ qua OCR"):
+                        st.dataframe(pd.DataFrame([{'TRANG': page_range(invoice['pages']), **invoice['data']}
+                                                   for invoice in duplicates]), use_container_width=True)
+                if not invoices:
+                    st.info("Tất cả hóa đơn trong file đã được lưu trước đó")
+                else:
+                    edited_rows = st.data_editor(
+                        pd.DataFrame([{'TRANG': page_range(invoice['pages']), **invoice['data']} for invoice in invoices]),
+                        disabled=['TRANG'],
+                        use_container_width=True,
+                        key=f"invoice_split_{SHEET_NAME}_{upload_key(uploaded_file)[1][:16]}"
+                    )
+                    rows = edited_rows.drop(columns=['TRANG']).fillna('').astype(str).to_dict('records')
+                    item_rows = [item_row for row, invoice in zip(rows, invoices)
+                                 for item_row in to_detail_rows(row['SỐ HĐ'], row['NGÀY'], invoice['items'])]
+                    st.caption(f"🧾 {len(item_rows)} dòng hàng hóa sẽ được lưu vào sheet {DETAIL_SHEET_NAME}")
+                    if st.button("💾 Lưu tất cả hóa đơn vào Excel", type="primary"):
+                        if save_rows_to_excel(rows, item_rows):
+                            st.success(f"✅ Đã lưu {len(rows)} hóa đơn thành công!")
+                            for row, invoice in zip(rows, invoices):
+                                pages = invoice_signatures(signatures, invoice['pages'])
+                                if pages:
+                                    get_duplicate_index().add(SHEET_NAME, pages, row, uploaded_file.name)
+                            st.balloons()
+                        else:
+                            st.error("❌ Lỗi khi lưu hóa đơn")
+            
+            elif invoice_data:
                 # Hiển thị text OCR (có thể ẩn)
-                with st.expander("📝 Text OCR đã đọc"):
-                    st.text_area("", extracted_text, height=200, disabled=True)
+                if extracted_text:
+                    with st.expander("📝 Text OCR đã đọc"):
+                        st.text_area("", extracted_text, height=200, disabled=True)
                 
                 # Form chỉnh sửa thông tin
                 st.markdown("**Vui lòng kiểm tra và chỉnh sửa thông tin:**")
@@ -593,6 +1059,18 @@ with tab1:
                 don_vi = st.text_input("Đơn vị nhận", value=invoice_data['ĐƠN VỊ NHẬN'])
                 gia_tri = st.text_input("Giá trị sau thuế", value=invoice_data['GIÁ TRỊ SAU THUẾ'])
                 
+                # Dòng hàng hóa tách từ bảng (hoặc XML), lưu vào sheet chi tiết để phân tích chi phí không cần OCR lại
+                st.markdown("**Dòng hàng hóa, dịch vụ:**")
+                edited_items = st.data_editor(
+                    pd.DataFrame(extraction['items'], columns=ITEM_FIELDS).rename(columns=ITEM_COLUMNS),
+                    num_rows="dynamic",
+                    use_container_width=True,
+                    # Mỗi file một khóa: phần đã sửa của file trước không áp sang file sau
+                    key=f"invoice_items_{SHEET_NAME}_{upload_key(uploaded_file)[1][:16]}"
+                )
+                items = [item for item in edited_items.rename(columns={v: k for k, v in ITEM_COLUMNS.items()})
+                         .fillna('').astype(str).to_dict('records') if item['name'].strip()]
+                
                 if st.button("💾 Lưu hóa đơn vào Excel", type="primary"):
                     final_data = {
                         'SỐ HĐ': so_hd,
@@ -602,8 +1080,12 @@ with tab1:
                         'GIÁ TRỊ SAU THUẾ': gia_tri if gia_tri else ''
                     }
                     
-                    if save_to_excel(final_data):
+                    if save_to_excel(final_data, items):
                         st.success("✅ Đã lưu hóa đơn thành công!")
+                        if signatures:
+                            get_duplicate_index().add(SHEET_NAME, signatures, final_data, uploaded_file.name)
+                        if extraction['layout'] and learn_template(extraction['layout'], final_data):
+                            st.caption("🧩 Đã lưu mẫu bố cục, hóa đơn sau cùng mẫu sẽ chỉ OCR các vùng cần thiết")
                         st.balloons()
                     else:
                         st.error("❌ Lỗi khi lưu hóa đơn")
@@ -618,6 +1100,11 @@ with tab2:
     if not df.empty:
         st.dataframe(df, use_container_width=True)
         
+        detail_df = load_detail_data()
+        if not detail_df.empty:
+            with st.expander(f"🧾 Chi tiết hàng hóa ({len(detail_df)} dòng, sheet {DETAIL_SHEET_NAME})"):
+                st.dataframe(detail_df, use_container_width=True)
+        
         # Thống kê
         col1, col2, col3 = st.columns(3)
         with col1:
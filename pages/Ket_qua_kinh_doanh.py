@@ -3,6 +3,8 @@ import pandas as pd
 import openpyxl
 from openpyxl import load_workbook
 
+from utils.invoice_table import ITEM_HEADERS
+
 st.set_page_config(
     page_title="Kết quả kinh doanh",
     page_icon="📊",
@@ -17,6 +19,8 @@ EXCEL_FILE_MUA_VAO = "Ket_qua_Hoa_don_mua_vao.xlsx"
 SHEET_NAME_MUA_VAO = "HD_MV"
 EXCEL_FILE_BAN_RA = "Ket_qua_Hoa_don_ban_ra.xlsx"
 SHEET_NAME_BAN_RA = "HD_BR"
+# Sheet chi tiết dòng hàng hóa do trang hóa đơn lưu cùng file
+DETAIL_SHEET_MUA_VAO = f"{SHEET_NAME_MUA_VAO}_CT"
 
 def load_excel_data_mua_vao():
     """Đọc dữ liệu từ file Excel hóa đơn mua vào"""
@@ -64,6 +68,20 @@ def load_excel_data_ban_ra():
         st.error(f"Lỗi khi đọc file Excel bán ra: {str(e)}")
         return pd.DataFrame(columns=['SỐ HĐ', 'NGÀY', 'NỘI DUNG', 'ĐƠN VỊ NHẬN', 'GIÁ TRỊ SAU THUẾ'])
 
+def load_item_data(excel_file, sheet_name):
+    """Đọc các dòng hàng hóa đã lưu (không cần OCR lại hóa đơn)"""
+    try:
+        wb = load_workbook(excel_file, read_only=True)
+        if sheet_name not in wb.sheetnames:
+            return pd.DataFrame(columns=ITEM_HEADERS)
+        data = [row for row in wb[sheet_name].iter_rows(min_row=2, values_only=True) if any(row)]
+        return pd.DataFrame(data, columns=ITEM_HEADERS)
+    except FileNotFoundError:
+        return pd.DataFrame(columns=ITEM_HEADERS)
+    except Exception as e:
+        st.error(f"Lỗi khi đọc chi tiết hàng hóa: {str(e)}")
+        return pd.DataFrame(columns=ITEM_HEADERS)
+
 def calculate_total_value(df, column_name='GIÁ TRỊ SAU THUẾ'):
     """Tính tổng giá trị từ cột trong DataFrame"""
     if df.empty or column_name not in df.columns:
@@ -201,11 +219,28 @@ with st.expander("📐 Chi tiết công thức tính toán", expanded=False):
        - Lưu ý: Chỉ tính khi Thuế VAT phải nộp > 0
     """)
 
+# Chi phí theo mặt hàng từ các dòng hàng hóa đã lưu
+df_items_mua_vao = load_item_data(EXCEL_FILE_MUA_VAO, DETAIL_SHEET_MUA_VAO)
+if not df_items_mua_vao.empty:
+    st.markdown("### **🧾 CHI PHÍ THEO MẶT HÀNG (MUA VÀO)**")
+    df_items = df_items_mua_vao.assign(**{
+        column: pd.to_numeric(df_items_mua_vao[column], errors='coerce').fillna(0)
+        for column in ('SỐ LƯỢNG', 'THÀNH TIỀN')
+    })
+    df_cost = (df_items.groupby(['TÊN HÀNG HÓA, DỊCH VỤ', 'ĐVT'], dropna=False)
+               .agg(**{'SỐ HĐ': ('SỐ HĐ', 'nunique'), 'SỐ LƯỢNG': ('SỐ LƯỢNG', 'sum'),
+                       'THÀNH TIỀN': ('THÀNH TIỀN', 'sum')})
+               .sort_values('THÀNH TIỀN', ascending=False)
+               .reset_index())
+    st.dataframe(df_cost, use_container_width=True, hide_index=True)
+    st.info(f"📊 {len(df_items_mua_vao)} dòng hàng hóa | {len(df_cost)} mặt hàng | "
+            f"Tổng tiền hàng (chưa thuế): **{format_number(df_items['THÀNH TIỀN'].sum())} đ**")
+
 # Nút làm mới
 if st.button("🔄 Làm mới dữ liệu", type="primary"):
     st.rerun()
 
 st.markdown("---")
 st.markdown("**📁 Dữ liệu nguồn:**")
-st.markdown(f"- **Hóa đơn mua vào:** `{EXCEL_FILE_MUA_VAO}` | Sheet: `{SHEET_NAME_MUA_VAO}`")
+st.markdown(f"- **Hóa đơn mua vào:** `{EXCEL_FILE_MUA_VAO}` | Sheet: `{SHEET_NAME_MUA_VAO}`, `{DETAIL_SHEET_MUA_VAO}`")
 st.markdown(f"- **Hóa đơn bán ra:** `{EXCEL_FILE_BAN_RA}` | Sheet: `{SHEET_NAME_BAN_RA}`")
@@ -3,11 +3,22 @@ import pandas as pd
 import openpyxl
 from openpyxl import load_workbook
 from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
 import re
 from datetime import datetime
 import json
 
+from utils import ocr
+from utils.cccd_layout import extract_fields, normalize_card, parse_layout
+from utils.cccd_pipeline import CCCDExtractionPipeline
+from utils.cccd_qr import read_cccd_qr
+from utils.image_input import check_quality, image_input, show_preview
+from utils.mrz import read_mrz
+from utils.ocr_engines import engine_for
+from utils.ocr_profiles import profile_for, resolve as resolve_profile
+from utils.ocr_profiles import format_stats as format_profile_stats
+from utils.ocr_scheduler import format_stats
+from utils.upload_store import open_image
+
 # Import OpenAI (optional)
 try:
     from openai import OpenAI
@@ -28,22 +39,28 @@ st.set_page_config(
 )
 
 st.title("🆔 LẤY THÔNG TIN NHÂN VIÊN TỪ CCCD")
+# Tải OCR chung của máy chủ (số job đang chạy/chờ và thời gian chờ)
+st.sidebar.caption(format_stats())
+st.sidebar.caption(format_profile_stats())
 st.markdown("---")
 
-# Cấu hình tesseract (nếu cần)
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
 EXCEL_FILE = "Ket_qua_CCCD.xlsx"
+# Engine OCR cho ảnh CCCD (OCR_ENGINE_CCCD, xem utils.ocr_engines)
+OCR_ENGINE = engine_for('cccd')
+# Hồ sơ OCR (OCR_PROFILE_CCCD, xem utils.ocr_profiles)
+OCR_PROFILE = resolve_profile(profile_for('cccd'), 'cccd')
 
 def extract_text_with_ocr(image):
-    """Trích xuất text từ ảnh sử dụng OCR cơ bản"""
+    """Trích xuất text và word boxes từ ảnh sử dụng OCR cơ bản"""
     try:
-        # Sử dụng OCR cơ bản với ngôn ngữ tiếng Việt và tiếng Anh
-        text = pytesseract.image_to_string(image, lang='vie+eng')
-        return text
+        # OCR tiếng Việt và tiếng Anh (có cache theo nội dung ảnh); ảnh chụp được thu nhỏ,
+        # nhị phân hóa, sửa hướng và chỉnh nghiêng trước khi đưa vào Tesseract. Word boxes
+        # dùng để đọc trường theo vị trí nhãn (utils.cccd_layout.parse_layout)
+        return ocr.image_to_document(image, lang='vie+eng', preprocess=True, engine=OCR_ENGINE,
+                                     profile=OCR_PROFILE)
     except Exception as e:
         st.error(f"Lỗi khi đọc OCR: {str(e)}")
-        return ""
+        return "", {}
 
 def extract_cccd_with_openai(text_front, text_back, api_key):
     """Sử dụng OpenAI API để trích xuất thông tin từ text OCR CCCD"""
@@ -129,34 +146,42 @@ Chỉ trả về JSON, không có text thêm."""
         return None
 
 def process_cccd_extraction(image_front, image_back, use_openai, api_key):
-    """Xử lý trích xuất thông tin CCCD, có thể dùng OpenAI nếu được bật"""
+    """Xử lý trích xuất thông tin CCCD, có thể dùng OpenAI nếu được bật.
+
+    Mỗi mặt chỉ được OCR một lần; text được dùng chung cho OpenAI, regex và phần debug.
+    """
+    pipeline = CCCDExtractionPipeline(extract_text_with_ocr, extract_cccd_info, extract_cccd_with_openai,
+                                      extract_fields, read_mrz, read_cccd_qr, normalize_card,
+                                      parse_layout, engine=OCR_ENGINE, profile=OCR_PROFILE)
     try:
+        # Giải mã QR mặt trước, cắt và nắn thẻ, OCR vùng các trường còn thiếu, MRZ mặt sau;
+        # đọc đủ các trường thì không cần OCR toàn thẻ, có QR/MRZ đã xác thực thì không cần cả OpenAI
+        pipeline.run_fast_paths(image_front, image_back)
+        if pipeline.can_skip_full_ocr(use_openai and api_key and OPENAI_AVAILABLE):
+            pipeline.use_fields()
+            return pipeline
+        
         # Đọc text từ OCR cơ bản
-        text_front = extract_text_with_ocr(image_front)
-        text_back = extract_text_with_ocr(image_back)
+        pipeline.run_ocr(image_front, image_back)
         
         # Sử dụng OpenAI nếu được bật và có API key
         if use_openai and api_key and OPENAI_AVAILABLE:
             with st.spinner("🤖 Đang sử dụng OpenAI để trích xuất thông tin..."):
-                openai_data = extract_cccd_with_openai(text_front, text_back, api_key)
-                if openai_data:
-                    st.success("✅ Đã sử dụng OpenAI để trích xuất thông tin")
-                    return openai_data, text_front + "\n" + text_back
-                else:
-                    # Fallback về phương pháp cũ
-                    st.info("ℹ️ Sử dụng phương pháp OCR thông thường")
-                    info, full_text = extract_cccd_info(image_front, image_back)
-                    return info, full_text
-        else:
-            info, full_text = extract_cccd_info(image_front, image_back)
-            return info, full_text
+                openai_data = pipeline.run_openai(api_key)
+            if openai_data:
+                st.success("✅ Đã sử dụng OpenAI để trích xuất thông tin")
+                return pipeline
+            # Fallback về phương pháp cũ
+            st.info("ℹ️ Sử dụng phương pháp OCR thông thường")
+        pipeline.run_regex()
+        return pipeline
             
     except Exception as e:
         st.error(f"Lỗi khi xử lý OCR: {str(e)}")
-        return None, ""
+        return pipeline
 
-def extract_cccd_info(image_front, image_back):
-    """Trích xuất thông tin từ ảnh CCCD mặt trước và sau"""
+def extract_cccd_info(text_front, text_back):
+    """Trích xuất thông tin từ text OCR của CCCD mặt trước và sau"""
     info = {
         'Số CCCD': '',
         'Họ và tên': '',
@@ -170,14 +195,6 @@ def extract_cccd_info(image_front, image_back):
     }
     
     try:
-        # Đọc text từ mặt trước
-        text_front = extract_text_with_ocr(image_front)
-        
-        # Đọc text từ mặt sau
-        text_back = extract_text_with_ocr(image_back)
-        
-        full_text = text_front + "\n" + text_back
-        
         # Trích xuất số CCCD - định dạng "Số / No.: 080188012880"
         # Tìm từ khóa "Số / No.:" hoặc tương tự, sau đó lấy số 12 chữ số ngay sau đó
         so_no_pattern = r'(?:Số|SO)\s*[/\\]\s*No\.?\s*[:]'
@@ -478,11 +495,11 @@ def extract_cccd_info(image_front, image_back):
                 info['Nơi cấp'] = match.group(1).strip()
                 break
         
-        return info, full_text
+        return info
         
     except Exception as e:
         st.error(f"Lỗi khi đọc OCR: {str(e)}")
-        return info, ""
+        return info
 
 def load_excel_data():
     """Đọc dữ liệu từ file Excel"""
@@ -825,43 +842,44 @@ with tab1:
     
     with col1:
         st.subheader("Mặt trước")
-        image_front_file = st.file_uploader(
-            "Chọn ảnh mặt trước",
-            type=['png', 'jpg', 'jpeg'],
-            key="front"
-        )
+        image_front_file = image_input("Chọn ảnh mặt trước", key="front")
         if image_front_file:
-            image_front = Image.open(image_front_file)
-            st.image(image_front, caption="Mặt trước CCCD", use_container_width=True)
+            image_front = open_image(image_front_file)
+            show_preview(image_front_file, "Mặt trước CCCD", "front")
+            quality_front = check_quality(image_front_file, 'card', "front")
     
     with col2:
         st.subheader("Mặt sau")
-        image_back_file = st.file_uploader(
-            "Chọn ảnh mặt sau",
-            type=['png', 'jpg', 'jpeg'],
-            key="back"
-        )
+        image_back_file = image_input("Chọn ảnh mặt sau", key="back")
         if image_back_file:
-            image_back = Image.open(image_back_file)
-            st.image(image_back, caption="Mặt sau CCCD", use_container_width=True)
+            image_back = open_image(image_back_file)
+            show_preview(image_back_file, "Mặt sau CCCD", "back")
+            quality_back = check_quality(image_back_file, 'card', "back")
     
     if image_front_file and image_back_file:
-        if st.button("🔍 Trích xuất thông tin", type="primary"):
-            cccd_info, full_text = process_cccd_extraction(image_front, image_back, use_openai, api_key)
-            
-            # Đọc riêng OCR text từng mặt để hiển thị debug
-            text_front_debug = extract_text_with_ocr(image_front)
-            text_back_debug = extract_text_with_ocr(image_back)
+        # Ảnh quá mờ/lóa/độ phân giải thấp: yêu cầu chụp lại thay vì OCR ra kết quả sai
+        quality_ok = quality_front['ok'] and quality_back['ok']
+        if not quality_ok:
+            st.info("📷 Vui lòng chụp lại ảnh không đạt chất lượng trước khi trích xuất")
+        if st.button("🔍 Trích xuất thông tin", type="primary", disabled=not quality_ok):
+            pipeline = process_cccd_extraction(image_front, image_back, use_openai, api_key)
             
-            # Lưu vào session_state để giữ lại dữ liệu
-            if cccd_info:
-                st.session_state['cccd_info'] = cccd_info
-                st.session_state['cccd_full_text'] = full_text
-                st.session_state['text_front_debug'] = text_front_debug
-                st.session_state['text_back_debug'] = text_back_debug
+            # Lưu vào session_state để giữ lại dữ liệu (text debug lấy lại từ pipeline, không OCR lần nữa)
+            if pipeline.info:
+                st.session_state['cccd_info'] = pipeline.info
+                st.session_state['cccd_full_text'] = pipeline.full_text
+                st.session_state['text_front_debug'] = pipeline.text_front or ''
+                st.session_state['text_back_debug'] = pipeline.text_back or ''
+                st.session_state['cccd_field_texts'] = pipeline.field_texts
+                st.session_state['cccd_timings'] = pipeline.format_timings()
             
             # Hiển thị kết quả
             st.success("✅ Đã trích xuất thông tin!")
+            st.caption(f"⏱️ {pipeline.format_timings()}")
+            if pipeline.qr:
+                st.caption("🔳 Đã đọc thông tin từ mã QR mặt trước")
+            elif pipeline.mrz_verified():
+                st.caption("🔐 MRZ mặt sau khớp chữ số kiểm tra: số CCCD, ngày sinh, giới tính đã được xác thực")
             
         # Hiển thị form chỉnh sửa thông tin (luôn hiển thị nếu có dữ liệu trong session_state)
         if 'cccd_info' in st.session_state and st.session_state['cccd_info']:
@@ -870,6 +888,11 @@ with tab1:
             # Hiển thị text OCR chi tiết (để debug) nếu có
             if 'text_front_debug' in st.session_state:
                 with st.expander("🐛 DEBUG: Text OCR đã đọc (Để kiểm tra)", expanded=False):
+                    if 'cccd_timings' in st.session_state:
+                        st.caption(f"⏱️ Thời gian xử lý: {st.session_state['cccd_timings']}")
+                    if st.session_state.get('cccd_field_texts'):
+                        st.write("**OCR theo vùng trường:**")
+                        st.json(st.session_state['cccd_field_texts'])
                     st.write("**MẶT TRƯỚC (OCR Text):**")
                     st.text_area("", st.session_state['text_front_debug'], height=150, disabled=True, key="ocr_front_debug")
                     st.write("**MẶT SAU (OCR Text):**")
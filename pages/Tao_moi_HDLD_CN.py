@@ -1,10 +1,21 @@
 import streamlit as st
 from PIL import Image
-import pytesseract
 import re
 import json
 from datetime import datetime
 
+from utils import ocr
+from utils.cccd_layout import extract_fields, normalize_card, parse_layout
+from utils.cccd_pipeline import CCCDExtractionPipeline
+from utils.cccd_qr import read_cccd_qr
+from utils.image_input import check_quality, image_input, show_preview
+from utils.mrz import read_mrz
+from utils.ocr_engines import engine_for
+from utils.ocr_profiles import profile_for, resolve as resolve_profile
+from utils.ocr_profiles import format_stats as format_profile_stats
+from utils.ocr_scheduler import format_stats
+from utils.upload_store import open_image
+
 # Import OpenAI (optional)
 try:
     from openai import OpenAI
@@ -25,22 +36,28 @@ st.set_page_config(
 )
 
 st.title("📝 TẠO MỚI HỢP ĐỒNG LAO ĐỘNG CÔNG NHÂN")
+# Tải OCR chung của máy chủ (số job đang chạy/chờ và thời gian chờ)
+st.sidebar.caption(format_stats())
+st.sidebar.caption(format_profile_stats())
 st.markdown("---")
 st.markdown("**Hướng dẫn:** Upload ảnh mặt trước và mặt sau CCCD để tự động tạo hợp đồng lao động")
 
-# Cấu hình tesseract (nếu cần)
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
 TEMPLATE_FILE = "HDLD_Mau.txt"
+# Engine OCR cho ảnh CCCD (OCR_ENGINE_CCCD, xem utils.ocr_engines)
+OCR_ENGINE = engine_for('cccd')
+# Hồ sơ OCR (OCR_PROFILE_CONTRACT, xem utils.ocr_profiles)
+OCR_PROFILE = resolve_profile(profile_for('contract'), 'contract')
 
 def extract_text_with_ocr(image):
-    """Trích xuất text từ ảnh sử dụng OCR cơ bản"""
+    """Trích xuất text và word boxes từ ảnh sử dụng OCR cơ bản"""
     try:
-        text = pytesseract.image_to_string(image, lang='vie+eng')
-        return text
+        # Ảnh chụp được thu nhỏ, nhị phân hóa, sửa hướng và chỉnh nghiêng trước khi OCR;
+        # word boxes dùng để đọc trường theo vị trí nhãn (utils.cccd_layout.parse_layout)
+        return ocr.image_to_document(image, lang='vie+eng', preprocess=True, engine=OCR_ENGINE,
+                                     profile=OCR_PROFILE)
     except Exception as e:
         st.error(f"Lỗi khi đọc OCR: {str(e)}")
-        return ""
+        return "", {}
 
 def extract_cccd_with_openai(text_front, text_back, api_key):
     """Sử dụng OpenAI API để trích xuất thông tin từ text OCR CCCD"""
@@ -122,8 +139,8 @@ Chỉ trả về JSON, không có text thêm."""
         st.error(f"Lỗi khi gọi OpenAI API: {str(e)}")
         return None
 
-def extract_cccd_info(image_front, image_back):
-    """Trích xuất thông tin từ ảnh CCCD mặt trước và sau (phương pháp regex)"""
+def extract_cccd_info(text_front, text_back):
+    """Trích xuất thông tin từ text OCR CCCD mặt trước và sau (phương pháp regex)"""
     info = {
         'Số CCCD': '',
         'Họ và tên': '',
@@ -137,11 +154,6 @@ def extract_cccd_info(image_front, image_back):
     }
     
     try:
-        text_front = extract_text_with_ocr(image_front)
-        text_back = extract_text_with_ocr(image_back)
-        
-        full_text = text_front + "\n" + text_back
-        
         # Trích xuất số CCCD
         so_no_pattern = r'(?:Số|SO)\s*[/\\]\s*No\.?\s*[:]'
         so_no_match = re.search(so_no_pattern, text_front, re.IGNORECASE)
@@ -234,21 +246,26 @@ def extract_cccd_info(image_front, image_back):
         return info
 
 def process_cccd_extraction(image_front, image_back, use_openai, api_key):
-    """Xử lý trích xuất thông tin CCCD"""
+    """Xử lý trích xuất thông tin CCCD (mỗi mặt chỉ OCR một lần)"""
+    pipeline = CCCDExtractionPipeline(extract_text_with_ocr, extract_cccd_info, extract_cccd_with_openai,
+                                      extract_fields, read_mrz, read_cccd_qr, normalize_card,
+                                      parse_layout, engine=OCR_ENGINE, profile=OCR_PROFILE)
     try:
-        text_front = extract_text_with_ocr(image_front)
-        text_back = extract_text_with_ocr(image_back)
+        # Giải mã QR mặt trước, cắt và nắn thẻ, OCR vùng các trường còn thiếu, MRZ mặt sau;
+        # đọc đủ các trường thì không cần OCR toàn thẻ, có QR/MRZ đã xác thực thì không cần cả OpenAI
+        pipeline.run_fast_paths(image_front, image_back)
+        if pipeline.can_skip_full_ocr(use_openai and api_key and OPENAI_AVAILABLE):
+            return pipeline.use_fields()
+        
+        pipeline.run_ocr(image_front, image_back)
         
         if use_openai and api_key and OPENAI_AVAILABLE:
             with st.spinner("🤖 Đang sử dụng OpenAI để trích xuất thông tin..."):
-                openai_data = extract_cccd_with_openai(text_front, text_back, api_key)
-                if openai_data:
-                    return openai_data
-                else:
-                    st.info("ℹ️ Sử dụng phương pháp OCR thông thường")
-                    return extract_cccd_info(image_front, image_back)
-        else:
-            return extract_cccd_info(image_front, image_back)
+                openai_data = pipeline.run_openai(api_key)
+            if openai_data:
+                return openai_data
+            st.info("ℹ️ Sử dụng phương pháp OCR thông thường")
+        return pipeline.run_regex()
             
     except Exception as e:
         st.error(f"Lỗi khi xử lý OCR: {str(e)}")
@@ -415,28 +432,26 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("Mặt trước CCCD")
-    image_front_file = st.file_uploader(
-        "Chọn ảnh mặt trước",
-        type=['png', 'jpg', 'jpeg'],
-        key="front_hdld"
-    )
+    image_front_file = image_input("Chọn ảnh mặt trước", key="front_hdld")
     if image_front_file:
-        image_front = Image.open(image_front_file)
-        st.image(image_front, caption="Mặt trước CCCD", use_container_width=True)
+        image_front = open_image(image_front_file)
+        show_preview(image_front_file, "Mặt trước CCCD", "front_hdld")
+        quality_front = check_quality(image_front_file, 'card', "front_hdld")
 
 with col2:
     st.subheader("Mặt sau CCCD")
-    image_back_file = st.file_uploader(
-        "Chọn ảnh mặt sau",
-        type=['png', 'jpg', 'jpeg'],
-        key="back_hdld"
-    )
+    image_back_file = image_input("Chọn ảnh mặt sau", key="back_hdld")
     if image_back_file:
-        image_back = Image.open(image_back_file)
-        st.image(image_back, caption="Mặt sau CCCD", use_container_width=True)
+        image_back = open_image(image_back_file)
+        show_preview(image_back_file, "Mặt sau CCCD", "back_hdld")
+        quality_back = check_quality(image_back_file, 'card', "back_hdld")
 
 if image_front_file and image_back_file:
-    if st.button("📝 Tạo hợp đồng lao động (PDF)", type="primary", use_container_width=True):
+    # Ảnh quá mờ/lóa/độ phân giải thấp: yêu cầu chụp lại thay vì OCR ra kết quả sai
+    quality_ok = quality_front['ok'] and quality_back['ok']
+    if not quality_ok:
+        st.info("📷 Vui lòng chụp lại ảnh không đạt chất lượng trước khi trích xuất")
+    if st.button("📝 Tạo hợp đồng lao động (PDF)", type="primary", use_container_width=True, disabled=not quality_ok):
         with st.spinner("Đang trích xuất thông tin từ CCCD..."):
             cccd_info = process_cccd_extraction(image_front, image_back, use_openai, api_key)
         
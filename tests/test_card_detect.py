@@ -0,0 +1,58 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from utils import card_detect
+from utils.card_detect import CARD_SIZE, detect_card, find_card_quad, order_points, otsu_threshold
+from utils.ocr_cache import OCRCache
+
+
+def _photo(angle=0, size=(1600, 1200)):
+    """Thẻ sáng cỡ 856x540 (ô đen ở góc trên trái) trên nền tối, nghiêng angle độ"""
+    card = Image.new('RGB', (856, 540), (230, 230, 220))
+    ImageDraw.Draw(card).rectangle((40, 40, 240, 200), fill=(20, 20, 20))
+    photo = Image.new('RGB', size, (40, 35, 30))
+    photo.paste(card, ((size[0] - 856) // 2, (size[1] - 540) // 2))
+    return photo.rotate(angle, resample=Image.BICUBIC, fillcolor=(40, 35, 30))
+
+
+def test_order_points():
+    shuffled = [(100, 90), (0, 0), (0, 100), (110, 5)]
+    assert order_points(shuffled).tolist() == [[0, 0], [110, 5], [100, 90], [0, 100]]
+
+
+def test_otsu_threshold_separates_two_levels():
+    gray = np.array([[40] * 60 + [220] * 40] * 10, dtype=np.uint8)
+    assert 40 <= otsu_threshold(gray) < 220
+
+
+def test_find_card_quad_on_tilted_photo(monkeypatch):
+    monkeypatch.setattr(card_detect, 'CV2_AVAILABLE', False)
+    quad = find_card_quad(_photo(angle=8))
+    assert quad is not None
+    width, height = card_detect._quad_size(quad)
+    assert abs(width - 856) < 25 and abs(height - 540) < 25
+
+
+def test_detect_card_rectifies_to_card_size(monkeypatch):
+    monkeypatch.setattr(card_detect, 'CV2_AVAILABLE', False)
+    card = detect_card(_photo(angle=5))
+    assert card.size == CARD_SIZE
+    gray = np.asarray(card.convert('L'))
+    # Ô đen nằm ở góc trên trái của thẻ đã nắn, phần còn lại sáng
+    assert gray[100:200, 80:250].mean() < 80 and gray[400:600, 600:900].mean() > 180
+
+
+def test_no_card_in_blank_photo(monkeypatch):
+    monkeypatch.setattr(card_detect, 'CV2_AVAILABLE', False)
+    assert find_card_quad(Image.new('RGB', (1600, 1200), (128, 128, 128))) is None
+
+
+def test_get_card_caches_result(monkeypatch, tmp_path):
+    cache = OCRCache(str(tmp_path))
+    calls = []
+    monkeypatch.setattr(card_detect, 'get_cache', lambda: cache)
+    monkeypatch.setattr(card_detect, 'detect_card', lambda image: calls.append(1))
+    photo = _photo()
+    assert card_detect.get_card(photo) is None
+    assert card_detect.get_card(photo) is None
+    assert len(calls) == 1
@@ -0,0 +1,64 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from utils import cccd_layout
+from utils.card_detect import CARD_SIZE
+from utils.ocr_cache import OCRCache
+
+# Font mặc định của Pillow không có glyph tiếng Việt nên dùng chữ không dấu
+LINES = ["CONG HOA XA HOI CHU NGHIA VIET NAM", "Doc lap - Tu do - Hanh phuc", "Ho va ten / Full name:",
+         "Nguyen Van An", "Ngay sinh / Date of birth: 01/02/2003", "Gioi tinh / Sex: Nam",
+         "Noi thuong tru / Place of residence: Quan 1, TP Ho Chi Minh"]
+
+
+def _card():
+    card = Image.new('RGB', CARD_SIZE, (235, 235, 225))
+    draw = ImageDraw.Draw(card)
+    font = ImageFont.load_default(size=26)
+    for i, line in enumerate(LINES):
+        draw.text((40, 40 + i * 80), line, font=font, fill=(20, 20, 20))
+    return card
+
+
+def _photo(card, rotate):
+    """Ảnh chụp thẻ trên nền bàn tối, xoay rotate độ"""
+    photo = Image.new('RGB', (CARD_SIZE[0] + 300, CARD_SIZE[1] + 300), (40, 35, 30))
+    photo.paste(card, (150, 150))
+    return photo.rotate(rotate, expand=True)
+
+
+def _diff(a, b):
+    size = (200, 126)
+    return np.abs(np.asarray(a.convert('L').resize(size), dtype=np.int16)
+                  - np.asarray(b.convert('L').resize(size), dtype=np.int16)).mean()
+
+
+def _isolated_cache(monkeypatch, tmp_path):
+    cache = OCRCache(str(tmp_path))
+    monkeypatch.setattr(cccd_layout, 'get_cache', lambda: cache)
+    monkeypatch.setattr('utils.card_detect.get_cache', lambda: cache)
+    # Hình dạng dòng chữ phải tự quyết định được hướng thẻ, không hỏi engine OCR
+    monkeypatch.setattr(cccd_layout, 'is_upside_down', _no_engine)
+
+
+def _no_engine(gray, engine=None):
+    raise AssertionError("engine OCR không được hỏi khi hình dạng dòng chữ đủ để quyết định")
+
+
+def test_normalize_card_turns_portrait_photos_upright(monkeypatch, tmp_path):
+    _isolated_cache(monkeypatch, tmp_path)
+    card = _card()
+    for rotate in (0, 90, 180, 270):
+        normalized = cccd_layout.normalize_card(_photo(card, rotate))
+        assert normalized is not None and normalized.size == CARD_SIZE
+        assert _diff(normalized, card) < _diff(normalized, card.transpose(Image.ROTATE_180)), rotate
+
+
+def test_normalize_card_does_not_treat_3_2_photo_as_cropped_card(monkeypatch, tmp_path):
+    _isolated_cache(monkeypatch, tmp_path)
+    assert cccd_layout.normalize_card(Image.new('RGB', (1500, 1000), (128, 128, 128))) is None
+
+
+def test_normalize_card_keeps_normalized_cards():
+    card = _card()
+    assert cccd_layout.normalize_card(card) is card
@@ -0,0 +1,22 @@
+from PIL import Image
+
+from utils.cccd_pipeline import CCCDExtractionPipeline
+
+
+def test_fast_paths_forward_engine_and_profile():
+    calls = {}
+
+    def fields_func(front, back, skip=(), engine=None, profile=None):
+        calls['fields'] = (engine, profile)
+        return {'Số CCCD': '079201001234'}, {}
+
+    def mrz_func(back, engine=None, profile=None):
+        calls['mrz'] = (engine, profile)
+        return None
+
+    profile = {'name': 'fast'}
+    pipeline = CCCDExtractionPipeline(lambda image: '', lambda front, back: {}, fields_func=fields_func,
+                                      mrz_func=mrz_func, engine='onnx', profile=profile)
+    image = Image.new('RGB', (856, 540), 'white')
+    assert pipeline.run_fast_paths(image, image) == {'Số CCCD': '079201001234'}
+    assert calls == {'fields': ('onnx', profile), 'mrz': ('onnx', profile)}
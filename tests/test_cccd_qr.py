@@ -0,0 +1,26 @@
+from utils.cccd_qr import parse_cccd_qr
+
+
+def test_parse_cccd_qr_payload():
+    payload = "079201001234|123456789|Nguyễn Văn An|01022003|Nam|12 Lê Lợi, Quận 1, TP.HCM|15062021\n"
+    assert parse_cccd_qr(payload) == {
+        'Số CCCD': '079201001234',
+        'Họ và tên': 'NGUYỄN VĂN AN',
+        'Ngày sinh': '01/02/2003',
+        'Giới tính': 'Nam',
+        'Quốc tịch': 'Việt Nam',
+        'Nơi thường trú': '12 Lê Lợi, Quận 1, TP.HCM',
+        'Ngày cấp': '15/06/2021',
+    }
+
+
+def test_parse_cccd_qr_drops_unreadable_fields():
+    fields = parse_cccd_qr("079201001234||Trần Thị B|1/2/2003|khác|Hà Nội|15062021")
+    assert 'Ngày sinh' not in fields
+    assert 'Giới tính' not in fields
+    assert fields['Ngày cấp'] == '15/06/2021'
+
+
+def test_parse_cccd_qr_rejects_other_payloads():
+    assert parse_cccd_qr("https://example.com") is None
+    assert parse_cccd_qr("12345|a|b|c|d|e|f") is None
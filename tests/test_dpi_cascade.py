@@ -0,0 +1,75 @@
+from PIL import Image
+
+from utils import dpi_cascade
+
+
+def make_words(lines):
+    """Word boxes giả: lines là danh sách (top, [(left, text, conf), ...]), mỗi từ cao 20 pixel"""
+    words = {column: [] for column in ('page_num', 'block_num', 'par_num', 'line_num', 'left', 'top',
+                                        'width', 'height', 'conf', 'text')}
+    for line_num, (top, line) in enumerate(lines, start=1):
+        for left, text, conf in line:
+            for column, value in (('page_num', 1), ('block_num', 1), ('par_num', 1), ('line_num', line_num),
+                                  ('left', left), ('top', top), ('width', 80), ('height', 20),
+                                  ('conf', conf), ('text', text)):
+                words[column].append(value)
+    return words
+
+
+PAGE = make_words([
+    (100, [(100, 'HÓA', 95), (200, 'ĐƠN', 93)]),
+    (300, [(100, 'Tổng', 40), (200, '1.2OO', 30)]),
+    (500, [(100, 'Ký', 90)]),
+])
+SIZE = (1000, 1000)
+
+
+def test_finds_only_low_confidence_lines():
+    regions = dpi_cascade.find_low_confidence_regions(PAGE, SIZE)
+    assert regions == [(0.09, 0.29, 0.29, 0.33)]
+    assert dpi_cascade.find_low_confidence_regions(make_words([(100, [(100, 'HÓA', 95)])]), SIZE) == []
+
+
+def test_rerenders_whole_page_when_most_lines_are_bad():
+    lines = [(100 * i, [(100, f"x{i}", 10)]) for i in range(1, dpi_cascade.MAX_REGIONS + 2)]
+    assert dpi_cascade.find_low_confidence_regions(make_words(lines), SIZE) is None
+
+
+def test_merge_replaces_words_inside_region():
+    regions = dpi_cascade.find_low_confidence_regions(PAGE, SIZE)
+    # OCR lại vùng ở DPI gấp đôi: tọa độ trong ảnh vùng
+    region_words = [make_words([(20, [(20, 'Tổng', 96), (220, '1.200', 97)])])]
+    merged = dpi_cascade.merge_region_words(PAGE, SIZE, regions, region_words, scale=0.5)
+    assert merged['text'] == ['HÓA', 'ĐƠN', 'Tổng', '1.200', 'Ký']
+    assert merged['left'][3] == 90 + 110 and merged['top'][3] == 290 + 10 and merged['width'][3] == 40
+
+
+class FakeRenderer:
+    def __init__(self):
+        self.calls = []
+
+    def render_page(self, page_index, dpi=200):
+        self.calls.append(('page', dpi))
+        return Image.new('L', (dpi * 5, dpi * 5), 255)
+
+    def render_region(self, page_index, bbox, dpi=200):
+        self.calls.append(('region', dpi))
+        return Image.new('L', (10, 10), 255)
+
+
+def test_cascade_page_rerenders_only_regions():
+    renderer = FakeRenderer()
+    fixed = make_words([(20, [(20, 'Tổng', 96), (220, '1.200', 97)])])
+    words, stats = dpi_cascade.cascade_page(renderer, 0, words=PAGE, image_size=SIZE,
+                                            map_func=lambda images: [fixed] * len(images))
+    assert renderer.calls == [('region', dpi_cascade.HIGH_DPI)]
+    assert stats['rerenders'] == 1 and not stats['full_page_rerender']
+    assert '1.200' in words['text']
+
+
+def test_cascade_page_keeps_clean_low_dpi_page():
+    renderer = FakeRenderer()
+    clean = make_words([(100, [(100, 'HÓA', 95)])])
+    words, stats = dpi_cascade.cascade_page(renderer, 0, map_func=lambda images: [clean] * len(images))
+    assert renderer.calls == [('page', dpi_cascade.LOW_DPI)]
+    assert words is clean and stats['rerenders'] == 0 and stats['dpi'] == dpi_cascade.LOW_DPI
@@ -0,0 +1,38 @@
+from utils.duplicate_index import DuplicateIndex
+from utils.image_hash import from_hex, to_hex
+
+
+def signature(value, detail=0):
+    return to_hex(value, 64), to_hex(detail, 256)
+
+
+def flip(hex_value, bits):
+    """Đảo bits bit thấp của một hash hex"""
+    return to_hex(from_hex(hex_value) ^ ((1 << bits) - 1), 64)
+
+
+def test_find_tolerates_small_distance(tmp_path):
+    index = DuplicateIndex(str(tmp_path / 'index.sqlite'))
+    page = signature(0x0123456789ABCDEF)
+    index.add('HD_MV', [page], {'SỐ HĐ': '1'}, 'a.pdf')
+
+    match = index.find('HD_MV', (flip(page[0], 3), page[1]))
+    assert match['record'] == {'SỐ HĐ': '1'}
+    assert match['distance'] == 3
+    assert index.find('HD_MV', (flip(page[0], 20), page[1])) is None
+    assert index.find('HD_BR', page) is None
+
+
+def test_find_document_requires_most_pages(tmp_path):
+    index = DuplicateIndex(str(tmp_path / 'index.sqlite'))
+    old_page = signature(0x0123456789ABCDEF)
+    index.add('HD_MV', [old_page], {'SỐ HĐ': '1'}, 'a.pdf')
+
+    # Tài liệu mới nhiều trang chỉ chứa một trang cũ: không phải bản trùng
+    new_pages = [old_page, signature(0xFEDCBA9876543210), signature(0x00FF00FF00FF00FF)]
+    assert index.find_document('HD_MV', new_pages) is None
+    # Tìm kiếm không ghi gì vào chỉ mục
+    assert index.count('HD_MV') == 1
+
+    duplicate = index.find_document('HD_MV', [old_page])
+    assert duplicate['matched'] == 1 and duplicate['pages'] == 1
@@ -0,0 +1,116 @@
+import io
+import zipfile
+
+from utils.einvoice_xml import iter_einvoice_zip, parse_einvoice_xml, to_invoice_items, to_invoice_record
+
+INVOICE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<HDon>
+  <DLHDon>
+    <TTChung>
+      <KHMSHDon>1</KHMSHDon>
+      <KHHDon>C26TAA</KHHDon>
+      <SHDon>788</SHDon>
+      <NLap>2026-01-15</NLap>
+      <DVTTe>VND</DVTTe>
+    </TTChung>
+    <NDHDon>
+      <NBan><Ten>Công ty TNHH ABC</Ten><MST>0101234567</MST></NBan>
+      <NMua><HVTNMHang>Nguyễn Văn An</HVTNMHang></NMua>
+      <DSHHDVu>
+        <HHDVu>
+          <STT>1</STT><THHDVu>Giấy A4</THHDVu><DVTinh>Ram</DVTinh>
+          <SLuong>2.500</SLuong><DGia>80000.00</DGia><ThTien>200000.00</ThTien>
+        </HHDVu>
+        <HHDVu>
+          <THHDVu>Mực in</THHDVu><SLuong>1</SLuong><DGia>150000</DGia><ThTien>150000</ThTien>
+        </HHDVu>
+      </DSHHDVu>
+      <TToan>{totals}</TToan>
+    </NDHDon>
+  </DLHDon>
+  <DSCKS><NBan><Signature>abc</Signature></NBan></DSCKS>
+</HDon>
+"""
+
+
+def _invoice(totals='<TgTCThue>350000</TgTCThue><TgTThue>28000</TgTThue><TgTTTBSo>378000.00</TgTTTBSo>'):
+    return parse_einvoice_xml(io.BytesIO(INVOICE_XML.format(totals=totals).encode('utf-8')))
+
+
+def test_parse_einvoice_xml_reads_header_and_parties():
+    invoice = _invoice()
+    assert (invoice['series'], invoice['number'], invoice['date']) == ('C26TAA', '788', '2026-01-15')
+    # Thẻ NBan trong chữ ký số không ghi đè người bán
+    assert invoice['seller'] == {'Ten': 'Công ty TNHH ABC', 'MST': '0101234567'}
+    assert len(invoice['items']) == 2
+
+
+def test_to_invoice_record_maps_columns():
+    invoice = _invoice()
+    assert to_invoice_record(invoice, 'ĐƠN VỊ XUẤT') == {
+        'SỐ HĐ': '00000788',
+        'NGÀY': '15/01/2026',
+        'NỘI DUNG': '1. Giấy A4\n2. Mực in',
+        'ĐƠN VỊ XUẤT': 'Công ty TNHH ABC',
+        'GIÁ TRỊ SAU THUẾ': '378000',
+    }
+    # Người mua cá nhân: lấy họ tên người mua hàng
+    assert to_invoice_record(invoice, 'ĐƠN VỊ NHẬN')['ĐƠN VỊ NHẬN'] == 'Nguyễn Văn An'
+
+
+def test_to_invoice_record_sums_totals_without_grand_total():
+    invoice = _invoice(totals='<TgTCThue>350000</TgTCThue><TgTThue>28000</TgTThue>')
+    assert to_invoice_record(invoice, 'ĐƠN VỊ XUẤT')['GIÁ TRỊ SAU THUẾ'] == '378000'
+
+
+def test_to_invoice_items():
+    assert to_invoice_items(_invoice()) == [
+        {'stt': '1', 'name': 'Giấy A4', 'unit': 'Ram', 'quantity': '2.5', 'unit_price': '80000',
+         'amount': '200000'},
+        {'stt': '2', 'name': 'Mực in', 'unit': '', 'quantity': '1', 'unit_price': '150000', 'amount': '150000'},
+    ]
+
+
+def test_iter_einvoice_zip_reports_broken_files():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('hd/0001.xml', INVOICE_XML.format(totals=''))
+        zf.writestr('hd/hong.xml', '<HDon><TTChung>')
+        zf.writestr('hd/ghi_chu.txt', 'bỏ qua')
+    buf.seek(0)
+    results = list(iter_einvoice_zip(buf))
+    assert [name for name, _, _ in results] == ['hd/0001.xml', 'hd/hong.xml']
+    assert results[0][1]['number'] == '788' and results[0][2] is None
+    assert results[1][1] is None and results[1][2]
+
+
+def test_iter_einvoice_zip_reports_corrupt_members_and_continues():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('0001.xml', INVOICE_XML.format(totals=''))
+        zf.writestr('0002.xml', INVOICE_XML.format(totals=''))
+        zf.writestr('0003.xml', INVOICE_XML.format(totals=''))
+    data = bytearray(buf.getvalue())
+    # Làm hỏng dữ liệu nén của file thứ hai (CRC sai hoặc luồng deflate lỗi)
+    with zipfile.ZipFile(io.BytesIO(bytes(data))) as zf:
+        info = zf.getinfo('0002.xml')
+    start = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+    for offset in range(start + 5, start + 25):
+        data[offset] ^= 0xFF
+    results = list(iter_einvoice_zip(io.BytesIO(bytes(data))))
+    assert [name for name, _, _ in results] == ['0001.xml', '0002.xml', '0003.xml']
+    assert results[0][2] is None and results[2][2] is None
+    assert results[1][1] is None and results[1][2]
+
+
+def test_iter_einvoice_zip_reports_encrypted_members():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('0001.xml', INVOICE_XML.format(totals=''))
+    data = bytearray(buf.getvalue())
+    # Bật cờ mã hóa (bit 0) ở local header và central directory
+    data[6] |= 1
+    central = data.rfind(b'PK\x01\x02')
+    data[central + 8] |= 1
+    results = list(iter_einvoice_zip(io.BytesIO(bytes(data))))
+    assert len(results) == 1 and results[0][1] is None and results[0][2]
@@ -0,0 +1,35 @@
+import numpy as np
+from PIL import Image
+
+from utils.image_quality import DPI_ERROR, DPI_WARN, assess
+
+
+def _page(width, height):
+    """Ảnh nét (nhiễu tương phản cao), không lóa, kích thước width x height"""
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 200, size=(height, width), dtype=np.uint8))
+
+
+def _a4(dpi):
+    return round(210 / 25.4 * dpi), round(297 / 25.4 * dpi)
+
+
+def test_a4_dpi_uses_long_side_against_297mm():
+    width, height = _a4(DPI_ERROR - 2)
+    for image in (_page(width, height), _page(height, width)):
+        report = assess(image, 'a4')
+        assert report['dpi'] < DPI_ERROR
+        assert not report['ok']
+
+
+def test_a4_at_warn_dpi_passes():
+    report = assess(_page(*_a4(DPI_WARN + 2)), 'a4')
+    assert DPI_WARN <= report['dpi'] <= DPI_WARN + 2
+    assert report['ok']
+    assert report['issues'] == []
+
+
+def test_blurred_page_is_rejected():
+    report = assess(Image.new('L', _a4(200), 128), 'a4')
+    assert report['blur'] == 0.0
+    assert not report['ok']
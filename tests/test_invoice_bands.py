@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from utils import invoice_bands
+from utils.invoice_bands import find_cut, ocr_bands
+
+
+def _page():
+    """Trang 1000 pixel, dòng chữ (khối đen) cao 20 pixel cách nhau 40 pixel"""
+    page = Image.new('L', (600, 1000), 255)
+    draw = ImageDraw.Draw(page)
+    for top in range(10, 1000, 40):
+        draw.rectangle((50, top, 550, top + 19), fill=0)
+    return page
+
+
+def test_find_cut_lands_on_blank_row():
+    gray = np.asarray(_page())
+    for target in (0.4, 0.7):
+        cut = find_cut(gray, target)
+        assert (gray[cut] == 255).all()
+        assert abs(cut - target * 1000) <= 20
+
+
+def _fake_ocr(calls):
+    lock = threading.Lock()
+
+    def image_to_data(image, lang, engine=None, profile=None):
+        with lock:
+            calls.append(image.height)
+        # Một từ ở đầu mỗi dải: tọa độ theo ảnh của dải
+        return {'page_num': [1], 'block_num': [1], 'par_num': [1], 'line_num': [1], 'left': [50], 'top': [5],
+                'width': [100], 'height': [20], 'conf': [95], 'text': [f"h{image.height}"]}
+
+    return image_to_data
+
+
+def test_stops_after_header_and_footer_when_complete(monkeypatch):
+    calls = []
+    monkeypatch.setattr(invoice_bands.ocr, 'image_to_data', _fake_ocr(calls))
+    text, words, stage = ocr_bands(_page(), lambda text, words: True)
+    assert stage == 'header_footer' and len(calls) == 2
+    header_end = find_cut(np.asarray(_page()), invoice_bands.HEADER_END)
+    footer_start = find_cut(np.asarray(_page()), invoice_bands.FOOTER_START)
+    assert sorted(calls) == sorted([header_end, 1000 - footer_start])
+    # Tọa độ đưa về hệ tọa độ trang
+    assert words['top'] == [5, footer_start + 5] and words['block_num'] == [1, 2001]
+
+
+def test_reads_middle_band_when_incomplete(monkeypatch):
+    calls = []
+    monkeypatch.setattr(invoice_bands.ocr, 'image_to_data', _fake_ocr(calls))
+    text, words, stage = ocr_bands(_page(), lambda text, words: False)
+    assert stage == 'full' and len(calls) == 3
+    # Ba dải ghép lại đúng bằng cả trang, theo thứ tự đọc
+    assert sum(calls) == 1000
+    assert words['block_num'] == [1, 1001, 2001] and words['top'] == sorted(words['top'])
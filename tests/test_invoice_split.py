@@ -0,0 +1,45 @@
+from utils.invoice_split import group_pages, page_signals
+
+
+def words(*lines):
+    """Word boxes kiểu image_to_data, mỗi dòng một hàng"""
+    columns = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+    data = {column: [] for column in columns}
+    for line_num, line in enumerate(lines, start=1):
+        for word_num, text in enumerate(line.split(), start=1):
+            values = (5, 1, 1, 1, line_num, word_num, 10 + word_num * 80, line_num * 30, 70, 20, 95, text)
+            for column, value in zip(columns, values):
+                data[column].append(value)
+    return data
+
+
+def signal(number='', marker=None, title=False):
+    return {'number': number, 'marker': marker, 'title': title}
+
+
+def test_page_signals():
+    page = words('HÓA ĐƠN GIÁ TRỊ GIA TĂNG', 'Số (No.): 0000123', 'Trang 1/2')
+    assert page_signals(page) == {'number': '0000123', 'marker': [1, 2], 'title': True}
+    assert page_signals(words('Page 2 of 3'))['marker'] == [2, 3]
+    assert page_signals({}) == {'number': '', 'marker': None, 'title': False}
+
+
+def test_group_pages_by_marker_and_number():
+    signals = [
+        signal('0000123', [1, 2], True),
+        signal(marker=[2, 2]),
+        signal('0000124', title=True),
+        signal('0000124'),
+        signal('0000125'),
+        signal(),
+        signal(title=True),
+    ]
+    assert [invoice['pages'] for invoice in group_pages(signals)] == [[0, 1], [2, 3], [4, 5], [6]]
+    assert [invoice['number'] for invoice in group_pages(signals)] == ['0000123', '0000124', '0000125', '']
+
+
+def test_group_pages_keeps_continuation_pages():
+    # Trang 2/3 và 3/3 không có số hóa đơn: vẫn thuộc hóa đơn đang xét dù có tiêu đề lặp lại
+    signals = [signal('1', [1, 3]), signal(title=True), signal(title=True), signal('2', title=True)]
+    assert [invoice['pages'] for invoice in group_pages(signals)] == [[0, 1, 2], [3]]
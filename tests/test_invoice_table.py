@@ -0,0 +1,18 @@
+import pytest
+
+from utils.invoice_table import to_number
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1.100.000', '1100000'),
+    ('1,100,000', '1100000'),
+    ('1.100.000,50', '1100000.5'),
+    ('23000.00', '23000'),
+    ('2,5', '2.5'),
+    ('1.234', '1234'),
+    ('12 đ', '12'),
+    ('', ''),
+    ('abc', ''),
+])
+def test_to_number(text, expected):
+    assert to_number(text) == expected
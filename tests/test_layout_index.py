@@ -0,0 +1,68 @@
+from utils.invoice_layout import parse_invoice_words
+from utils.layout_index import LayoutIndex, normalize
+
+
+def make_words(lines):
+    """Word boxes giả: lines là danh sách (top, [(left, text), ...]), mỗi dòng một khối,
+    chữ rộng 12 pixel, cao 20 pixel"""
+    words = {column: [] for column in ('page_num', 'block_num', 'par_num', 'line_num', 'left', 'top',
+                                        'width', 'height', 'conf', 'text')}
+    for block, (top, line) in enumerate(lines, start=1):
+        for left, text in line:
+            for column, value in (('page_num', 1), ('block_num', block), ('par_num', 1), ('line_num', 1),
+                                  ('left', left), ('top', top), ('width', 12 * len(text)), ('height', 20),
+                                  ('conf', 95), ('text', text)):
+                words[column].append(value)
+    return words
+
+
+# Hai cột: Tesseract đọc thành hai khối, regex trên text phẳng dễ lấy nhầm giá trị
+INVOICE = make_words([
+    (50, [(100, 'HÓA'), (150, 'ĐƠN'), (200, 'GIÁ'), (250, 'TRỊ'), (300, 'GIA'), (350, 'TĂNG')]),
+    (100, [(100, 'Ngày'), (160, '(Date)'), (240, '17'), (270, 'tháng'), (340, '(month)'), (430, '01'),
+           (460, 'năm'), (510, '(year)'), (590, '2026')]),
+    (100, [(800, 'Số'), (830, '(No.):'), (920, '0001234')]),
+    (150, [(100, 'Đơn'), (140, 'vị'), (170, 'bán'), (220, 'hàng:'), (300, 'Công'), (360, 'ty'),
+           (390, 'TNHH'), (450, 'ABC')]),
+    (400, [(100, 'Tổng'), (160, 'cộng'), (220, 'tiền'), (280, 'thanh'), (350, 'toán:'), (700, '1.100.000')]),
+])
+
+
+def test_normalize_strips_accents():
+    assert normalize('Đơn vị bán hàng (Seller):') == ['don', 'vi', 'ban', 'hang', 'seller']
+
+
+def test_find_and_read_values_by_position():
+    index = LayoutIndex(INVOICE)
+    labels = index.find('đơn vị bán hàng')
+    assert len(labels) == 1 and labels[0].top == 150
+    assert index.right_of(labels[0]) == 'Công ty TNHH ABC'
+    assert index.value('Đơn vị bán hàng') == 'Công ty TNHH ABC'
+    assert index.value('Tổng cộng tiền thanh toán', r'([\d.]+)') == '1.100.000'
+    assert index.value('Không có nhãn') == ''
+
+
+def test_below_reads_next_row_under_label():
+    index = LayoutIndex(make_words([(100, [(100, 'Người'), (170, 'mua')]),
+                                    (140, [(90, 'Nguyễn'), (180, 'Văn'), (230, 'An')]),
+                                    (180, [(90, 'Dòng'), (150, 'sau')])]))
+    assert index.value('Người mua', direction='below') == 'Nguyễn Văn An'
+    assert index.value('Người mua', direction='below', lines=2) == 'Nguyễn Văn An\nDòng sau'
+
+
+def test_min_conf_skips_unreliable_values():
+    words = make_words([(100, [(100, 'Số'), (130, 'HĐ'), (180, '0001234')])])
+    words['conf'][2] = 30
+    index = LayoutIndex(words)
+    assert index.value('Số HĐ') == '0001234'
+    assert index.value('Số HĐ', min_conf=60) == ''
+
+
+def test_locate_ignores_separators():
+    label = LayoutIndex(INVOICE).locate('1100000')
+    assert (label.left, label.top) == (700, 400)
+
+
+def test_parse_invoice_words():
+    assert parse_invoice_words(INVOICE) == {'number': '0001234', 'date': '17/01/2026',
+                                            'party': 'Công ty TNHH ABC', 'total': '1100000'}
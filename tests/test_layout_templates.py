@@ -0,0 +1,90 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from utils import layout_templates
+from utils.image_hash import dhash, from_hex, hamming, phash, to_hex
+from utils.layout_templates import TemplateStore, apply_template, page_layout
+
+
+def _page(seed=0):
+    """Trang A4 giả ở 100 dpi: logo đen ở đầu trang và vài dòng kẻ"""
+    page = Image.new('RGB', (827, 1169), 'white')
+    draw = ImageDraw.Draw(page)
+    draw.rectangle((60, 60, 400, 200), fill='black')
+    for i in range(5):
+        draw.rectangle((450, 60 + 30 * i, 780 - 40 * ((i + seed) % 3), 75 + 30 * i), fill=(90, 90, 90))
+    return page
+
+
+def _jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=60)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def _other_page():
+    """Đầu trang của nhà cung cấp khác: logo bên phải, các dòng bên trái"""
+    page = Image.new('RGB', (827, 1169), 'white')
+    draw = ImageDraw.Draw(page)
+    draw.rectangle((430, 60, 780, 200), fill='black')
+    for i in range(5):
+        draw.rectangle((40, 60 + 30 * i, 380, 75 + 30 * i), fill=(90, 90, 90))
+    return page
+
+
+def test_hashes_tolerate_resize_and_compression():
+    page = _page()
+    for hash_func in (dhash, phash):
+        original = hash_func(page, 16)
+        near = hamming(original, hash_func(_jpeg(page.resize((600, 848))), 16))
+        assert near <= 3 and hamming(original, hash_func(_other_page(), 16)) > near
+    assert hamming(phash(page, 16), phash(_other_page(), 16)) > 40
+    assert from_hex(to_hex(0x0f0, 16)) == 0x0f0 and to_hex(0x0f0, 16) == '00f0'
+
+
+WORDS = {
+    'page_num': [1] * 6, 'block_num': [1, 1, 1, 2, 2, 3], 'par_num': [1] * 6, 'line_num': [1] * 6,
+    'left': [450, 520, 600, 450, 520, 600], 'top': [300, 300, 300, 400, 400, 900],
+    'width': [60, 70, 60, 60, 100, 120], 'height': [20] * 6, 'conf': [95] * 6,
+    'text': ['Công', 'ty', 'ABC', 'Số:', '0001234', '1.100.000'],
+}
+
+
+def test_learn_and_apply_template(monkeypatch, tmp_path):
+    store = TemplateStore(str(tmp_path / 'templates.json'))
+    template = store.learn('HD_MV', page_layout(_page(), WORDS),
+                           {'party': 'Công ty ABC', 'number': '0001234', 'total': '1100000'}, anchor='party')
+    assert set(template['regions']) == {'party', 'number', 'total'}
+    left, top, right, bottom = template['regions']['party']
+    assert left < 450 / 827 < 660 / 827 < right and top < 300 / 1169 < bottom
+
+    read = []
+
+    def fake_ocr(image, lang, config, engine=None, profile=None):
+        read.append(image.size)
+        return 'Cong ty ABC' if image.width > 200 else '0001234'
+
+    monkeypatch.setattr(layout_templates.ocr, 'image_to_string', fake_ocr)
+    # Hóa đơn sau của cùng nhà cung cấp: đầu trang gần giống, nội dung khác
+    found, texts = apply_template(store, 'HD_MV', _page(seed=1))
+    assert found['id'] == template['id'] and texts['party'] == 'Cong ty ABC'
+    assert len(read) == 3
+    assert apply_template(store, 'HD_BR', _page(seed=1)) == (None, None)
+
+    # Kho đọc lại từ file
+    assert TemplateStore(store.path).stats('HD_MV')[0]['id'] == template['id']
+
+
+def test_anchor_mismatch_is_recorded_as_miss(monkeypatch, tmp_path):
+    store = TemplateStore(str(tmp_path / 'templates.json'))
+    store.learn('HD_MV', page_layout(_page(), WORDS), {'party': 'Công ty ABC'}, anchor='party')
+    monkeypatch.setattr(layout_templates.ocr, 'image_to_string', lambda image, **kwargs: 'Tong cong')
+    assert apply_template(store, 'HD_MV', _page()) == (None, None)
+    assert store.stats()[0]['misses'] == 1 and store.stats()[0]['hit_rate'] == 0.0
+
+
+def test_learn_without_anchor_position(tmp_path):
+    store = TemplateStore(str(tmp_path / 'templates.json'))
+    assert store.learn('HD_MV', page_layout(_page(), WORDS), {'party': 'Không có trên trang'}, 'party') is None
+    assert store.stats() == []
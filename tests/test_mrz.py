@@ -0,0 +1,51 @@
+from utils.mrz import check_digit, find_td1_lines, parse_td1
+
+
+def _td1(id_number='079201001234', birth='010203', sex='M', expiry='270203', name='NGUYEN<<VAN<AN'):
+    """Ba dòng MRZ TD1 của CCCD với các chữ số kiểm tra đúng"""
+    document_number = id_number[-9:]
+    optional1 = (id_number + '<' * 15)[:15]
+    line1 = f"IDVNM{document_number}{check_digit(document_number)}{optional1}"
+    line2 = f"{birth}{check_digit(birth)}{sex}{expiry}{check_digit(expiry)}VNM{'<' * 11}"
+    composite = line1[5:30] + line2[0:7] + line2[8:15] + line2[18:29]
+    line2 += check_digit(composite)
+    return [line1, line2, (name + '<' * 30)[:30]]
+
+
+def test_check_digit_icao_example():
+    # Ví dụ TD1 trong ICAO 9303 phần 5
+    assert check_digit('D23145890') == '7'
+    assert check_digit('740812') == '2'
+    assert check_digit('120415') == '9'
+
+
+def test_parse_td1_valid_cccd():
+    result = parse_td1(_td1())
+    assert result['valid']
+    assert result['id_number'] == '079201001234'
+    assert result['document_number'] == '201001234'
+    assert result['birth_date'] == '03/02/2001'
+    assert result['expiry_date'] == '03/02/2027'
+    assert result['sex'] == 'Nam'
+    assert result['name'] == 'NGUYEN VAN AN'
+
+
+def test_parse_td1_corrects_letters_in_digit_fields():
+    lines = _td1()
+    lines[1] = lines[1][:2] + 'O' + lines[1][3:]
+    assert parse_td1(lines)['valid']
+
+
+def test_parse_td1_detects_wrong_digit():
+    lines = _td1()
+    lines[1] = lines[1][:3] + '9' + lines[1][4:]
+    result = parse_td1(lines)
+    assert not result['checks']['birth_date']
+    assert not result['valid']
+
+
+def test_find_td1_lines_in_ocr_text():
+    lines = _td1()
+    text = "CỤC CẢNH SÁT\n" + '\n'.join(' '.join([line[:10], line[10:]]) for line in lines) + "\n"
+    assert find_td1_lines(text) == lines
+    assert find_td1_lines("không có mrz") is None
@@ -0,0 +1,47 @@
+import os
+
+from PIL import Image
+
+from utils.ocr_cache import OCRCache, image_fingerprint, make_key
+
+
+def test_make_key_depends_on_content_and_settings():
+    key = make_key(b'pdf', kind='words', lang='vie', dpi=200)
+    # Thứ tự tham số không ảnh hưởng
+    assert key == make_key(b'pdf', dpi=200, lang='vie', kind='words')
+    assert key != make_key(b'pdf', kind='words', lang='vie', dpi=300)
+    assert key != make_key(b'pdf2', kind='words', lang='vie', dpi=200)
+
+
+def test_image_fingerprint_uses_pixels_mode_and_size():
+    image = Image.new('L', (20, 10), 255)
+    assert image_fingerprint(image) == image_fingerprint(image.copy())
+    assert image_fingerprint(image) != image_fingerprint(image.convert('RGB'))
+    assert image_fingerprint(image) != image_fingerprint(Image.new('L', (10, 20), 255))
+
+
+def test_round_trip(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    assert cache.get_text('ab' * 32) is None
+    cache.put_text('ab' * 32, 'Hóa đơn')
+    cache.put_words('cd' * 32, {'text': ['Số', '788'], 'conf': [96, 91]})
+    page = Image.new('RGB', (30, 20), (10, 20, 30))
+    cache.put_pages('ef' * 32, [page, page])
+    assert cache.get_text('ab' * 32) == 'Hóa đơn'
+    assert cache.get_words('cd' * 32) == {'text': ['Số', '788'], 'conf': [96, 91]}
+    pages = cache.get_pages('ef' * 32)
+    assert len(pages) == 2 and pages[1].tobytes() == page.tobytes()
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = OCRCache(str(tmp_path), max_bytes=250)
+    keys = {name: name * 64 for name in 'abc'}
+    cache.put_text(keys['a'], 'x' * 100)
+    cache.put_text(keys['b'], 'x' * 100)
+    # a cũ hơn b, nhưng được đọc lại nên trở thành mục dùng gần nhất
+    os.utime(cache._entry_dir(keys['a']), (1000, 1000))
+    os.utime(cache._entry_dir(keys['b']), (2000, 2000))
+    assert cache.get_text(keys['a'])
+    cache.put_text(keys['c'], 'x' * 100)
+    assert cache.get_text(keys['b']) is None
+    assert cache.get_text(keys['a']) and cache.get_text(keys['c'])
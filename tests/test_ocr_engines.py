@@ -0,0 +1,29 @@
+from PIL import Image
+
+from utils.ocr_engines import FLIP_BAND, OCREngine
+
+
+class FakeEngine(OCREngine):
+    """Engine giả: đọc tốt khi pixel góc trên trái đen (ảnh "đứng thẳng")"""
+
+    def __init__(self):
+        self.sizes = []
+
+    def image_to_data(self, image, lang, config=''):
+        self.sizes.append(image.size)
+        conf = 90 if image.getpixel((0, 0)) == 0 else 30
+        return {'conf': [conf], 'text': ['chu']}
+
+
+def _page(upright):
+    page = Image.new('L', (400, 800), 255)
+    corner = (0, 300) if upright else (399, 499)
+    page.putpixel(corner, 0)
+    return page
+
+
+def test_is_upside_down_reads_only_a_middle_band():
+    engine = FakeEngine()
+    assert engine.is_upside_down(_page(upright=False))
+    assert not engine.is_upside_down(_page(upright=True))
+    assert all(size == (400, int(800 * FLIP_BAND)) for size in engine.sizes)
@@ -0,0 +1,48 @@
+import os
+
+from utils import ocr_profiles
+from utils.ocr_profiles import DEFAULT_LANG, ProfileStats, apply, format_stats, profile_for, resolve
+
+
+def test_profile_for_reads_environment(monkeypatch):
+    monkeypatch.setenv('OCR_PROFILE_PURCHASE_INVOICE', 'fast')
+    monkeypatch.setenv('OCR_PROFILE_CONTRACT', 'khong_co')
+    assert profile_for('purchase_invoice') == 'fast'
+    assert profile_for('contract') == ocr_profiles.DEFAULT_PROFILE
+    assert profile_for('cccd') == ocr_profiles.DEFAULT_PROFILE
+
+
+def test_resolve_adds_tessdata_and_patterns(monkeypatch):
+    monkeypatch.setitem(ocr_profiles.TESSDATA_DIRS, 'best', '/opt/tessdata best')
+    profile = resolve('accurate', 'purchase_invoice')
+    patterns = os.path.join(ocr_profiles.PATTERNS_DIR, 'invoice.patterns')
+    assert profile['name'] == 'accurate' and profile['lang'] == 'vie+eng'
+    assert profile['options'].startswith("--tessdata-dir '/opt/tessdata best'")
+    assert ('--user-patterns' in profile['options']) == os.path.exists(patterns)
+    assert resolve('khong_co') == resolve('balanced') == {'name': 'balanced', 'lang': None, 'psm': None,
+                                                         'options': ''}
+
+
+def test_apply_keeps_explicit_call_settings(monkeypatch):
+    monkeypatch.setitem(ocr_profiles.TESSDATA_DIRS, 'fast', '/td')
+    fast = resolve('fast')
+    assert apply(None, DEFAULT_LANG, '--psm 4') == (DEFAULT_LANG, '--psm 4')
+    assert apply(fast, DEFAULT_LANG, '') == ('vie', '--tessdata-dir /td --psm 6')
+    # Ô số đã chọn lang 'eng' và psm riêng: hồ sơ không thay
+    assert apply(fast, 'eng', '--psm 7 -c tessedit_char_whitelist=0123456789') == (
+        'eng', '--tessdata-dir /td --psm 7 -c tessedit_char_whitelist=0123456789')
+
+
+def test_profile_stats_since_and_merge():
+    stats = ProfileStats()
+    stats.record('fast', 0.5)
+    before = stats.snapshot()
+    stats.record('fast', 1.5)
+    stats.record('accurate', 3.0)
+    delta = stats.since(before)
+    assert delta == {'fast': (1, 1.5), 'accurate': (1, 3.0)}
+    merged = ProfileStats()
+    merged.merge(delta)
+    merged.merge(delta)
+    assert merged.snapshot() == {'fast': (2, 3.0), 'accurate': (2, 6.0)}
+    assert format_stats(merged.snapshot()) == "Hồ sơ OCR: accurate 3.00s/lần (2 lần) · fast 1.50s/lần (2 lần)"
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from utils.ocr_scheduler import OCRScheduler
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_jobs_are_served_first_come_first_served():
+    scheduler = OCRScheduler(slots=1)
+    scheduler.acquire()
+    order = []
+
+    def job(number):
+        with scheduler.slot():
+            order.append(number)
+
+    threads = []
+    for number in range(6):
+        thread = threading.Thread(target=job, args=(number,))
+        thread.start()
+        threads.append(thread)
+        # Job sau chỉ đến khi job trước đã xếp hàng
+        _wait_until(lambda: scheduler.stats()['queued'] == number + 1)
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+    assert order == list(range(6))
+
+
+def test_running_jobs_never_exceed_slots():
+    scheduler = OCRScheduler(slots=2)
+    lock = threading.Lock()
+    running = [0, 0]  # hiện tại, lớn nhất
+
+    def job():
+        with scheduler.slot():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.005)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=job) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert running[1] <= 2
+    stats = scheduler.stats()
+    assert stats['jobs'] == 12 and stats['running'] == 0 and stats['queued'] == 0
@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from utils import pdf_pipeline
+
+
+class FakeRenderer:
+    """Renderer giả: trang chẵn có lớp text, trang lẻ là trang scan"""
+
+    def __init__(self, page_count):
+        self._page_count = page_count
+        self.rendered = []
+
+    def page_count(self):
+        return self._page_count
+
+    def extract_words(self, page_index, dpi=200):
+        if page_index % 2:
+            return None
+        return {'text': ['HÓA', 'ĐƠN', 'trang', str(page_index)] * 10, 'conf': [96] * 40}
+
+    def render_page(self, page_index, dpi=200):
+        self.rendered.append((page_index, dpi))
+        return Image.new('L', (10, 10), page_index)
+
+
+def test_ocr_pages_keeps_at_most_ocr_workers_pages_in_flight(monkeypatch):
+    lock = threading.Lock()
+    in_flight = [0, 0]  # hiện tại, lớn nhất
+    pool = ThreadPoolExecutor(max_workers=8)
+
+    def fake_ocr(image):
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return {'text': [f"p{image.getpixel((0, 0))}"]}, {}
+
+    def fake_submit(executor, image, lang, engine=None, profile=None):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        return pool.submit(fake_ocr, image)
+
+    monkeypatch.setattr(pdf_pipeline, 'get_executor', lambda: pool)
+    monkeypatch.setattr(pdf_pipeline, '_submit_page', fake_submit)
+    monkeypatch.setattr(pdf_pipeline, '_page_words', lambda future: future.result()[0])
+
+    renderer = FakeRenderer(40)
+    page_indices = list(range(3, 40))
+    page_words, sources, _ = pdf_pipeline._ocr_pages(renderer, 200, 'vie', None, None, 'fixed',
+                                                     page_indices=page_indices)
+    assert in_flight[1] <= pdf_pipeline.OCR_WORKERS
+    assert sources == ['ocr' if page_index % 2 else 'text' for page_index in page_indices]
+    for page_index, words in zip(page_indices, page_words):
+        if page_index % 2:
+            assert words == {'text': [f"p{page_index}"]}
+    # Chỉ trang scan được render
+    assert sorted(index for index, _ in renderer.rendered) == [i for i in page_indices if i % 2]
+
+
+def test_merge_pages_renumbers_page_num():
+    pages = [{'text': ['a', 'b'], 'page_num': [1, 1]}, {}, {'text': ['c'], 'page_num': [1]}]
+    merged = pdf_pipeline.merge_pages(pages)
+    assert merged == {'text': ['a', 'b', 'c'], 'page_num': [1, 1, 3]}
+
+
+def test_preview_dpi_follows_rendered_dpi():
+    scan_first = {'sources': ['ocr', 'text']}
+    text_first = {'sources': ['text', 'ocr']}
+    assert pdf_pipeline._preview_dpi(scan_first, 300, 'adaptive') == pdf_pipeline.dpi_cascade.LOW_DPI
+    assert pdf_pipeline._preview_dpi(scan_first, 300, 'fixed') == 300
+    assert pdf_pipeline._preview_dpi(text_first, 300, 'adaptive') == 300
+    assert pdf_pipeline._preview_dpi({'sources': []}, 300, 'adaptive') == 300
+    assert pdf_pipeline._preview_key(b'pdf', 150) != pdf_pipeline._preview_key(b'pdf', 300)
@@ -0,0 +1,66 @@
+import io
+
+import pytest
+from PIL import Image
+
+from utils import pdf_render
+from utils.pdf_render import get_renderer
+
+needs_pdfium = pytest.mark.skipif(not pdf_render.PDFIUM_AVAILABLE, reason="chưa cài pypdfium2")
+
+
+def make_pdf(page_count=2):
+    """PDF scan giả: mỗi trang là một ảnh 72 dpi (1 pixel = 1 point)"""
+    pages = [Image.new('RGB', (200, 100), (255, 255, 255)) for _ in range(page_count)]
+    pages[0].paste((0, 0, 0), (0, 0, 100, 50))
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:], resolution=72)
+    return buffer.getvalue()
+
+
+@needs_pdfium
+def test_pdfium_renders_pages_at_dpi():
+    with get_renderer(make_pdf(3)) as renderer:
+        assert renderer.name == 'pypdfium2'
+        assert renderer.page_count() == 3
+        image = renderer.render_page(0, dpi=144)
+        assert image.mode == 'RGB'
+        assert image.size == (400, 200)
+
+
+@needs_pdfium
+def test_pdfium_render_region_crops_without_full_page():
+    with get_renderer(make_pdf(1)) as renderer:
+        region = renderer.render_region(0, (0.0, 0.0, 0.5, 0.5), dpi=144)
+        assert region.size == (200, 100)
+        # Góc trên trái của trang là ô đen
+        assert region.convert('L').getpixel((100, 50)) < 50
+
+
+@needs_pdfium
+def test_get_renderer_falls_back_to_pdf2image():
+    assert get_renderer(b'khong phai pdf').name == 'pdf2image'
+    with pytest.raises(Exception):
+        get_renderer(b'khong phai pdf', backend='pypdfium2')
+
+
+def test_chars_to_words_groups_characters_into_lines():
+    text = 'HÓA ĐƠN\nSố 01'
+    # Mỗi ký tự rộng 10 point, dòng 1 ở y 80..90, dòng 2 ở y 60..70 (gốc tọa độ PDF ở dưới)
+    boxes = [(10 * i, 80, 10 * i + 10, 90) for i in range(8)] + [(10 * i, 60, 10 * i + 10, 70) for i in range(5)]
+    words = pdf_render._chars_to_words(text, boxes, page_height=100, scale=2)
+    assert words['text'] == ['HÓA', 'ĐƠN', 'Số', '01']
+    assert words['line_num'] == [1, 1, 2, 2]
+    assert words['word_num'] == [1, 2, 1, 2]
+    assert (words['left'][1], words['top'][1], words['width'][1], words['height'][1]) == (80, 20, 60, 20)
+
+
+@pytest.mark.parametrize('texts, expected', [
+    (None, False),
+    (['HÓA', 'ĐƠN', 'GIÁ', 'TRỊ', 'GIA', 'TĂNG'] * 3, True),
+    (['ngắn'], False),
+    (['\ufffd' * 10, 'HÓA ĐƠN GIÁ TRỊ GIA TĂNG'], False),
+    (['\ue000\ue001\ue002' * 10], False),
+])
+def test_has_text_layer(texts, expected):
+    assert pdf_render.has_text_layer(texts and {'text': texts}) is expected
@@ -0,0 +1,83 @@
+import numpy as np
+from PIL import Image
+
+from utils.preprocess import analyze
+
+
+def _lines_image(size, line_height, gap):
+    """Ảnh trắng có các dải đen nằm ngang giả làm dòng chữ"""
+    width, height = size
+    pixels = np.full((height, width), 255, dtype=np.uint8)
+    for top in range(gap, height - line_height, line_height + gap):
+        pixels[top:top + line_height, width // 10:width * 9 // 10] = 0
+    return Image.fromarray(pixels)
+
+
+def test_analyze_small_text_upscale_is_capped_by_max_side():
+    gray = _lines_image((4000, 3000), line_height=12, gap=24)
+    params = analyze(gray, deskew=False, fix_orientation=False, max_side=3500)
+    assert params['text_height']
+    assert params['scale'] <= 3500 / 4000 + 1e-9
+
+
+def test_analyze_without_text_only_shrinks_to_max_side():
+    gray = Image.new('L', (5000, 1000), 255)
+    params = analyze(gray, deskew=False, fix_orientation=False, max_side=3500)
+    assert params['text_height'] is None
+    assert params['scale'] == 3500 / 5000
+
+
+# Font mặc định của Pillow không có glyph tiếng Việt nên dùng chữ không dấu
+LINES = ["HOA DON GIA TRI GIA TANG", "Don vi ban hang: Cong ty TNHH ABC", "Ma so thue: 0101234567",
+         "Dia chi: 12 Le Loi, Quan 1, TP Ho Chi Minh", "Ten hang hoa, dich vu   Don vi tinh   So luong",
+         "Giay in A4 Double A   ram   10   80.000", "Tong tien thanh toan: 1.234.000"]
+
+
+def _text_page(size=18):
+    from PIL import ImageDraw, ImageFont
+    font = ImageFont.load_default(size=size)
+    page = Image.new('L', (900, 60 + len(LINES) * 2 * size), 255)
+    draw = ImageDraw.Draw(page)
+    for i, line in enumerate(LINES):
+        draw.text((30, 30 + i * 2 * size), line, font=font, fill=0)
+    return page
+
+
+def _ink(image):
+    from utils.preprocess import adaptive_threshold
+    return ~adaptive_threshold(np.asarray(image), window=25, offset=15)
+
+
+def test_guess_upside_down_from_line_shape():
+    from utils.preprocess import guess_upside_down
+    page = _text_page()
+    assert guess_upside_down(_ink(page)) is False
+    assert guess_upside_down(_ink(page.transpose(Image.ROTATE_180))) is True
+    assert guess_upside_down(_ink(Image.new('L', (200, 100), 255))) is None
+
+
+def test_analyze_asks_engine_only_when_line_shape_is_ambiguous(monkeypatch):
+    from utils import preprocess
+    calls = []
+    monkeypatch.setattr(preprocess, 'is_upside_down', lambda gray, engine=None: calls.append(engine) or False)
+    flipped = _text_page().transpose(Image.ROTATE_180)
+    assert analyze(flipped, engine='onnx', deskew=False)['rotation'] == 180
+    assert calls == []
+    analyze(Image.new('L', (400, 300), 255), engine='onnx', deskew=False)
+    assert calls == ['onnx']
+
+
+def test_preprocess_analysis_is_cached(monkeypatch, tmp_path):
+    from utils import preprocess
+    from utils.ocr_cache import OCRCache
+    cache = OCRCache(str(tmp_path))
+    monkeypatch.setattr(preprocess, 'get_cache', lambda: cache)
+    calls = []
+    real_analyze = preprocess.analyze
+    monkeypatch.setattr(preprocess, 'analyze', lambda gray, engine=None, **options:
+                        calls.append(1) or real_analyze(gray, engine, **options))
+    page = _text_page()
+    first = preprocess.preprocess_image(page, fix_orientation=False)
+    second = preprocess.preprocess_image(page, fix_orientation=False)
+    assert len(calls) == 1
+    assert first.tobytes() == second.tobytes()
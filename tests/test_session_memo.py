@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+from utils import session_memo
+from utils.session_memo import session_memo as memo, upload_key
+
+
+@pytest.fixture(autouse=True)
+def session_state(monkeypatch):
+    state = {}
+    monkeypatch.setattr(session_memo.st, 'session_state', state)
+    return state
+
+
+class Upload(io.BytesIO):
+    def __init__(self, data, file_id, name='hoa_don.pdf'):
+        super().__init__(data)
+        self.file_id = file_id
+        self.name = name
+
+
+def test_session_memo_computes_once_per_key():
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert memo('invoice', ('a', 1), compute) == 1
+    assert memo('invoice', ('a', 1), compute) == 1
+    assert memo('invoice', ('b', 1), compute) == 2
+    assert len(calls) == 2
+
+
+def test_upload_key_hashes_each_upload_once(monkeypatch):
+    hashed = []
+    real_hash = session_memo.content_hash
+    monkeypatch.setattr(session_memo, 'content_hash', lambda f: hashed.append(1) or real_hash(f))
+    upload = Upload(b'%PDF-1.4 noi dung', 'id-1')
+    key = upload_key(upload, 'adaptive')
+    assert upload_key(upload, 'adaptive') == key
+    assert len(hashed) == 1
+    assert key[0] == 'id-1' and key[-1] == 'adaptive'
+    # Cùng nội dung upload lại (id khác) vẫn cùng hash
+    assert upload_key(Upload(b'%PDF-1.4 noi dung', 'id-2'))[1] == key[1]
+    assert upload_key(Upload(b'khac', 'id-3'))[1] != key[1]
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from utils import tesseract_engine
+from utils.tesseract_engine import EnginePool, parse_config
+
+
+def test_parse_config():
+    config = "--oem 1 --psm 6 -c preserve_interword_spaces=1 --user-patterns '/tmp/mau so.txt' --tessdata-dir /td"
+    psm, oem, variables, tessdata_dir = parse_config(config)
+    assert (psm, oem, tessdata_dir) == (6, 1, '/td')
+    assert variables == {'preserve_interword_spaces': '1', 'user_patterns_file': '/tmp/mau so.txt'}
+    assert parse_config(None) == (None, None, {}, None)
+
+
+class FakeApi:
+    def __init__(self, lang, config):
+        self.key = (lang, config)
+        self.cleared = 0
+
+    def Clear(self):
+        self.cleared += 1
+
+    def End(self):
+        pass
+
+
+def make_pool(monkeypatch, size):
+    pool = EnginePool(size)
+    created = []
+
+    def create(lang, config):
+        created.append((lang, config))
+        return FakeApi(lang, config)
+
+    monkeypatch.setattr(pool, '_create', create)
+    return pool, created
+
+
+def test_pool_reuses_engines_per_config(monkeypatch):
+    pool, created = make_pool(monkeypatch, size=2)
+    with pool.engine('vie', '--psm 6') as first:
+        pass
+    with pool.engine('vie', '--psm 6') as second:
+        assert second is first and first.cleared == 1
+    with pool.engine('vie+eng', '--psm 6') as other:
+        assert other.key == ('vie+eng', '--psm 6')
+    assert created == [('vie', '--psm 6'), ('vie+eng', '--psm 6')]
+
+
+def test_pool_waits_when_full(monkeypatch):
+    pool, created = make_pool(monkeypatch, size=1)
+    got = []
+
+    def borrow():
+        with pool.engine('vie') as api:
+            got.append(api)
+
+    with pool.engine('vie') as api:
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        thread.join(0.1)
+        # Đã đủ POOL_SIZE: luồng thứ hai phải chờ engine được trả lại
+        assert thread.is_alive() and not got
+    thread.join(1)
+    assert got == [api] and len(created) == 1
+
+
+def test_pool_create_failure_frees_the_slot(monkeypatch):
+    pool = EnginePool(1)
+    calls = []
+
+    def create(lang, config):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("không tìm thấy tessdata")
+        return FakeApi(lang, config)
+
+    monkeypatch.setattr(pool, '_create', create)
+    with pytest.raises(RuntimeError):
+        with pool.engine('vie'):
+            pass
+    with pool.engine('vie') as api:
+        assert api.key == ('vie', '')
+
+
+def test_falls_back_to_pytesseract_after_engine_failure(monkeypatch):
+    monkeypatch.setattr(tesseract_engine, 'TESSEROCR_AVAILABLE', True)
+    monkeypatch.setattr(tesseract_engine, '_engine_failed', False)
+
+    class BrokenPool:
+        def engine(self, lang, config):
+            raise RuntimeError("không tìm thấy tessdata")
+
+    monkeypatch.setattr(tesseract_engine, 'get_pool', lambda: BrokenPool())
+    monkeypatch.setattr(tesseract_engine.pytesseract, 'image_to_string',
+                        lambda image, lang, config: f"pytesseract {lang}")
+    assert tesseract_engine.image_to_string(object(), 'vie') == 'pytesseract vie'
+    assert not tesseract_engine._use_engine()
@@ -0,0 +1,47 @@
+import hashlib
+import io
+
+from PIL import Image
+
+from utils import upload_store
+from utils.upload_store import content_hash, open_image, preview_bytes, spool, upload_preview
+
+
+def _jpeg(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, format='JPEG')
+    buffer.seek(0)
+    return buffer
+
+
+def test_content_hash_reads_in_chunks_and_rewinds(monkeypatch):
+    monkeypatch.setattr(upload_store, 'CHUNK_SIZE', 7)
+    data = b'hoa don ' * 100
+    fileobj = io.BytesIO(data)
+    fileobj.seek(50)
+    assert content_hash(fileobj) == hashlib.sha256(data).hexdigest()
+    assert fileobj.tell() == 0
+
+
+def test_spool_moves_large_copies_to_disk(monkeypatch):
+    monkeypatch.setattr(upload_store, 'SPOOL_MAX_SIZE', 100)
+    small, large = spool(io.BytesIO(b'x' * 50)), spool(io.BytesIO(b'y' * 500))
+    assert small.read() == b'x' * 50 and large.read() == b'y' * 500
+    assert not small._rolled and large._rolled
+
+
+def test_open_image_drafts_large_jpeg():
+    with open_image(_jpeg((4000, 3000)), max_side=900) as image:
+        # Giải mã ở 1/4: cạnh dài vẫn không nhỏ hơn max_side
+        assert image.size == (1000, 750)
+    with open_image(_jpeg((1200, 900)), max_side=900) as image:
+        assert image.size == (1200, 900)
+
+
+def test_preview_bytes_is_small_jpeg_on_white():
+    image = Image.new('RGBA', (1600, 400), (0, 0, 0, 0))
+    preview = Image.open(io.BytesIO(preview_bytes(image, side=200)))
+    assert preview.format == 'JPEG' and preview.size == (200, 50)
+    assert preview.getpixel((100, 25))[0] > 240
+    assert image.size == (1600, 400)
+    assert Image.open(io.BytesIO(upload_preview(_jpeg((4000, 3000)), side=400))).size == (400, 300)
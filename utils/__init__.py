@@ -0,0 +1 @@
+"""Các module xử lý dùng chung cho các trang (OCR, cache, ...)"""
@@ -0,0 +1,168 @@
+"""Tìm thẻ CCCD trong ảnh chụp và nắn phối cảnh về kích thước chuẩn.
+
+Ảnh chụp thẻ đặt trên bàn thường nghiêng và có nhiều nền thừa. Bước này tìm tứ
+giác của thẻ (OpenCV nếu có, nếu không thì ngưỡng Otsu + điểm cực trị bằng NumPy),
+nắn về CARD_SIZE và chỉ đưa phần thẻ vào các bước OCR. Ảnh thẻ đã nắn được cache
+theo nội dung ảnh upload.
+"""
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils.ocr_cache import get_cache, image_fingerprint, make_key
+
+# Import OpenCV (optional)
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Kích thước thẻ ID-1 (85.6 x 53.98 mm) chuẩn hóa ở khoảng 300 DPI
+CARD_SIZE = (1012, 638)
+CARD_ASPECT = CARD_SIZE[0] / CARD_SIZE[1]
+
+# Cạnh dài của ảnh thu nhỏ dùng để dò thẻ
+DETECT_SIDE = 800
+
+# Tứ giác hợp lệ: chiếm ít nhất tỉ lệ này của ảnh, tỉ lệ cạnh gần với thẻ (cho phép méo phối cảnh)
+MIN_AREA_RATIO = 0.15
+ASPECT_TOLERANCE = 0.3
+
+
+def order_points(points):
+    """Sắp 4 điểm theo thứ tự trên-trái, trên-phải, dưới-phải, dưới-trái"""
+    points = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    sums = points.sum(axis=1)
+    diffs = points[:, 0] - points[:, 1]
+    return np.array([points[sums.argmin()], points[diffs.argmax()],
+                     points[sums.argmax()], points[diffs.argmin()]], dtype=np.float32)
+
+
+def _quad_area(quad):
+    x, y = quad[:, 0], quad[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+
+
+def _quad_size(quad):
+    """(rộng, cao) trung bình của tứ giác đã sắp thứ tự"""
+    tl, tr, br, bl = quad
+    width = (np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2
+    height = (np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2
+    return width, height
+
+
+def _is_plausible(quad, image_size):
+    width, height = _quad_size(quad)
+    if min(width, height) <= 0:
+        return False
+    aspect = max(width, height) / min(width, height)
+    return (_quad_area(quad) >= MIN_AREA_RATIO * image_size[0] * image_size[1]
+            and abs(aspect - CARD_ASPECT) <= ASPECT_TOLERANCE * CARD_ASPECT)
+
+
+def _find_quad_cv2(gray):
+    """Tìm tứ giác lớn nhất theo biên cạnh (Canny + xấp xỉ đa giác)"""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.dilate(cv2.Canny(blurred, 50, 150), np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:5]
+    for contour in contours:
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            return order_points(approx)
+    if contours:
+        # Góc thẻ bị che/bo tròn: dùng hình chữ nhật bao nhỏ nhất của đường biên lớn nhất
+        return order_points(cv2.boxPoints(cv2.minAreaRect(contours[0])))
+    return None
+
+
+def otsu_threshold(gray):
+    """Ngưỡng Otsu: cực đại phương sai giữa hai lớp trên histogram 256 mức"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weights = hist.cumsum()
+    means = (hist * np.arange(256)).cumsum()
+    total, total_mean = weights[-1], means[-1]
+    background = weights[:-1]
+    foreground = total - background
+    valid = (background > 0) & (foreground > 0)
+    between = np.zeros(255)
+    between[valid] = (total_mean * background[valid] - total * means[:-1][valid]) ** 2 / (
+        background[valid] * foreground[valid])
+    return int(between.argmax())
+
+
+def _erode(mask, radius):
+    """Co vùng mask (bỏ các đốm nhiễu nhỏ) bằng phép AND các bản dịch chuyển"""
+    padded = np.pad(mask, radius, constant_values=False)
+    height, width = mask.shape
+    result = mask.copy()
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            result &= padded[radius + dy:radius + dy + height, radius + dx:radius + dx + width]
+    return result
+
+
+def _find_quad_numpy(gray):
+    """Tách thẻ khỏi nền bằng ngưỡng Otsu rồi lấy 4 điểm cực trị của vùng thẻ"""
+    mask = gray > otsu_threshold(gray)
+    # Thẻ là vùng ít chạm mép ảnh hơn (nền bao quanh thẻ)
+    border = np.concatenate((mask[0], mask[-1], mask[:, 0], mask[:, -1]))
+    if border.mean() > 0.5:
+        mask = ~mask
+    mask = _erode(mask, 2)
+    ys, xs = np.nonzero(mask)
+    if not len(xs):
+        return None
+    sums, diffs = xs + ys, xs - ys
+    return np.array([(xs[sums.argmin()], ys[sums.argmin()]), (xs[diffs.argmax()], ys[diffs.argmax()]),
+                     (xs[sums.argmax()], ys[sums.argmax()]), (xs[diffs.argmin()], ys[diffs.argmin()])],
+                    dtype=np.float32)
+
+
+def find_card_quad(image):
+    """Tìm 4 góc thẻ (trên-trái, trên-phải, dưới-phải, dưới-trái) theo tọa độ ảnh gốc, None nếu không thấy"""
+    gray = image.convert('L')
+    scale = min(1.0, DETECT_SIDE / max(gray.size))
+    if scale < 1.0:
+        gray = gray.resize((round(gray.width * scale), round(gray.height * scale)), Image.BILINEAR)
+    array = np.asarray(gray)
+    quad = _find_quad_cv2(array) if CV2_AVAILABLE else _find_quad_numpy(array)
+    if quad is None or not _is_plausible(quad, gray.size):
+        return None
+    return quad / scale
+
+
+def rectify(image, quad, size=CARD_SIZE):
+    """Nắn tứ giác thẻ về hình chữ nhật size (cạnh dài nằm ngang)"""
+    width, height = _quad_size(quad)
+    if height > width:
+        # Thẻ đặt dọc: xoay thứ tự góc để cạnh dài thành cạnh trên
+        quad = np.roll(quad, -1, axis=0)
+    if CV2_AVAILABLE:
+        target = np.array([(0, 0), (size[0], 0), size, (0, size[1])], dtype=np.float32)
+        matrix = cv2.getPerspectiveTransform(quad.astype(np.float32), target)
+        warped = cv2.warpPerspective(np.asarray(image.convert('RGB')), matrix, size, flags=cv2.INTER_CUBIC)
+        return Image.fromarray(warped)
+    tl, tr, br, bl = quad
+    # Image.QUAD nhận 4 góc nguồn theo thứ tự trên-trái, dưới-trái, dưới-phải, trên-phải
+    data = tuple(float(v) for point in (tl, bl, br, tr) for v in point)
+    return image.convert('RGB').transform(size, Image.QUAD, data, resample=Image.BICUBIC)
+
+
+def detect_card(image):
+    """Tìm và nắn thẻ trong ảnh, trả về ảnh thẻ CARD_SIZE hoặc None"""
+    image = ImageOps.exif_transpose(image)
+    quad = find_card_quad(image)
+    return rectify(image, quad) if quad is not None else None
+
+
+def get_card(image):
+    """detect_card có cache theo nội dung ảnh (cả kết quả không tìm thấy thẻ)"""
+    cache = get_cache()
+    key = make_key(image_fingerprint(image), kind='card', size=CARD_SIZE, cv2=CV2_AVAILABLE)
+    pages = cache.get_pages(key)
+    if pages is None:
+        card = detect_card(image)
+        pages = [card] if card is not None else []
+        cache.put_pages(key, pages)
+    return pages[0] if pages else None
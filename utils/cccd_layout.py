@@ -0,0 +1,240 @@
+"""Trích xuất các trường CCCD gắn chip theo bố cục cố định của thẻ.
+
+Sau khi chuẩn hóa ảnh thẻ về kích thước chuẩn (tìm và nắn thẻ bằng utils.card_detect),
+mỗi trường được cắt theo khung tọa độ (tỉ lệ 0..1 của thẻ) và OCR song song với cấu
+hình riêng: chỉ chữ số cho số CCCD, một dòng cho họ tên, chữ số và dấu / cho ngày tháng. Kết quả mỗi trường
+được kiểm tra định dạng; trường không hợp lệ để trống để bù bằng OCR toàn thẻ: đọc
+theo vị trí nhãn trên word boxes (parse_layout), sau cùng mới đến regex trên text.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils import ocr
+from utils.card_detect import CARD_ASPECT, CARD_SIZE, CV2_AVAILABLE, get_card
+from utils.layout_index import LayoutIndex
+from utils.ocr_cache import get_cache, image_fingerprint, make_key
+from utils.ocr_engines import get_engine
+from utils.preprocess import adaptive_threshold, guess_upside_down, is_upside_down
+
+# Không tìm thấy khung thẻ: ảnh có tỉ lệ lệch không quá mức này so với thẻ mới coi là đã cắt
+# sát thẻ (ảnh chụp 3:2 lệch khoảng 5%)
+ASPECT_TOLERANCE = 0.04
+
+# Số thread OCR các vùng (số job Tesseract thực sự chạy do ocr_scheduler giới hạn)
+FIELD_WORKERS = 6
+
+_DIGITS = '--psm 7 -c tessedit_char_whitelist=0123456789'
+_DATE = '--psm 7 -c tessedit_char_whitelist=0123456789/'
+
+# Khung (left, top, right, bottom) theo tỉ lệ thẻ, ngôn ngữ và config OCR của từng trường
+FRONT_FIELDS = {
+    'Số CCCD': {'box': (0.38, 0.38, 0.82, 0.49), 'lang': 'eng', 'config': _DIGITS},
+    'Họ và tên': {'box': (0.27, 0.53, 0.98, 0.62), 'lang': 'vie', 'config': '--psm 7'},
+    'Ngày sinh': {'box': (0.58, 0.60, 0.90, 0.68), 'lang': 'eng', 'config': _DATE},
+    'Giới tính': {'box': (0.44, 0.66, 0.60, 0.74), 'lang': 'vie', 'config': '--psm 7'},
+    'Quốc tịch': {'box': (0.78, 0.66, 0.99, 0.74), 'lang': 'vie', 'config': '--psm 7'},
+    'Quê quán': {'box': (0.27, 0.72, 0.99, 0.84), 'lang': 'vie', 'config': '--psm 6'},
+    'Nơi thường trú': {'box': (0.27, 0.82, 0.99, 0.99), 'lang': 'vie', 'config': '--psm 6'},
+}
+BACK_FIELDS = {
+    'Ngày cấp': {'box': (0.40, 0.38, 0.99, 0.52), 'lang': 'vie', 'config': '--psm 6'},
+    'Nơi cấp': {'box': (0.40, 0.50, 0.99, 0.66), 'lang': 'vie', 'config': '--psm 6'},
+}
+
+FIELD_NAMES = tuple(FRONT_FIELDS) + tuple(BACK_FIELDS)
+
+# Các trường phải đọc được từ vùng thì mới bỏ qua OCR toàn thẻ
+REQUIRED_FIELDS = ('Số CCCD', 'Họ và tên', 'Ngày sinh', 'Giới tính', 'Quê quán', 'Nơi thường trú', 'Ngày cấp')
+
+_DATE_PATTERN = re.compile(r'(\d{2})/?(\d{2})/?(\d{4})')
+
+
+def _upright(card, engine=None):
+    """Lật thẻ (đã nằm ngang) 180 độ nếu bị ngược: xét hình dạng dòng chữ, không đủ chắc mới hỏi engine OCR"""
+    gray = card.convert('L')
+    upside_down = guess_upside_down(~adaptive_threshold(np.asarray(gray), window=25, offset=15))
+    if upside_down is None:
+        upside_down = is_upside_down(gray, engine)
+    return card.transpose(Image.ROTATE_180) if upside_down else card
+
+
+def _normalize_card(image, engine):
+    card = get_card(image)
+    if card is None:
+        upright = ImageOps.exif_transpose(image).convert('RGB')
+        if upright.height > upright.width:
+            upright = upright.transpose(Image.ROTATE_90)
+        if abs(upright.width / upright.height - CARD_ASPECT) > ASPECT_TOLERANCE * CARD_ASPECT:
+            return None
+        card = upright.resize(CARD_SIZE, Image.LANCZOS)
+    return _upright(card, engine)
+
+
+def normalize_card(image, engine=None):
+    """Đưa ảnh về ảnh thẻ CARD_SIZE đứng thẳng, None nếu không tìm thấy thẻ.
+
+    Luôn tìm và nắn thẻ bằng utils.card_detect trước; chỉ khi không thấy tứ giác thẻ mà
+    cả ảnh có tỉ lệ của thẻ (ảnh đã cắt sát) thì mới đổi kích thước cả ảnh. Thẻ đặt dọc
+    được xoay về nằm ngang rồi lật 180 độ nếu bị ngược (engine là engine OCR dùng khi
+    hình dạng dòng chữ không đủ để quyết định). Ảnh đúng CARD_SIZE coi như đã chuẩn hóa.
+    Kết quả có cache theo nội dung ảnh.
+    """
+    if image.size == CARD_SIZE:
+        return image
+    cache = get_cache()
+    key = make_key(image_fingerprint(image), kind='card_upright', size=CARD_SIZE, cv2=CV2_AVAILABLE,
+                   aspect_tolerance=ASPECT_TOLERANCE, engine=get_engine(engine).name)
+    pages = cache.get_pages(key)
+    if pages is None:
+        card = _normalize_card(image, engine)
+        pages = [card] if card is not None else []
+        cache.put_pages(key, pages)
+    return pages[0] if pages else None
+
+
+def crop_field(card, box):
+    left, top, right, bottom = box
+    width, height = card.size
+    return card.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+
+
+def _clean_date(text):
+    match = _DATE_PATTERN.search(re.sub(r'\s', '', text))
+    if not match:
+        return ''
+    day, month, year = match.groups()
+    try:
+        datetime(int(year), int(month), int(day))
+    except ValueError:
+        return ''
+    return f"{day}/{month}/{year}"
+
+
+def _clean_number(text):
+    digits = re.sub(r'\D', '', text)
+    return digits if len(digits) == 12 else ''
+
+
+def _clean_name(text):
+    name = ' '.join(text.split()).strip(' .:')
+    # Họ tên in hoa, chỉ gồm chữ cái, ít nhất hai từ
+    if len(name.split()) >= 2 and all(ch.isalpha() or ch == ' ' for ch in name):
+        return name.upper()
+    return ''
+
+
+def _clean_gender(text):
+    match = re.search(r'\b(Nam|Nữ)\b', text, re.IGNORECASE)
+    return match.group(1).capitalize() if match else ''
+
+
+def _clean_nationality(text):
+    return 'Việt Nam' if re.search(r'Vi[eệ]t\s*Nam', text, re.IGNORECASE) else ''
+
+
+def _clean_address(text):
+    # Bỏ nhãn song ngữ nếu khung cắt lẹm vào dòng nhãn
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    lines = [line for line in lines if not re.search(r'Place of|Quê quán|Nơi thường trú|residence|origin',
+                                                     line, re.IGNORECASE)]
+    value = ' '.join(lines).strip(' .:,')
+    return value if len(value) >= 5 else ''
+
+
+def _clean_issuer(text):
+    if re.search(r'C[UỤ]C\s+C[AẢ]NH\s+S[AÁ]T', text, re.IGNORECASE):
+        return 'CỤC CẢNH SÁT QUẢN LÝ HÀNH CHÍNH VỀ TRẬT TỰ XÃ HỘI'
+    return ''
+
+
+_CLEANERS = {
+    'Số CCCD': _clean_number,
+    'Họ và tên': _clean_name,
+    'Ngày sinh': _clean_date,
+    'Giới tính': _clean_gender,
+    'Quốc tịch': _clean_nationality,
+    'Quê quán': _clean_address,
+    'Nơi thường trú': _clean_address,
+    'Ngày cấp': _clean_date,
+    'Nơi cấp': _clean_issuer,
+}
+
+
+def _ocr_field(card, spec, engine=None, profile=None):
+    # Vùng nhỏ đã thẳng: chỉ thu nhỏ/phóng to theo chiều cao chữ và nhị phân hóa
+    return ocr.image_to_string(crop_field(card, spec['box']), lang=spec['lang'], config=spec['config'],
+                               preprocess={'deskew': False, 'fix_orientation': False}, engine=engine,
+                               profile=profile)
+
+
+def extract_fields(image_front, image_back, skip=(), engine=None, profile=None):
+    """OCR song song từng vùng trường của hai mặt thẻ (bỏ qua các trường trong skip).
+
+    engine/profile là engine và hồ sơ OCR của trang gọi (utils.ocr_engines, utils.ocr_profiles);
+    hồ sơ giữ nguyên ngôn ngữ, psm và whitelist riêng của từng trường.
+
+    Trả về (fields, raw_texts): fields chỉ chứa các trường đọc được và đúng định dạng,
+    raw_texts là text OCR thô của từng vùng (để debug). Không tìm thấy thẻ trong ảnh
+    thì trả về ({}, {}).
+    """
+    jobs = []
+    for image, layout in ((image_front, FRONT_FIELDS), (image_back, BACK_FIELDS)):
+        names = [name for name in layout if name not in skip]
+        card = normalize_card(image, engine) if image is not None and names else None
+        if card is not None:
+            jobs.extend((name, card, layout[name]) for name in names)
+    if not jobs:
+        return {}, {}
+
+    with ThreadPoolExecutor(max_workers=FIELD_WORKERS) as executor:
+        texts = list(executor.map(lambda job: _ocr_field(job[1], job[2], engine, profile), jobs))
+
+    fields = {}
+    raw_texts = {}
+    for (name, _, _), text in zip(jobs, texts):
+        raw_texts[name] = text.strip()
+        value = _CLEANERS[name](text)
+        if value:
+            fields[name] = value
+    return fields, raw_texts
+
+
+def is_complete(fields):
+    return all(fields.get(name) for name in REQUIRED_FIELDS)
+
+
+# Nhãn in trên thẻ (so khớp không dấu), hướng đọc giá trị và số dòng tối đa của từng trường
+LAYOUT_LABELS = {
+    'Số CCCD': (['Số / No', 'Số định danh cá nhân', 'Personal identification number'], 'right_below', 1),
+    'Họ và tên': (['Họ và tên', 'Họ, chữ đệm và tên', 'Full name'], 'below', 1),
+    'Ngày sinh': (['Ngày sinh', 'Date of birth'], 'right', 1),
+    'Giới tính': (['Giới tính', 'Sex'], 'right', 1),
+    'Quốc tịch': (['Quốc tịch', 'Nationality'], 'right', 1),
+    'Quê quán': (['Quê quán', 'Place of origin'], 'right_below', 2),
+    'Nơi thường trú': (['Nơi thường trú', 'Place of residence'], 'right_below', 2),
+    'Ngày cấp': (['Ngày, tháng, năm', 'Date, month, year'], 'right', 1),
+}
+
+
+def parse_layout(words_front, words_back):
+    """Đọc các trường theo vị trí nhãn trên word boxes OCR toàn thẻ của hai mặt.
+
+    Trả về dict chỉ gồm các trường đọc được và đúng định dạng (cùng bộ kiểm tra với OCR vùng).
+    """
+    fields = {}
+    for words, layout in ((words_front, FRONT_FIELDS), (words_back, BACK_FIELDS)):
+        if not words:
+            continue
+        index = LayoutIndex(words)
+        for name in layout:
+            if name not in LAYOUT_LABELS:
+                continue
+            labels, direction, lines = LAYOUT_LABELS[name]
+            value = _CLEANERS[name](index.value(labels, direction=direction, lines=lines))
+            if value:
+                fields[name] = value
+    return fields
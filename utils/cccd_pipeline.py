@@ -0,0 +1,211 @@
+"""Pipeline trích xuất thông tin CCCD: OCR mỗi mặt đúng một lần, đo thời gian từng bước"""
+import time
+from contextlib import contextmanager
+
+from utils.cccd_layout import FIELD_NAMES, is_complete
+from utils.mrz import strip_accents
+
+
+class CCCDExtractionPipeline:
+    """Giữ text OCR của hai mặt CCCD để dùng chung cho OpenAI, regex và phần debug"""
+
+    def __init__(self, ocr_func, parse_func, openai_func=None, fields_func=None, mrz_func=None, qr_func=None,
+                 card_func=None, layout_func=None, engine=None, profile=None):
+        self.ocr_func = ocr_func
+        self.parse_func = parse_func
+        self.openai_func = openai_func
+        self.fields_func = fields_func
+        self.mrz_func = mrz_func
+        self.qr_func = qr_func
+        self.card_func = card_func
+        self.layout_func = layout_func
+        # Engine và hồ sơ OCR của trang, dùng cho cắt thẻ (dò thẻ lộn ngược), OCR vùng và MRZ
+        # (ocr_func tự chọn của nó)
+        self.engine = engine
+        self.profile = profile
+        # Ảnh thẻ đã cắt và nắn của hai mặt (None nếu không tìm thấy thẻ)
+        self.card_front = None
+        self.card_back = None
+        self.text_front = None
+        self.text_back = None
+        # Word boxes OCR toàn thẻ (khi ocr_func trả về (text, words)), dùng cho layout_func
+        self.words_front = None
+        self.words_back = None
+        self.fields = {}
+        self.field_texts = {}
+        self.mrz = None
+        self.qr = None
+        # Các trường lấy từ QR hoặc MRZ đã xác thực, luôn được ưu tiên
+        self.verified_fields = set()
+        self.info = None
+        self.method = None
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Đo thời gian (giây) của một bước và cộng dồn vào timings"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def full_text(self):
+        return f"{self.text_front or ''}\n{self.text_back or ''}"
+
+    def run_qr(self, image_front):
+        """Giải mã QR mặt trước (utils.cccd_qr), không cần OCR"""
+        if self.qr_func is None or image_front is None:
+            return None
+        with self.stage('QR'):
+            self.qr = self.qr_func(image_front)
+        if self.qr:
+            self.fields.update(self.qr)
+            self.verified_fields.update(self.qr)
+        return self.qr
+
+    def run_cards(self, image_front, image_back):
+        """Tìm và nắn thẻ trong ảnh chụp hai mặt (utils.card_detect), các bước OCR sau chỉ dùng phần thẻ"""
+        if self.card_func is None:
+            return
+        with self.stage('Cắt thẻ'):
+            if image_front is not None:
+                self.card_front = self.card_func(image_front, engine=self.engine)
+            if image_back is not None:
+                self.card_back = self.card_func(image_back, engine=self.engine)
+
+    def _card_or(self, card, image):
+        return card if card is not None else image
+
+    def run_fields(self, image_front, image_back):
+        """OCR theo vùng các trường chưa có (utils.cccd_layout), bỏ qua nếu không có fields_func"""
+        if self.fields_func is None:
+            return self.fields
+        with self.stage('OCR vùng'):
+            fields, self.field_texts = self.fields_func(self._card_or(self.card_front, image_front),
+                                                        self._card_or(self.card_back, image_back),
+                                                        skip=set(self.fields), engine=self.engine,
+                                                        profile=self.profile)
+        self.fields.update(fields)
+        return self.fields
+
+    def run_mrz(self, image_back):
+        """Đọc MRZ mặt sau (utils.mrz); MRZ hợp lệ thì thay các trường tương ứng đã OCR vùng"""
+        if self.mrz_func is None or image_back is None:
+            return None
+        with self.stage('MRZ'):
+            self.mrz = self.mrz_func(self._card_or(self.card_back, image_back), engine=self.engine,
+                                     profile=self.profile)
+        if self.mrz_verified():
+            self._apply_mrz()
+        return self.mrz
+
+    def mrz_verified(self):
+        """MRZ đọc được và mọi chữ số kiểm tra đều khớp"""
+        return bool(self.mrz and self.mrz['valid'])
+
+    def _apply_mrz(self):
+        mrz = self.mrz
+        for name, value in (('Số CCCD', mrz['id_number']), ('Ngày sinh', mrz['birth_date']),
+                            ('Giới tính', mrz['sex'])):
+            if value:
+                self.fields[name] = value
+                self.verified_fields.add(name)
+        if mrz['nationality'] == 'VNM':
+            self.fields['Quốc tịch'] = 'Việt Nam'
+        name = self.fields.get('Họ và tên')
+        if name and strip_accents(name) != mrz['name']:
+            # Họ tên mặt trước không khớp MRZ: bỏ để OCR toàn thẻ/OpenAI đọc lại
+            del self.fields['Họ và tên']
+
+    def run_fast_paths(self, image_front, image_back):
+        """QR -> cắt thẻ -> OCR vùng cho các trường QR không có -> MRZ (chỉ khi không đọc được QR)"""
+        self.run_qr(image_front)
+        self.run_cards(image_front, image_back)
+        self.run_fields(image_front, image_back)
+        if not self.qr:
+            self.run_mrz(image_back)
+        return self.fields
+
+    def verified(self):
+        """Dữ liệu chính đã được xác thực (QR giải mã được hoặc MRZ khớp chữ số kiểm tra)"""
+        return bool(self.qr) or self.mrz_verified()
+
+    def fields_complete(self):
+        return is_complete(self.fields)
+
+    def can_skip_full_ocr(self, use_openai=False):
+        """Đủ trường từ QR/OCR vùng; khi bật OpenAI thì còn cần dữ liệu đã xác thực (QR/MRZ)"""
+        return self.fields_complete() and (self.verified() or not use_openai)
+
+    def use_fields(self):
+        """Dùng kết quả OCR vùng (và MRZ) làm kết quả cuối, không cần OCR toàn thẻ"""
+        self.info = {name: self.fields.get(name, '') for name in FIELD_NAMES}
+        self.info['Quốc tịch'] = self.info['Quốc tịch'] or 'Việt Nam'
+        self.method = 'qr' if self.qr else ('mrz' if self.mrz_verified() else 'roi')
+        return self.info
+
+    def _merge_fields(self, info, override):
+        """Bổ sung (override=False) hoặc thay (override=True) bằng các trường OCR vùng hợp lệ.
+
+        Trường từ QR/MRZ đã xác thực luôn thay giá trị đọc từ text.
+        """
+        for name, value in self.fields.items():
+            if override or name in self.verified_fields or not info.get(name):
+                info[name] = value
+        return info
+
+    def _ocr(self, image):
+        """ocr_func trả về text, hoặc (text, word boxes) để đọc trường theo vị trí nhãn"""
+        result = self.ocr_func(image)
+        text, words = result if isinstance(result, tuple) else (result, None)
+        return text or '', words or {}
+
+    def run_ocr(self, image_front, image_back):
+        """OCR hai mặt CCCD (chỉ phần thẻ nếu đã cắt được), bỏ qua nếu đã OCR trước đó"""
+        if self.text_front is None:
+            with self.stage('OCR mặt trước'):
+                self.text_front, self.words_front = self._ocr(self._card_or(self.card_front, image_front))
+        if self.text_back is None:
+            with self.stage('OCR mặt sau'):
+                self.text_back, self.words_back = self._ocr(self._card_or(self.card_back, image_back))
+
+    def run_openai(self, api_key):
+        """Trích xuất bằng OpenAI từ text đã OCR, trả về None nếu thất bại"""
+        if self.openai_func is None:
+            return None
+        with self.stage('OpenAI'):
+            data = self.openai_func(self.text_front, self.text_back, api_key)
+        if data:
+            self.info = self._merge_fields(data, override=False)
+            self.method = 'openai'
+        return data
+
+    def run_regex(self):
+        """Trích xuất bằng regex từ text đã OCR, ưu tiên giá trị đọc theo vị trí nhãn (layout_func)"""
+        with self.stage('Regex'):
+            info = self.parse_func(self.text_front, self.text_back)
+            if self.layout_func is not None:
+                info.update(self.layout_func(self.words_front, self.words_back))
+            # Trường OCR theo vùng đã kiểm tra định dạng nên đáng tin hơn regex trên text toàn thẻ
+            self.info = self._merge_fields(info, override=True)
+        self.method = 'regex'
+        return self.info
+
+    def run(self, image_front, image_back, use_openai=False, api_key=None):
+        """Chạy toàn bộ pipeline: QR/OCR vùng/MRZ -> (đủ trường thì dừng) -> OCR toàn thẻ -> OpenAI/regex"""
+        self.run_fast_paths(image_front, image_back)
+        if self.can_skip_full_ocr(use_openai and api_key):
+            return self.use_fields()
+        self.run_ocr(image_front, image_back)
+        if use_openai and api_key and self.run_openai(api_key):
+            return self.info
+        return self.run_regex()
+
+    def format_timings(self):
+        """Chuỗi mô tả thời gian từng bước, dùng để hiển thị trên giao diện"""
+        total = sum(self.timings.values())
+        parts = [f"{name}: {seconds:.2f}s" for name, seconds in self.timings.items()]
+        parts.append(f"Tổng: {total:.2f}s")
+        return " | ".join(parts)
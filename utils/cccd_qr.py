@@ -0,0 +1,97 @@
+"""Giải mã QR ở mặt trước CCCD gắn chip, không cần OCR.
+
+Nội dung QR: so_cccd|cmnd_cu|ho_ten|ddmmyyyy_sinh|gioi_tinh|dia_chi|ddmmyyyy_cap.
+Dùng pyzbar nếu có, nếu không thì cv2.QRCodeDetector; không có thư viện nào thì
+bỏ qua bước này.
+"""
+import re
+
+from PIL import ImageOps
+
+# Import pyzbar (optional)
+try:
+    from pyzbar.pyzbar import ZBarSymbol
+    from pyzbar.pyzbar import decode as zbar_decode
+    PYZBAR_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError: có gói pyzbar nhưng thiếu thư viện zbar của hệ thống
+    PYZBAR_AVAILABLE = False
+
+# Import OpenCV (optional)
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+QR_AVAILABLE = PYZBAR_AVAILABLE or CV2_AVAILABLE
+
+# QR nằm ở góc trên bên phải mặt trước: thử vùng này trước cho nhanh rồi mới đến cả ảnh
+QR_REGION = (0.5, 0.0, 1.0, 0.6)
+
+# Cạnh dài tối đa của ảnh đưa vào bộ giải mã (ảnh chụp 12 MP giải mã chậm)
+MAX_DECODE_SIDE = 2000
+
+
+def _decode(gray):
+    """Giải mã QR trong ảnh xám, trả về danh sách nội dung (str)"""
+    if PYZBAR_AVAILABLE:
+        payloads = []
+        for symbol in zbar_decode(gray, symbols=[ZBarSymbol.QRCODE]):
+            try:
+                payloads.append(symbol.data.decode('utf-8'))
+            except UnicodeDecodeError:
+                continue
+        if payloads:
+            return payloads
+    if CV2_AVAILABLE:
+        text, _, _ = cv2.QRCodeDetector().detectAndDecode(np.asarray(gray))
+        if text:
+            return [text]
+    return []
+
+
+def decode_qr(image):
+    """Tìm và giải mã QR trong ảnh (ưu tiên vùng góc trên bên phải)"""
+    gray = ImageOps.exif_transpose(image).convert('L')
+    if max(gray.size) > MAX_DECODE_SIDE:
+        gray.thumbnail((MAX_DECODE_SIDE, MAX_DECODE_SIDE))
+    width, height = gray.size
+    left, top, right, bottom = QR_REGION
+    region = gray.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+    return _decode(region) or _decode(gray)
+
+
+def _format_date(ddmmyyyy):
+    return f"{ddmmyyyy[:2]}/{ddmmyyyy[2:4]}/{ddmmyyyy[4:]}" if re.fullmatch(r'\d{8}', ddmmyyyy) else ''
+
+
+def parse_cccd_qr(payload):
+    """Phân tích nội dung QR thành các trường thông tin CCCD, None nếu không đúng định dạng"""
+    parts = payload.strip().split('|')
+    if len(parts) < 7 or not re.fullmatch(r'\d{12}', parts[0]):
+        return None
+    # Số CMND cũ (parts[1]) không có trong mẫu thông tin nhân viên
+    so_cccd, _, ho_ten, ngay_sinh, gioi_tinh, dia_chi, ngay_cap = (p.strip() for p in parts[:7])
+    fields = {
+        'Số CCCD': so_cccd,
+        'Họ và tên': ho_ten.upper(),
+        'Ngày sinh': _format_date(ngay_sinh),
+        'Giới tính': gioi_tinh.capitalize() if gioi_tinh.lower() in ('nam', 'nữ') else '',
+        'Quốc tịch': 'Việt Nam',
+        'Nơi thường trú': dia_chi,
+        'Ngày cấp': _format_date(ngay_cap),
+    }
+    return {name: value for name, value in fields.items() if value}
+
+
+def read_cccd_qr(image_front):
+    """Đọc QR mặt trước CCCD, trả về dict các trường hoặc None nếu không giải mã được"""
+    if not QR_AVAILABLE or image_front is None:
+        return None
+    for payload in decode_qr(image_front):
+        fields = parse_cccd_qr(payload)
+        if fields:
+            return fields
+    return None
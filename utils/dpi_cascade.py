@@ -0,0 +1,136 @@
+"""Raster hóa theo tầng DPI: OCR bản render DPI thấp trước, chỉ render lại vùng kém tin cậy ở DPI cao.
+
+Chữ rõ chỉ tốn một phần số điểm ảnh so với render cố định 200 DPI, chữ nhỏ (ô tổng
+tiền, số hóa đơn in nhỏ...) vẫn được OCR lại ở độ phân giải đủ cao.
+"""
+from utils import ocr
+
+LOW_DPI = 150
+HIGH_DPI = 300
+
+# Dòng có độ tin cậy trung bình dưới ngưỡng này sẽ được render lại
+CONF_THRESHOLD = 70
+
+# Quá nhiều vùng kém hoặc vùng kém chiếm quá nửa trang thì render lại cả trang
+MAX_REGIONS = 8
+MAX_REGION_AREA_RATIO = 0.5
+
+
+def _line_boxes(words):
+    """Gom word boxes theo dòng: {(block, par, line): [left, top, right, bottom, tổng conf, số từ]}"""
+    lines = {}
+    for i, text in enumerate(words.get('text', [])):
+        if not text or not str(text).strip():
+            continue
+        key = (words['block_num'][i], words['par_num'][i], words['line_num'][i])
+        left, top = words['left'][i], words['top'][i]
+        right, bottom = left + words['width'][i], top + words['height'][i]
+        conf = max(float(words['conf'][i]), 0.0)
+        if key in lines:
+            box = lines[key]
+            box[0], box[1] = min(box[0], left), min(box[1], top)
+            box[2], box[3] = max(box[2], right), max(box[3], bottom)
+            box[4] += conf
+            box[5] += 1
+        else:
+            lines[key] = [left, top, right, bottom, conf, 1]
+    return lines
+
+
+def find_low_confidence_regions(words, image_size, threshold=CONF_THRESHOLD):
+    """Tìm các vùng (tỉ lệ 0..1 của trang) chứa dòng có độ tin cậy thấp.
+
+    Trả về None nếu nên render lại cả trang.
+    """
+    width, height = image_size
+    boxes = sorted((box[:4] for box in _line_boxes(words).values() if box[4] / box[5] < threshold),
+                   key=lambda b: b[1])
+    regions = []
+    for left, top, right, bottom in boxes:
+        pad = (bottom - top) // 2
+        box = [max(0, left - pad), max(0, top - pad), min(width, right + pad), min(height, bottom + pad)]
+        # Gộp các dòng liền kề theo chiều dọc thành một vùng
+        if regions and box[1] <= regions[-1][3]:
+            last = regions[-1]
+            last[0], last[1] = min(last[0], box[0]), min(last[1], box[1])
+            last[2], last[3] = max(last[2], box[2]), max(last[3], box[3])
+        else:
+            regions.append(box)
+
+    area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions)
+    if len(regions) > MAX_REGIONS or area > MAX_REGION_AREA_RATIO * width * height:
+        return None
+    return [(r[0] / width, r[1] / height, r[2] / width, r[3] / height) for r in regions]
+
+
+def merge_region_words(words, image_size, regions, region_words, scale):
+    """Thay các từ nằm trong vùng bằng kết quả OCR lại ở DPI cao.
+
+    scale = DPI thấp / DPI cao, dùng để đổi tọa độ của vùng về ảnh DPI thấp.
+    """
+    width, height = image_size
+    columns = list(words.keys())
+    rows = [{c: words[c][i] for c in columns} for i in range(len(words.get('text', [])))]
+
+    for index, (bbox, new_words) in enumerate(zip(regions, region_words)):
+        left, top = bbox[0] * width, bbox[1] * height
+        new_count = len(new_words.get('text', []))
+
+        inside = [i for i, row in enumerate(rows)
+                  if bbox[0] * width <= row['left'] + row['width'] / 2 <= bbox[2] * width
+                  and bbox[1] * height <= row['top'] + row['height'] / 2 <= bbox[3] * height]
+        anchor = rows[inside[0]] if inside else None
+        insert_at = inside[0] if inside else len(rows)
+
+        replacement = []
+        for i in range(new_count):
+            if not str(new_words['text'][i]).strip():
+                continue
+            row = {c: new_words[c][i] for c in columns if c in new_words}
+            row['left'] = int(left + new_words['left'][i] * scale)
+            row['top'] = int(top + new_words['top'][i] * scale)
+            row['width'] = int(new_words['width'][i] * scale)
+            row['height'] = int(new_words['height'][i] * scale)
+            # Giữ vị trí khối của đoạn bị thay, đánh số dòng riêng cho từng vùng
+            row['page_num'] = anchor['page_num'] if anchor else 1
+            row['block_num'] = anchor['block_num'] if anchor else 10000 + index
+            row['par_num'] = anchor['par_num'] if anchor else 1
+            row['line_num'] = 1000 * (index + 1) + 100 * new_words['block_num'][i] + new_words['line_num'][i]
+            replacement.append(row)
+
+        inside_set = set(inside)
+        rows = rows[:insert_at] + replacement + [row for i, row in enumerate(rows[insert_at:], start=insert_at)
+                                                 if i not in inside_set]
+
+    return {c: [row.get(c, 0) for row in rows] for c in columns}
+
+
+def cascade_page(renderer, page_index, lang=ocr.DEFAULT_LANG, low_dpi=LOW_DPI, high_dpi=HIGH_DPI,
+                 words=None, image_size=None, map_func=None, engine=None, profile=None):
+    """OCR một trang theo tầng DPI, trả về (words, thống kê).
+
+    Nếu đã có words của bản render DPI thấp (ví dụ OCR trong process pool) thì truyền
+    vào cùng image_size để bỏ qua bước đầu. map_func(danh sách ảnh) -> danh sách words
+    cho phép OCR các vùng song song; mặc định OCR tuần tự trên thread hiện tại.
+    """
+    if map_func is None:
+        def map_func(images):
+            return [ocr.image_to_data(image, lang=lang, engine=engine, profile=profile) for image in images]
+    if words is None:
+        image = renderer.render_page(page_index, low_dpi)
+        image_size = image.size
+        words = map_func([image])[0]
+
+    stats = {'dpi': low_dpi, 'high_dpi': high_dpi, 'rerenders': 0, 'full_page_rerender': False}
+    regions = find_low_confidence_regions(words, image_size)
+    if regions is None:
+        # Chất lượng kém trên diện rộng: render lại cả trang ở DPI cao
+        image = renderer.render_page(page_index, high_dpi)
+        stats.update(dpi=high_dpi, rerenders=1, full_page_rerender=True)
+        return map_func([image])[0], stats
+    if not regions:
+        return words, stats
+
+    region_words = map_func([renderer.render_region(page_index, bbox, high_dpi) for bbox in regions])
+    stats['rerenders'] = len(regions)
+    return merge_region_words(words, image_size, regions, region_words, low_dpi / high_dpi), stats
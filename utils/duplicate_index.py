@@ -0,0 +1,190 @@
+"""Chỉ mục hash cảm quan của các trang chứng từ đã lưu, để phát hiện bản scan/chụp trùng trước khi OCR.
+
+Mỗi trang được chuẩn hóa (xám, nhị phân hóa thích ứng, cắt theo khung mực) nên bản PDF
+và ảnh chụp của cùng một hóa đơn cho hash gần nhau. Hash chính là pHash 64 bit, chia
+thành BANDS đoạn 8 bit lưu ở các cột có chỉ mục trong SQLite: hai hash cách nhau không
+quá BANDS - 1 bit chắc chắn trùng ít nhất một đoạn (nguyên lý chuồng bồ câu), nên tra
+cứu chỉ đọc các dòng trùng đoạn thay vì quét toàn bộ. Ứng viên được xác nhận lại bằng
+dhash 256 bit để phân biệt các hóa đơn khác nhau cùng mẫu của một nhà cung cấp.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from utils import preprocess as preprocessing
+from utils.image_hash import dhash, from_hex, hamming, phash, to_hex
+from utils.pdf_render import get_renderer
+from utils.upload_store import open_image
+
+INDEX_FILE = os.environ.get("DUPLICATE_INDEX_FILE", "duplicate_index.sqlite")
+
+# Cạnh dài của ảnh khi chuẩn hóa trang để tính hash, và DPI render trang PDF
+NORMALIZE_SIDE = 1000
+HASH_DPI = 72
+# Số trang PDF tối đa được tính hash cho mỗi file
+MAX_PAGES = 100
+
+# pHash 64 bit chia 8 đoạn: tìm được mọi hash cách nhau tối đa 7 bit
+BANDS = 8
+BAND_BITS = 8
+MAX_DISTANCE = 6
+# Khoảng cách tối đa của dhash 16x16 (256 bit) để xác nhận trùng
+DETAIL_HASH_SIZE = 16
+MAX_DETAIL_DISTANCE = 24
+# Tỉ lệ trang của file upload tối thiểu phải trùng cùng một bản ghi để coi cả file là bản trùng
+MIN_MATCH_RATIO = 0.8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    phash TEXT NOT NULL,
+    detail TEXT NOT NULL,
+    page_index INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    source TEXT,
+    created TEXT NOT NULL,
+    {bands}
+);
+{indexes}
+""".format(
+    bands=',\n    '.join(f"b{i} INTEGER NOT NULL" for i in range(BANDS)),
+    indexes='\n'.join(f"CREATE INDEX IF NOT EXISTS pages_b{i} ON pages (kind, b{i});" for i in range(BANDS)),
+)
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def normalize_page(image):
+    """Ảnh mực đen trên nền trắng, cắt sát khung mực (bỏ lề, nền bàn, chênh lệch ánh sáng)"""
+    gray = preprocessing.to_grayscale(image)
+    gray.thumbnail((NORMALIZE_SIDE, NORMALIZE_SIDE))
+    ink = ~preprocessing.adaptive_threshold(np.asarray(gray))
+    rows = np.nonzero(ink.any(axis=1))[0]
+    cols = np.nonzero(ink.any(axis=0))[0]
+    if len(rows):
+        ink = ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    return Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+
+
+def page_signature(image):
+    """(pHash 64 bit, dhash 256 bit) dạng hex của một trang"""
+    page = normalize_page(image)
+    return to_hex(phash(page), 64), to_hex(dhash(page, DETAIL_HASH_SIZE), DETAIL_HASH_SIZE * DETAIL_HASH_SIZE)
+
+
+def upload_signatures(fileobj, is_pdf):
+    """Chữ ký các trang của file upload (PDF render ở HASH_DPI, tối đa MAX_PAGES trang)"""
+    if not is_pdf:
+        # Chỉ cần ảnh nhỏ: JPEG được giải mã thu nhỏ (draft)
+        with open_image(fileobj, NORMALIZE_SIDE) as image:
+            return [page_signature(image)]
+    signatures = []
+    with get_renderer(fileobj.getvalue()) as renderer:
+        for page_index in range(min(renderer.page_count(), MAX_PAGES)):
+            image = renderer.render_page(page_index, HASH_DPI)
+            if image is not None:
+                signatures.append(page_signature(image))
+    return signatures
+
+
+class DuplicateIndex:
+    """Chỉ mục trang theo loại chứng từ (kind, ví dụ tên sheet HD_MV)"""
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._initialized = True
+        return connection
+
+    def find(self, kind, signature):
+        """Bản ghi đã lưu có trang gần nhất với signature, hoặc None.
+
+        Trả về dict record, source, created, page_index, distance (bit pHash khác nhau).
+        """
+        page_hash, detail = from_hex(signature[0]), from_hex(signature[1])
+        condition = ' OR '.join(f"b{i} = ?" for i in range(BANDS))
+        with self._lock, closing(self._connect()) as connection, connection:
+            rows = connection.execute(
+                f"SELECT phash, detail, page_index, record, source, created FROM pages "
+                f"WHERE kind = ? AND ({condition})", [kind] + _bands(page_hash)).fetchall()
+        best = None
+        for row_hash, row_detail, page_index, record, source, created in rows:
+            distance = hamming(page_hash, from_hex(row_hash))
+            if distance > MAX_DISTANCE or hamming(detail, from_hex(row_detail)) > MAX_DETAIL_DISTANCE:
+                continue
+            if best is None or distance < best['distance']:
+                best = {'record': json.loads(record), 'source': source, 'created': created,
+                        'page_index': page_index, 'distance': distance}
+        return best
+
+    def find_document(self, kind, signatures, min_ratio=MIN_MATCH_RATIO):
+        """Bản ghi đã lưu trùng với cả tài liệu (các trang signatures), hoặc None.
+
+        Chỉ coi là trùng khi ít nhất min_ratio số trang khớp cùng một bản ghi: một trang cũ
+        nằm trong tài liệu mới nhiều trang không làm cả tài liệu bị bỏ qua. Trả về dict như
+        find, thêm matched (số trang khớp) và pages (số trang của tài liệu).
+        """
+        if not signatures:
+            return None
+        matches = {}
+        for signature in signatures:
+            match = self.find(kind, signature)
+            if match is None:
+                continue
+            record_key = json.dumps(match['record'], ensure_ascii=False, sort_keys=True)
+            best, count = matches.get(record_key, (match, 0))
+            matches[record_key] = (min(best, match, key=lambda item: item['distance']), count + 1)
+        if not matches:
+            return None
+        best, count = max(matches.values(), key=lambda item: item[1])
+        if count < min_ratio * len(signatures):
+            return None
+        return {**best, 'matched': count, 'pages': len(signatures)}
+
+    def add(self, kind, signatures, record, source=None):
+        """Ghi các trang của một chứng từ đã lưu, gắn với bản ghi record (dict)"""
+        created = datetime.now().isoformat(timespec='seconds')
+        rows = [[kind, page_hash, detail, page_index, json.dumps(record, ensure_ascii=False), source, created]
+                + _bands(from_hex(page_hash))
+                for page_index, (page_hash, detail) in enumerate(signatures)]
+        columns = ', '.join(['kind', 'phash', 'detail', 'page_index', 'record', 'source', 'created']
+                            + [f"b{i}" for i in range(BANDS)])
+        placeholders = ', '.join('?' * (7 + BANDS))
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.executemany(f"INSERT INTO pages ({columns}) VALUES ({placeholders})", rows)
+
+    def count(self, kind=None):
+        with self._lock, closing(self._connect()) as connection, connection:
+            if kind is None:
+                return connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            return connection.execute("SELECT COUNT(*) FROM pages WHERE kind = ?", (kind,)).fetchone()[0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index():
+    """Chỉ mục dùng chung trong toàn tiến trình"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex()
+        return _index
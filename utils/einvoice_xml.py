@@ -0,0 +1,167 @@
+"""Đọc hóa đơn điện tử dạng XML (HĐĐT theo định dạng của Tổng cục Thuế).
+
+Dùng iterparse để đọc theo luồng và giải phóng phần tử ngay sau khi xử lý, nên
+nhập file ZIP chứa hàng nghìn XML chỉ giới hạn bởi tốc độ đọc đĩa, không cần OCR
+hay OpenAI.
+"""
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from decimal import Decimal, InvalidOperation
+
+# Các thẻ trong TTChung (thông tin chung của hóa đơn)
+_TTCHUNG_FIELDS = {
+    'KHMSHDon': 'template',  # Ký hiệu mẫu số
+    'KHHDon': 'series',      # Ký hiệu hóa đơn
+    'SHDon': 'number',       # Số hóa đơn
+    'NLap': 'date',          # Ngày lập (YYYY-MM-DD)
+    'DVTTe': 'currency',     # Đơn vị tiền tệ
+}
+
+# Độ dài số hóa đơn khi hiển thị (giống số in trên hóa đơn, ví dụ 00000788)
+INVOICE_NUMBER_DIGITS = 8
+
+
+def _local_name(tag):
+    """Bỏ namespace khỏi tên thẻ"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _to_amount(text):
+    """Chuyển số tiền trong XML (ví dụ '1000000.00') thành chuỗi số nguyên"""
+    try:
+        return str(int(Decimal(text)))
+    except (InvalidOperation, TypeError, ValueError):
+        return ''
+
+
+def _to_decimal(text):
+    """Số lượng/đơn giá trong XML (ví dụ '2.500', '23000.00') thành chuỗi số gọn ('2.5', '23000')"""
+    try:
+        return format(Decimal(text).normalize(), 'f')
+    except (InvalidOperation, TypeError, ValueError):
+        return ''
+
+
+def _format_date(text):
+    """YYYY-MM-DD -> DD/MM/YYYY"""
+    parts = (text or '').split('T')[0].split('-')
+    if len(parts) == 3 and all(p.isdigit() for p in parts):
+        return f"{parts[2]}/{parts[1]}/{parts[0]}"
+    return text or ''
+
+
+def parse_einvoice_xml(source):
+    """Đọc một hóa đơn XML (đường dẫn hoặc file object), trả về dict thông tin hóa đơn"""
+    invoice = {'template': '', 'series': '', 'number': '', 'date': '', 'currency': '',
+               'seller': {}, 'buyer': {}, 'items': [], 'totals': {}}
+    path = []
+    item = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        tag = _local_name(elem.tag)
+        if event == 'start':
+            path.append(tag)
+            if tag == 'HHDVu':
+                item = {}
+            continue
+
+        text = (elem.text or '').strip()
+        parent = path[-2] if len(path) > 1 else ''
+        if parent == 'TTChung' and tag in _TTCHUNG_FIELDS:
+            invoice[_TTCHUNG_FIELDS[tag]] = text
+        elif parent == 'NBan' and 'NDHDon' in path:
+            # DSCKS (chữ ký số) cũng có thẻ NBan, chỉ lấy NBan trong nội dung hóa đơn
+            invoice['seller'][tag] = text
+        elif parent == 'NMua' and 'NDHDon' in path:
+            invoice['buyer'][tag] = text
+        elif parent == 'HHDVu' and item is not None:
+            item[tag] = text
+        elif parent == 'TToan':
+            invoice['totals'][tag] = text
+
+        if tag == 'HHDVu' and item is not None:
+            invoice['items'].append(item)
+            item = None
+        path.pop()
+        # Giải phóng phần tử đã đọc (kể cả chữ ký số) để bộ nhớ không tăng theo kích thước file
+        elem.clear()
+    return invoice
+
+
+def to_invoice_record(invoice, party_column):
+    """Chuyển hóa đơn XML thành bản ghi 5 cột của sheet.
+
+    party_column là 'ĐƠN VỊ XUẤT' (lấy tên người bán) hoặc 'ĐƠN VỊ NHẬN' (lấy tên người mua).
+    """
+    if party_column == 'ĐƠN VỊ NHẬN':
+        buyer = invoice['buyer']
+        # Người mua là cá nhân thì không có Ten, chỉ có họ tên người mua hàng
+        party = buyer.get('Ten') or buyer.get('HVTNMHang', '')
+    else:
+        party = invoice['seller'].get('Ten', '')
+
+    noi_dung = []
+    for index, item in enumerate(invoice['items'], start=1):
+        name = item.get('THHDVu', '')
+        if name:
+            noi_dung.append(f"{item.get('STT') or index}. {name}")
+
+    totals = invoice['totals']
+    gia_tri = _to_amount(totals.get('TgTTTBSo'))
+    if not gia_tri and totals.get('TgTCThue'):
+        # Thiếu tổng thanh toán thì cộng tiền chưa thuế và tiền thuế
+        gia_tri = _to_amount(sum(Decimal(_to_amount(totals.get(tag)) or 0) for tag in ('TgTCThue', 'TgTThue')))
+
+    number = invoice['number']
+    return {
+        'SỐ HĐ': number.zfill(INVOICE_NUMBER_DIGITS) if number.isdigit() else number,
+        'NGÀY': _format_date(invoice['date']),
+        'NỘI DUNG': '\n'.join(noi_dung),
+        party_column: party,
+        'GIÁ TRỊ SAU THUẾ': gia_tri,
+    }
+
+
+def to_invoice_items(invoice):
+    """Các dòng hàng hóa của hóa đơn XML theo cùng dạng với utils.invoice_table.extract_table"""
+    items = []
+    for index, item in enumerate(invoice['items'], start=1):
+        name = item.get('THHDVu', '')
+        if name:
+            items.append({
+                'stt': item.get('STT') or str(index),
+                'name': name,
+                'unit': item.get('DVTinh', ''),
+                'quantity': _to_decimal(item.get('SLuong')),
+                'unit_price': _to_decimal(item.get('DGia')),
+                'amount': _to_amount(item.get('ThTien')),
+            })
+    return items
+
+
+def is_einvoice_file(filename):
+    return filename.lower().endswith('.xml')
+
+
+# Lỗi của từng file trong ZIP: XML hỏng, file nén hỏng/sai CRC, kiểu nén không hỗ trợ, file có
+# mật khẩu, lỗi đọc, lỗi mã hóa ký tự
+MEMBER_ERRORS = (ET.ParseError, zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError, OSError,
+                 UnicodeDecodeError, EOFError)
+
+
+def iter_einvoice_zip(fileobj):
+    """Đọc lần lượt các file XML trong ZIP, yield (tên file, hóa đơn, lỗi).
+
+    File lỗi (xem MEMBER_ERRORS) được báo riêng, không làm dừng cả lô.
+    """
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not is_einvoice_file(info.filename):
+                continue
+            try:
+                with zf.open(info) as f:
+                    invoice = parse_einvoice_xml(f)
+            except MEMBER_ERRORS as e:
+                yield info.filename, None, str(e) or type(e).__name__
+                continue
+            yield info.filename, invoice, None
@@ -0,0 +1,60 @@
+"""Hash cảm quan của ảnh: hai ảnh trông giống nhau cho hash gần nhau (khoảng cách Hamming nhỏ).
+
+Khác với image_fingerprint của utils.ocr_cache (hash chính xác từng điểm ảnh), hash
+ở đây bỏ qua khác biệt nhỏ do nén JPEG, đổi kích thước hay nội dung chữ khác nhau
+trên cùng một mẫu trang.
+"""
+import numpy as np
+from PIL import Image, ImageOps
+
+
+def _small_gray(image, width, height):
+    gray = ImageOps.exif_transpose(image).convert('L')
+    return np.asarray(gray.resize((width, height), Image.BILINEAR), dtype=np.float32)
+
+
+def dhash(image, hash_size=8):
+    """Difference hash: so sánh độ sáng các điểm liền kề theo hàng, hash_size^2 bit"""
+    pixels = _small_gray(image, hash_size + 1, hash_size)
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(size):
+    """Ma trận DCT-II trực chuẩn size x size"""
+    k = np.arange(size)[:, np.newaxis]
+    i = np.arange(size)[np.newaxis, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+def phash(image, hash_size=8, highfreq_factor=4):
+    """Perceptual hash: dấu các hệ số DCT tần số thấp so với trung vị, hash_size^2 bit.
+
+    Bền hơn dhash với thay đổi độ sáng/độ tương phản và nhiễu nén (ảnh chụp so với PDF)
+    """
+    size = hash_size * highfreq_factor
+    pixels = _small_gray(image, size, size)
+    matrix = _dct_matrix(size)
+    low = (matrix @ pixels @ matrix.T)[:hash_size, :hash_size]
+    return _to_int(low > np.median(low))
+
+
+def _to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    """Số bit khác nhau giữa hai hash"""
+    return bin(a ^ b).count('1')
+
+
+def to_hex(value, bits):
+    return format(value, f'0{bits // 4}x')
+
+
+def from_hex(text):
+    return int(text, 16)
@@ -0,0 +1,45 @@
+"""Chọn ảnh từ file hoặc chụp bằng camera, kèm kiểm tra chất lượng trước khi OCR"""
+import streamlit as st
+
+from utils.image_quality import assess, format_report
+from utils.session_memo import session_memo, upload_key
+from utils.upload_store import open_image, upload_preview
+
+UPLOAD = "📁 Tải ảnh lên"
+CAMERA = "📷 Chụp ảnh"
+
+
+def image_input(label, key, types=('png', 'jpg', 'jpeg')):
+    """File uploader hoặc st.camera_input theo lựa chọn của người dùng, trả về file (hoặc None)"""
+    source = st.radio(f"Nguồn ảnh ({label})", [UPLOAD, CAMERA], horizontal=True,
+                      key=f"{key}_source", label_visibility="collapsed")
+    if source == CAMERA:
+        return st.camera_input(label, key=f"{key}_camera")
+    return st.file_uploader(label, type=list(types), key=key)
+
+
+def check_quality(uploaded_file, doc_type, name):
+    """Chấm chất lượng ảnh (memo theo nội dung file) và hiển thị lỗi/cảnh báo.
+
+    Trả về report của image_quality.assess; report['ok'] False nghĩa là nên chụp lại
+    thay vì OCR.
+    """
+    report = session_memo(f"quality_{name}", upload_key(uploaded_file, doc_type),
+                          lambda: assess(open_image(uploaded_file), doc_type))
+    show_quality(report)
+    return report
+
+
+def show_preview(uploaded_file, caption, name):
+    """Hiển thị ảnh xem trước nhỏ (memo theo nội dung file) thay cho ảnh gốc độ phân giải đầy đủ"""
+    preview = session_memo(f"preview_{name}", upload_key(uploaded_file), lambda: upload_preview(uploaded_file))
+    st.image(preview, caption=caption, use_container_width=True)
+
+
+def show_quality(report):
+    for level, message in report['issues']:
+        if level == 'error':
+            st.error(f"❌ {message}")
+        else:
+            st.warning(f"⚠️ {message}")
+    st.caption(f"🔎 {format_report(report)}")
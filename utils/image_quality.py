@@ -0,0 +1,106 @@
+"""Chấm điểm chất lượng ảnh trước khi OCR (mờ, lóa, độ phân giải, độ phủ thẻ).
+
+Ảnh mờ, lóa hoặc độ phân giải thấp vẫn chạy qua Tesseract (và OpenAI) nhưng chỉ
+cho ra kết quả sai mà người dùng phải gõ lại. Các phép đo ở đây chạy bằng NumPy
+trên bản thu nhỏ, mất vài chục mili giây, để từ chối hoặc cảnh báo ngay khi upload.
+"""
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils.card_detect import find_card_quad
+
+# Cạnh dài của bản thu nhỏ dùng để đo mờ và lóa
+ANALYSIS_SIDE = 1000
+
+# Phương sai Laplacian: dưới mức lỗi là quá mờ để OCR, dưới mức cảnh báo là hơi mờ
+BLUR_ERROR = 40.0
+BLUR_WARN = 100.0
+
+# Tỉ lệ điểm ảnh cháy sáng (lóa đèn/flash trên mặt thẻ ép plastic)
+GLARE_LEVEL = 250
+GLARE_ERROR = 0.15
+GLARE_WARN = 0.04
+
+# DPI hiệu dụng của tài liệu trong ảnh
+DPI_ERROR = 100
+DPI_WARN = 150
+
+# Thẻ chiếm quá ít diện tích ảnh thì chữ trên thẻ quá nhỏ
+COVERAGE_WARN = 0.3
+
+# Cạnh dài thực tế (inch): thẻ ID-1 85.6 x 54 mm, trang A4 210 x 297 mm. DPI tính bằng
+# cạnh dài trên ảnh chia cạnh dài thực tế, ảnh dọc hay ngang đều cho cùng kết quả
+DOCUMENT_LONG_SIDE_INCH = {'card': 85.6 / 25.4, 'a4': 297 / 25.4}
+
+
+def laplacian_variance(gray):
+    """Phương sai của Laplacian (4 lân cận): ảnh nét có nhiều biên mạnh nên phương sai lớn"""
+    g = gray.astype(np.float32)
+    laplacian = (g[1:-1, :-2] + g[1:-1, 2:] + g[:-2, 1:-1] + g[2:, 1:-1] - 4 * g[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def glare_ratio(gray):
+    return float((gray >= GLARE_LEVEL).mean())
+
+
+def assess(image, doc_type='card'):
+    """Đánh giá chất lượng ảnh, doc_type là 'card' (CCCD) hoặc 'a4' (hóa đơn).
+
+    Trả về dict: blur, glare, dpi, coverage (None nếu không áp dụng), issues là danh
+    sách (mức 'error'/'warning', thông báo) và ok = không có lỗi nào.
+    """
+    image = ImageOps.exif_transpose(image)
+    gray = image.convert('L')
+    scale = min(1.0, ANALYSIS_SIDE / max(gray.size))
+    small = gray.resize((round(gray.width * scale), round(gray.height * scale)), Image.BILINEAR) \
+        if scale < 1.0 else gray
+    array = np.asarray(small)
+
+    report = {'blur': None, 'glare': None, 'dpi': None, 'coverage': None, 'issues': []}
+    document_side = max(image.size)
+    if doc_type == 'card':
+        quad = find_card_quad(image)
+        if quad is not None:
+            tl, tr, br, bl = quad
+            document_side = max(np.linalg.norm(tr - tl), np.linalg.norm(bl - tl))
+            x, y = quad[:, 0], quad[:, 1]
+            area = 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+            report['coverage'] = float(area / (image.width * image.height))
+            # Đo mờ và lóa trên phần thẻ, không tính nền
+            left, top = (quad.min(axis=0) * scale).astype(int)
+            right, bottom = (quad.max(axis=0) * scale).astype(int)
+            array = array[max(top, 0):bottom, max(left, 0):right]
+
+    report['blur'] = laplacian_variance(array) if min(array.shape) > 2 else 0.0
+    report['glare'] = glare_ratio(array) if array.size else 0.0
+    report['dpi'] = int(document_side / DOCUMENT_LONG_SIDE_INCH[doc_type])
+
+    issues = report['issues']
+    if report['blur'] < BLUR_ERROR:
+        issues.append(('error', "Ảnh bị mờ, không đọc được chữ. Vui lòng chụp lại, giữ máy cố định và lấy nét vào chữ"))
+    elif report['blur'] < BLUR_WARN:
+        issues.append(('warning', "Ảnh hơi mờ, kết quả OCR có thể sai"))
+    if report['glare'] >= GLARE_ERROR:
+        issues.append(('error', "Ảnh bị lóa sáng nhiều. Vui lòng chụp lại, tắt đèn flash hoặc nghiêng ảnh để tránh phản chiếu"))
+    elif report['glare'] >= GLARE_WARN:
+        issues.append(('warning', "Một phần ảnh bị lóa sáng, có thể mất chữ ở vùng đó"))
+    if report['dpi'] < DPI_ERROR:
+        issues.append(('error', f"Độ phân giải quá thấp (~{report['dpi']} DPI). Vui lòng chụp gần hơn hoặc dùng ảnh gốc"))
+    elif report['dpi'] < DPI_WARN:
+        issues.append(('warning', f"Độ phân giải thấp (~{report['dpi']} DPI), nên chụp gần hơn"))
+    if doc_type == 'card':
+        if report['coverage'] is None:
+            issues.append(('warning', "Không tìm thấy khung thẻ trong ảnh, nên chụp thẻ trên nền tối và thấy đủ 4 góc"))
+        elif report['coverage'] < COVERAGE_WARN:
+            issues.append(('warning', "Thẻ chiếm quá ít diện tích ảnh, nên chụp gần hơn"))
+    report['ok'] = not any(level == 'error' for level, _ in issues)
+    return report
+
+
+def format_report(report):
+    """Một dòng tóm tắt các chỉ số chất lượng để hiển thị"""
+    parts = [f"Độ nét: {report['blur']:.0f}", f"Lóa: {report['glare']:.1%}", f"~{report['dpi']} DPI"]
+    if report['coverage'] is not None:
+        parts.append(f"Thẻ chiếm {report['coverage']:.0%} ảnh")
+    return " | ".join(parts)
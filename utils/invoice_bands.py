@@ -0,0 +1,81 @@
+"""OCR hóa đơn theo dải: đầu trang và khung tổng tiền trước, phần giữa chỉ khi cần.
+
+Ký hiệu, số, ngày và đơn vị bán nằm ở dải đầu trang, tổng thanh toán ở dải cuối. OCR
+hai dải này trước (song song), nếu đã đủ các trường với độ tin cậy tốt thì dừng; nếu
+không mới OCR nốt dải giữa. Ranh giới các dải đặt ở hàng trắng gần nhất để không cắt
+ngang dòng chữ, nên ba dải ghép lại đúng bằng OCR toàn trang, không OCR lặp vùng nào.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils import ocr
+
+# Vị trí mong muốn (tỉ lệ chiều cao trang) của cuối dải đầu và đầu dải cuối
+HEADER_END = 0.4
+FOOTER_START = 0.7
+
+# Khoảng tìm hàng trắng quanh vị trí mong muốn (tỉ lệ chiều cao trang)
+CUT_SEARCH = 0.05
+
+# Độ tin cậy OCR tối thiểu của các giá trị để dừng sớm
+EARLY_EXIT_CONF = 70
+
+_DARK = 128
+
+
+def find_cut(gray, target, search=CUT_SEARCH):
+    """Hàng ít điểm tối nhất (ưu tiên gần target) trong khoảng target ± search, tính theo pixel"""
+    height = gray.shape[0]
+    low = max(1, int((target - search) * height))
+    high = min(height - 1, int((target + search) * height))
+    if high <= low:
+        return int(target * height)
+    ink = (gray[low:high] < _DARK).sum(axis=1)
+    rows = np.flatnonzero(ink == ink.min()) + low
+    return int(rows[np.abs(rows - target * height).argmin()])
+
+
+def _band_words(page, top, bottom, band_index, lang, engine=None, profile=None):
+    """OCR một dải, đưa tọa độ về hệ tọa độ trang và đánh số khối riêng cho từng dải"""
+    words = ocr.image_to_data(page.crop((0, top, page.width, bottom)), lang=lang, engine=engine, profile=profile)
+    words = {column: list(values) for column, values in words.items()}
+    words['top'] = [value + top for value in words['top']]
+    words['block_num'] = [band_index * 1000 + value for value in words['block_num']]
+    return words
+
+
+def _merge(bands):
+    merged = {}
+    for words in bands:
+        for column, values in words.items():
+            merged.setdefault(column, []).extend(values)
+    return merged
+
+
+def ocr_bands(page, is_complete, lang=ocr.DEFAULT_LANG, engine=None, profile=None):
+    """OCR trang hóa đơn (đã qua ocr.prepare_image) theo dải, dừng sớm khi đủ thông tin.
+
+    is_complete(text, words) quyết định đã đủ trường chưa. Trả về (text, words, stage)
+    với stage 'header_footer' nếu dừng sớm, 'full' nếu đã OCR cả dải giữa; words theo
+    tọa độ trang và theo thứ tự đọc từ trên xuống.
+    """
+    gray = np.asarray(page.convert('L'))
+    header_end = find_cut(gray, HEADER_END)
+    footer_start = max(header_end, find_cut(gray, FOOTER_START))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        header = executor.submit(_band_words, page, 0, header_end, 0, lang, engine, profile)
+        footer = executor.submit(_band_words, page, footer_start, page.height, 2, lang, engine, profile)
+        header, footer = header.result(), footer.result()
+
+    words = _merge((header, footer))
+    text = ocr.words_to_text(words)
+    if is_complete(text, words):
+        return text, words, 'header_footer'
+
+    if footer_start > header_end:
+        middle = _band_words(page, header_end, footer_start, 1, lang, engine, profile)
+        words = _merge((header, middle, footer))
+        text = ocr.words_to_text(words)
+    return text, words, 'full'
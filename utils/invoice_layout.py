@@ -0,0 +1,66 @@
+"""Đọc các trường chính của hóa đơn GTGT theo vị trí nhãn trên word boxes OCR.
+
+Dùng utils.layout_index: chỉ mục dựng một lần cho cả tài liệu, mỗi trường là một lần
+tra nhãn ("Số (No.)", "Ngày (Date)", "Tổng cộng tiền thanh toán", ...) rồi đọc giá
+trị cùng hàng bên phải hoặc ngay bên dưới.
+"""
+import re
+
+from utils.layout_index import LayoutIndex
+
+NUMBER_LABELS = ['Số (No.)', 'Số hóa đơn', 'Invoice No', 'Số HĐ', 'No.']
+DATE_LABELS = ['Ngày (Date)', 'Ngày lập', 'Ngày hóa đơn', 'Date']
+TOTAL_LABELS = ['Tổng cộng tiền thanh toán', 'Tổng tiền thanh toán', 'Total payment', 'Tổng cộng']
+
+# Nhãn tên đơn vị bán (hóa đơn mua vào) và đơn vị mua (hóa đơn bán ra)
+PARTY_LABELS = {
+    'seller': ['Đơn vị bán hàng', 'Tên đơn vị bán', 'Tên người bán', 'Người bán', 'Seller'],
+    'buyer': ['Đơn vị mua hàng', 'Tên đơn vị mua', 'Tên người mua', 'Người mua', 'Buyer', 'Tên đơn vị'],
+}
+
+_NUMBER = r'(\d{4,})'
+# "17/01/2026" hoặc "Ngày 17 tháng 01 năm 2026"
+_DATE = r'(\d{1,2}\D{1,20}?\d{1,2}\D{1,20}?\d{4})'
+_AMOUNT = r'(\d{1,3}(?:[.,]\d{3})+|\d{4,})'
+_NAME = r'([A-Za-zÀ-ỹ].{2,})'
+
+
+def _format_date(text):
+    day, month, year = re.findall(r'\d+', text)[:3]
+    return f"{int(day):02d}/{int(month):02d}/{year}"
+
+
+def parse_region_texts(texts):
+    """Giá trị các trường từ text OCR các vùng của mẫu bố cục (utils.layout_templates).
+
+    texts: {'number', 'date', 'total', ...: text}; trả về dict number, date, total, trường
+    không đọc được để ''. Tên đơn vị lấy từ mẫu (giá trị người dùng đã xác nhận) vì vùng
+    này chỉ dùng để đối chiếu.
+    """
+    def search(field, pattern):
+        match = re.search(pattern, texts.get(field) or '')
+        return match.group(1) if match else ''
+
+    date = search('date', _DATE)
+    return {
+        'number': search('number', _NUMBER),
+        'date': _format_date(date) if date else '',
+        'total': re.sub(r'[.,]', '', search('total', _AMOUNT)),
+    }
+
+
+def parse_invoice_words(words, party='seller', min_conf=0):
+    """Trích xuất số HĐ, ngày, tên đơn vị (party: 'seller'/'buyer') và tổng thanh toán.
+
+    Trả về dict number, date, party, total; trường không tìm thấy (hoặc độ tin cậy OCR
+    dưới min_conf) để ''.
+    """
+    index = LayoutIndex(words)
+    date = index.value(DATE_LABELS, _DATE, direction='right_below', min_conf=min_conf)
+    total = index.value(TOTAL_LABELS, _AMOUNT, direction='right', min_conf=min_conf)
+    return {
+        'number': index.value(NUMBER_LABELS, _NUMBER, direction='right_below', min_conf=min_conf),
+        'date': _format_date(date) if date else '',
+        'party': index.value(PARTY_LABELS[party], _NAME, direction='right', min_conf=min_conf),
+        'total': re.sub(r'[.,]', '', total),
+    }
@@ -0,0 +1,182 @@
+"""Tách PDF chứa nhiều hóa đơn (bảng kê cả tháng của nhà cung cấp) thành từng hóa đơn.
+
+Ranh giới hóa đơn tìm bằng tín hiệu rẻ trên từng trang: lớp text của PDF nếu có, nếu
+không thì chỉ OCR dải đầu trang (ký hiệu, số, ngày) và một dải hẹp cuối trang (dấu
+"Trang 1/2") ở DPI thấp. Một trang bắt đầu hóa đơn mới khi:
+
+- có dấu "Trang 1/n" ("Page 1 of n"); dấu "Trang k/n" với k > 1 là trang tiếp theo
+- trang trước còn trang tiếp theo theo dấu "Trang k/n"
+- số hóa đơn đọc được khác số của hóa đơn đang xét
+- không có dấu trang và số hóa đơn nhưng có tiêu đề "HÓA ĐƠN GIÁ TRỊ GIA TĂNG"
+
+Sau đó từng hóa đơn được OCR đầy đủ và trích xuất song song (utils.pdf_pipeline.ocr_page_range).
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from utils import ocr
+from utils.invoice_bands import HEADER_END, find_cut
+from utils.invoice_layout import parse_invoice_words
+from utils.layout_index import normalize
+from utils.ocr_cache import get_cache, make_key
+from utils.ocr_engines import get_engine
+from utils.pdf_pipeline import OCR_WORKERS, merge_pages, ocr_images, ocr_page_range
+from utils.pdf_render import get_renderer, has_text_layer
+
+# DPI render trang khi dò ranh giới (chỉ đọc số hóa đơn và dấu trang)
+SPLIT_DPI = 150
+# Dải cuối trang chứa dấu "Trang k/n" (tỉ lệ chiều cao trang)
+MARKER_BAND = 0.1
+# Số trang render và OCR dải cùng lúc khi dò ranh giới (giới hạn bộ nhớ)
+SPLIT_CHUNK = max(2, OCR_WORKERS * 2)
+# Số hóa đơn trích xuất đồng thời (OCR thực tế chạy trong process pool, giới hạn bởi scheduler)
+EXTRACT_WORKERS = OCR_WORKERS
+
+MARKER_WORDS = ('trang', 'page')
+TITLE_LABELS = ['HÓA ĐƠN GIÁ TRỊ GIA TĂNG', 'HÓA ĐƠN BÁN HÀNG', 'VAT INVOICE']
+
+
+def _find_marker(tokens):
+    """(k, n) của dấu "Trang k/n", "Trang k trên n" hoặc "Page k of n", None nếu không có"""
+    for i, token in enumerate(tokens[:-2]):
+        if token not in MARKER_WORDS or not tokens[i + 1].isdigit():
+            continue
+        total = tokens[i + 2] if tokens[i + 2].isdigit() else (tokens[i + 3] if i + 3 < len(tokens) else '')
+        if total.isdigit() and 0 < int(tokens[i + 1]) <= int(total):
+            return int(tokens[i + 1]), int(total)
+    return None
+
+
+def _contains(tokens, label):
+    label = normalize(label)
+    return any(tokens[i:i + len(label)] == label for i in range(len(tokens) - len(label) + 1))
+
+
+def page_signals(words):
+    """Tín hiệu ranh giới của một trang: dict number, marker [k, n] hoặc None, title"""
+    tokens = normalize(ocr.words_to_text(words)) if words else []
+    marker = _find_marker(tokens)
+    return {
+        'number': parse_invoice_words(words)['number'] if tokens else '',
+        'marker': list(marker) if marker else None,
+        'title': any(_contains(tokens, label) for label in TITLE_LABELS),
+    }
+
+
+def group_pages(signals):
+    """Chia các trang thành hóa đơn theo tín hiệu, trả về [{'pages': [...], 'number': ...}]"""
+    invoices = []
+    remaining = 0
+    for page_index, signal in enumerate(signals):
+        current = invoices[-1] if invoices else None
+        marker = signal['marker']
+        if current is None:
+            new = True
+        elif marker:
+            new = marker[0] == 1
+        elif remaining > 0:
+            new = False
+        elif signal['number'] and current['number']:
+            new = signal['number'] != current['number']
+        else:
+            new = signal['title']
+        if new:
+            current = {'pages': [], 'number': ''}
+            invoices.append(current)
+        current['pages'].append(page_index)
+        current['number'] = current['number'] or signal['number']
+        remaining = marker[1] - marker[0] if marker else max(0, remaining - 1)
+    return invoices
+
+
+def _band_images(image):
+    """Dải đầu trang (cắt ở hàng trắng) và dải dấu trang cuối trang, kèm vị trí top của từng dải"""
+    gray = image.convert('L')
+    header_end = find_cut(np.asarray(gray), HEADER_END)
+    marker_top = int(gray.height * (1 - MARKER_BAND))
+    return [(gray.crop((0, 0, gray.width, header_end)), 0),
+            (gray.crop((0, marker_top, gray.width, gray.height)), marker_top)]
+
+
+def _scan_signals(renderer, page_indices, lang, engine, profile):
+    """Tín hiệu các trang scan: OCR song song dải đầu và dải cuối của cả nhóm trang"""
+    bands = []
+    for page_index in page_indices:
+        image = renderer.render_page(page_index, SPLIT_DPI)
+        bands.append(_band_images(image) if image is not None else [])
+    results = iter(ocr_images([band for page in bands for band, _ in page], lang, engine, profile))
+    signals = []
+    for page in bands:
+        merged = {}
+        for _, top in page:
+            words = next(results)
+            for column, values in words.items():
+                if column == 'top':
+                    values = [value + top for value in values]
+                merged.setdefault(column, []).extend(values)
+        signals.append(page_signals(merged))
+    return signals
+
+
+def split_pdf(pdf_bytes, lang=ocr.DEFAULT_LANG, engine=None, profile=None, on_page=None):
+    """Dò ranh giới hóa đơn trong PDF, trả về dict page_count, signals, invoices (xem group_pages).
+
+    on_page(so_trang_xong, tong_so_trang) được gọi sau mỗi nhóm trang (trên thread gọi hàm).
+    """
+    cache = get_cache()
+    key = make_key(pdf_bytes, kind='invoice_split', dpi=SPLIT_DPI, marker_band=MARKER_BAND, lang=lang,
+                   engine=get_engine(engine).name, profile=profile)
+    signals = cache.get_words(key)
+    if signals is None:
+        signals = []
+        with get_renderer(pdf_bytes) as renderer:
+            page_count = renderer.page_count()
+            # PDF một trang: không cần dò ranh giới
+            starts = range(0, page_count, SPLIT_CHUNK) if page_count > 1 else []
+            if page_count == 1:
+                signals.append(page_signals({}))
+            for start in starts:
+                chunk = range(start, min(page_count, start + SPLIT_CHUNK))
+                text_pages = {page_index: renderer.extract_words(page_index, SPLIT_DPI) for page_index in chunk}
+                scan_pages = [page_index for page_index in chunk if not has_text_layer(text_pages[page_index])]
+                scanned = dict(zip(scan_pages, _scan_signals(renderer, scan_pages, lang, engine, profile)))
+                signals.extend(scanned[page_index] if page_index in scanned else page_signals(text_pages[page_index])
+                               for page_index in chunk)
+                if on_page:
+                    on_page(chunk.stop, page_count)
+        cache.put_words(key, signals)
+    return {'page_count': len(signals), 'signals': signals, 'invoices': group_pages(signals)}
+
+
+def _extract_invoice(pdf_bytes, invoice, extract, dpi, lang, dpi_mode, engine, profile):
+    document = ocr_page_range(pdf_bytes, invoice['pages'], dpi=dpi, lang=lang, dpi_mode=dpi_mode,
+                              engine=engine, profile=profile)
+    text = '\n\n'.join(ocr.words_to_text(words) for words in document['pages'])
+    source = 'text' if set(document['sources']) == {'text'} else 'ocr'
+    return extract(text, merge_pages(document['pages']), source)
+
+
+def extract_invoices(pdf_bytes, invoices, extract, dpi=200, lang=ocr.DEFAULT_LANG, dpi_mode='fixed', engine=None,
+                     profile=None, on_invoice=None):
+    """OCR và trích xuất song song từng hóa đơn đã tách.
+
+    extract(text, words, source) trả về kết quả của một hóa đơn (source 'text' nếu mọi trang
+    đọc từ lớp text); hàm chạy trên thread phụ nên không được gọi st.*. Trả về danh sách
+    {'pages', 'result', 'error'} theo thứ tự hóa đơn. on_invoice(so_hoa_don_xong, tong_so,
+    vi_tri) được gọi trên thread gọi hàm mỗi khi một hóa đơn xong.
+    """
+    results = [{'pages': invoice['pages'], 'result': None, 'error': None} for invoice in invoices]
+    with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as executor:
+        futures = {executor.submit(_extract_invoice, pdf_bytes, invoice, extract, dpi, lang, dpi_mode, engine,
+                                   profile): position
+                   for position, invoice in enumerate(invoices)}
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            position = futures[future]
+            try:
+                results[position]['result'] = future.result()
+            except Exception as e:
+                results[position]['error'] = str(e)
+            if on_invoice:
+                on_invoice(done_count, len(invoices), position)
+    return results
@@ -0,0 +1,256 @@
+"""Tách bảng hàng hóa, dịch vụ của hóa đơn thành các dòng có cấu trúc.
+
+Dòng tiêu đề bảng ("STT", "Tên hàng hóa, dịch vụ", "Đơn vị tính", "Số lượng",
+"Đơn giá", "Thành tiền") được tìm trên word boxes; bảng kéo dài đến dòng "Cộng tiền
+hàng"/"Tổng cộng". Có đường kẻ bảng (kẻ dọc và kẻ ngang) thì cắt từng ô theo lưới và
+OCR các ô song song với cấu hình riêng cho cột chữ và cột số; không có thì gán các từ
+đã OCR vào cột theo vị trí tiêu đề và gom dòng theo tọa độ dọc.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils import ocr
+from utils.layout_index import LayoutIndex, same_row
+
+# Nhãn tiêu đề các cột (so khớp không dấu)
+COLUMN_LABELS = {
+    'stt': ['STT', 'No.'],
+    'name': ['Tên hàng hóa', 'Tên hàng', 'Description'],
+    'unit': ['Đơn vị tính', 'ĐVT', 'Đơn vị', 'Unit'],
+    'quantity': ['Số lượng', 'Quantity'],
+    'unit_price': ['Đơn giá', 'Unit price'],
+    'amount': ['Thành tiền', 'Amount'],
+}
+COLUMNS = tuple(COLUMN_LABELS)
+NUMERIC_COLUMNS = ('stt', 'quantity', 'unit_price', 'amount')
+
+# Nhãn ngay dưới bảng hàng hóa
+END_LABELS = ['Cộng tiền hàng', 'Tổng cộng', 'Tổng tiền', 'Thuế suất', 'Total']
+
+# Cột kẻ dọc/hàng kẻ ngang: tỉ lệ điểm tối tối thiểu theo chiều cao/chiều rộng vùng bảng
+VERTICAL_RULE_RATIO = 0.7
+HORIZONTAL_RULE_RATIO = 0.6
+
+# Số thread OCR các ô (số job Tesseract thực sự chạy do ocr_scheduler giới hạn)
+CELL_WORKERS = 6
+
+# Tên cột của sheet chi tiết (HD_MV_CT, HD_BR_CT)
+ITEM_HEADERS = ['SỐ HĐ', 'NGÀY', 'STT', 'TÊN HÀNG HÓA, DỊCH VỤ', 'ĐVT', 'SỐ LƯỢNG', 'ĐƠN GIÁ', 'THÀNH TIỀN']
+# Tên hiển thị của các trường dòng hàng hóa
+ITEM_COLUMNS = dict(zip(COLUMNS, ITEM_HEADERS[2:]))
+
+_CELL_CONFIG = {
+    'name': '--psm 6',
+    'unit': '--psm 7',
+}
+_NUMBER_CONFIG = '--psm 7 -c tessedit_char_whitelist=0123456789.,'
+_DARK = 128
+
+
+def to_number(text):
+    """Số tiền/số lượng OCR ("1.100.000", "1,100,000", "1.100.000,50", "23000.00", "2,5") -> chuỗi số
+    ("1100000", "1100000.5", "23000", "2.5"), '' nếu không phải số.
+
+    Dấu chấm hay dấu phẩy đứng trước đúng 3 chữ số là dấu phân cách hàng nghìn; chỉ dấu cuối
+    cùng theo sau bởi 1-2 chữ số mới là dấu thập phân.
+    """
+    text = re.sub(r'[^\d.,]', '', text or '').strip('.,')
+    if not re.search(r'\d', text):
+        return ''
+    match = re.fullmatch(r'(.*?)[.,](\d{1,2})', text)
+    integer, fraction = (match.group(1), match.group(2)) if match else (text, '')
+    integer = re.sub(r'[.,]', '', integer) or '0'
+    fraction = fraction.rstrip('0')
+    return f"{integer}.{fraction}" if fraction else integer
+
+
+def find_header(index, page):
+    """Vị trí tiêu đề bảng trên trang: ({cột: (left, right)}, đáy dòng tiêu đề) hoặc None"""
+    for name_label in (label for text in COLUMN_LABELS['name'] for label in index.find(text)):
+        if name_label.page != page:
+            continue
+        # Tiêu đề có thể xuống dòng trong ô: các nhãn khác chỉ cần nằm gần cùng độ cao
+        tolerance = 2 * (name_label.bottom - name_label.top)
+        columns = {'name': (name_label.left, name_label.right)}
+        bottom = name_label.bottom
+        for column, texts in COLUMN_LABELS.items():
+            if column == 'name':
+                continue
+            for label in (label for text in texts for label in index.find(text)):
+                if label.page == page and abs(label.top - name_label.top) <= tolerance:
+                    columns[column] = (label.left, label.right)
+                    bottom = max(bottom, label.bottom)
+                    break
+        # Cần thêm ít nhất hai cột (ví dụ số lượng và thành tiền) mới coi là bảng hàng hóa
+        if len(columns) >= 3:
+            return columns, bottom
+    return None
+
+
+def find_end(index, page, top):
+    """Đỉnh của dòng kết thúc bảng (Cộng tiền hàng, Tổng cộng...) nằm dưới top, None nếu không thấy"""
+    ends = [label.top for text in END_LABELS for label in index.find(text) if label.page == page and label.top > top]
+    return min(ends) if ends else None
+
+
+def column_bounds(columns, width):
+    """Ranh giới cột theo điểm giữa của các nhãn tiêu đề liền kề: [(cột, left, right)]"""
+    ordered = sorted(columns.items(), key=lambda item: (item[1][0] + item[1][1]) / 2)
+    centers = [(left + right) / 2 for _, (left, right) in ordered]
+    bounds = []
+    for i, (column, _) in enumerate(ordered):
+        left = 0 if i == 0 else (centers[i - 1] + centers[i]) / 2
+        right = width if i == len(ordered) - 1 else (centers[i] + centers[i + 1]) / 2
+        bounds.append((column, left, right))
+    return bounds
+
+
+def _rule_positions(profile, threshold):
+    """Vị trí (tâm) các đường kẻ: các đoạn liên tiếp có tỉ lệ điểm tối vượt ngưỡng"""
+    positions = []
+    run = []
+    for i, is_rule in enumerate(profile >= threshold):
+        if is_rule:
+            run.append(i)
+        elif run:
+            positions.append(sum(run) // len(run))
+            run = []
+    if run:
+        positions.append(sum(run) // len(run))
+    return positions
+
+
+def find_rules(page, box):
+    """Đường kẻ dọc và ngang trong vùng box = (left, top, right, bottom), tọa độ trang"""
+    left, top, right, bottom = box
+    dark = np.asarray(page.convert('L').crop(box)) < _DARK
+    if not dark.size:
+        return [], []
+    vertical = [left + x for x in _rule_positions(dark.mean(axis=0), VERTICAL_RULE_RATIO)]
+    horizontal = [top + y for y in _rule_positions(dark.mean(axis=1), HORIZONTAL_RULE_RATIO)]
+    return vertical, horizontal
+
+
+def _assemble(rows):
+    """Gộp các hàng ô ({cột: text}) thành dòng hàng hóa: hàng không có STT và không có
+    thành tiền là phần xuống dòng của tên hàng ở dòng trước"""
+    items = []
+    for cells in rows:
+        cells = {column: ' '.join((cells.get(column) or '').split()) for column in COLUMNS}
+        stt = to_number(cells['stt'])
+        starts_item = bool(stt) or bool(to_number(cells['amount']))
+        if not starts_item and items and cells['name']:
+            items[-1]['name'] = f"{items[-1]['name']} {cells['name']}"
+            continue
+        # Bỏ hàng đánh số cột (1, 2, 3, ..., 6 = 4 x 5) và hàng không có tên hàng
+        if not re.search(r'[A-Za-zÀ-ỹ]{2}', cells['name']):
+            continue
+        items.append({
+            'stt': stt or str(len(items) + 1),
+            'name': cells['name'].strip(' .-|'),
+            'unit': cells['unit'].strip(' .-|'),
+            'quantity': to_number(cells['quantity']),
+            'unit_price': to_number(cells['unit_price']),
+            'amount': to_number(cells['amount']),
+        })
+    return items
+
+
+def _cells_from_words(index, page, bounds, top, bottom):
+    """Gom các từ trong vùng bảng thành hàng theo tọa độ dọc, mỗi từ vào cột chứa tâm của nó"""
+    words = sorted((word for word in index.words if word.page == page and top <= (word.top + word.bottom) / 2 <= bottom),
+                   key=lambda word: word.top)
+    rows = []
+    for word in words:
+        if not rows or not same_row(word, rows[-1][0].top, rows[-1][0].bottom):
+            rows.append([word])
+        else:
+            rows[-1].append(word)
+    cell_rows = []
+    for row in rows:
+        cells = {}
+        for word in sorted(row, key=lambda word: word.left):
+            center = (word.left + word.right) / 2
+            column = next((name for name, left, right in bounds if left <= center < right), None)
+            if column is not None:
+                cells[column] = f"{cells.get(column, '')} {word.text}"
+        cell_rows.append(cells)
+    return cell_rows
+
+
+def _ocr_cell(page, column, box, lang, engine=None, profile=None):
+    config = _NUMBER_CONFIG if column in NUMERIC_COLUMNS else _CELL_CONFIG[column]
+    return ocr.image_to_string(page.crop(box), lang='eng' if column in NUMERIC_COLUMNS else lang,
+                               config=config, engine=engine, profile=profile)
+
+
+def _cells_from_grid(page, bounds, vertical, horizontal, lang, engine=None, profile=None):
+    """OCR song song từng ô của lưới kẻ bảng; cột của ô là cột tiêu đề có tâm nằm trong ô"""
+    jobs = []
+    for row_index, (top, bottom) in enumerate(zip(horizontal, horizontal[1:])):
+        for left, right in zip(vertical, vertical[1:]):
+            center = (left + right) / 2
+            column = next((name for name, b_left, b_right in bounds if b_left <= center < b_right), None)
+            if column is not None and bottom - top > 4 and right - left > 4:
+                # Cắt vào trong ô một chút để không dính đường kẻ
+                jobs.append((row_index, column, (left + 2, top + 2, right - 2, bottom - 2)))
+    with ThreadPoolExecutor(max_workers=CELL_WORKERS) as executor:
+        texts = list(executor.map(lambda job: _ocr_cell(page, job[1], job[2], lang, engine, profile), jobs))
+    rows = [{} for _ in range(max(len(horizontal) - 1, 0))]
+    for (row_index, column, _), text in zip(jobs, texts):
+        rows[row_index][column] = f"{rows[row_index].get(column, '')} {text}"
+    return rows
+
+
+def extract_table(words, page=None, ocr_region=False, lang=ocr.DEFAULT_LANG, engine=None, profile=None):
+    """Tách bảng hàng hóa thành danh sách dòng {stt, name, unit, quantity, unit_price, amount}.
+
+    words là word boxes của tài liệu (có thể nhiều trang); page là ảnh trang đã OCR (cùng
+    hệ tọa độ với words, chỉ với tài liệu một trang) để tìm đường kẻ và OCR theo ô.
+    ocr_region=True khi words chưa có phần giữa trang (OCR dừng sớm ở utils.invoice_bands):
+    vùng bảng được OCR riêng nếu không cắt được theo lưới.
+    """
+    index = LayoutIndex(words)
+    items = []
+    for page_num in sorted(set(index.by_top)):
+        header = find_header(index, page_num)
+        if header is None:
+            continue
+        columns, top = header
+        bottom = find_end(index, page_num, top)
+        width = max(word.right for word in index.words if word.page == page_num)
+        if page is not None:
+            width = page.width
+            bottom = bottom if bottom is not None else page.height
+        elif bottom is None:
+            bottom = max(word.bottom for word in index.words if word.page == page_num)
+        bounds = column_bounds(columns, width)
+
+        rows = None
+        if page is not None:
+            vertical, horizontal = find_rules(page, (0, int(top), page.width, int(bottom)))
+            # Lưới đủ để cắt ô: có kẻ dọc giữa các cột và ít nhất một dòng được kẻ ngang
+            if len(vertical) >= len(columns) and len(horizontal) >= 2:
+                rows = _cells_from_grid(page, bounds, vertical, horizontal, lang, engine, profile)
+            elif ocr_region:
+                region = ocr.image_to_data(page.crop((0, int(top), page.width, int(bottom))), lang=lang,
+                                           engine=engine, profile=profile)
+                region_index = LayoutIndex({**region, 'top': [value + int(top) for value in region['top']]})
+                rows = _cells_from_words(region_index, page_num, bounds, top, bottom)
+        if rows is None:
+            rows = _cells_from_words(index, page_num, bounds, top, bottom)
+        items.extend(_assemble(rows))
+    return items
+
+
+def items_to_content(items):
+    """Cột NỘI DUNG của sheet chính: "STT. Tên hàng" mỗi dòng"""
+    return '\n'.join(f"{item['stt']}. {item['name']}" for item in items)
+
+
+def to_detail_rows(number, date, items):
+    """Các dòng của sheet chi tiết cho một hóa đơn"""
+    return [{'SỐ HĐ': number, 'NGÀY': date, **{ITEM_COLUMNS[column]: item.get(column, '') for column in COLUMNS}}
+            for item in items]
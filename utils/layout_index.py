@@ -0,0 +1,263 @@
+"""Tra cứu cặp nhãn - giá trị theo vị trí trên word boxes của Tesseract (image_to_data).
+
+Regex trên text đã làm phẳng phải đoán giá trị nằm "trong 50 ký tự sau nhãn", dễ
+lấy nhầm khi Tesseract đọc hai cột thành hai khối. Ở đây chỉ mục được dựng một lần
+cho mỗi tài liệu: từ khóa (bỏ dấu, chữ thường) -> vị trí trong dòng, và các từ của
+mỗi trang sắp theo tọa độ dọc. Mỗi trường chỉ cần tìm nhãn rồi đọc các từ cùng hàng
+bên phải hoặc các dòng ngay bên dưới nhãn.
+"""
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+
+Word = namedtuple('Word', 'page left top right bottom text conf')
+
+# Nhãn tìm thấy: trang, khung bao các từ của nhãn
+Label = namedtuple('Label', 'page left top right bottom')
+
+# Hai từ cùng hàng khi phần chồng lấn theo chiều dọc >= tỉ lệ này của từ thấp hơn
+ROW_OVERLAP = 0.5
+
+# Khoảng trống ngang tối đa (tính theo chiều cao dòng) giữa các từ của cùng một giá trị
+MAX_GAP = 4.0
+
+# Khi tìm lại giá trị: số token xen giữa tối đa ("17/01/2026" khớp "17 tháng (month) 01 năm (year) 2026")
+MAX_SKIP = 3
+
+_SPLIT = re.compile(r'[^0-9a-z]+')
+# Nhãn tiếng Anh đi kèm nhãn tiếng Việt: "(Seller):" hoặc "/ Date of birth:"
+_ALIAS = re.compile(r'^[\s:]*(?:/?\s*\([^)]*\)|/\s*[A-Za-z][A-Za-z .,]*:)\s*:?')
+
+
+def normalize(text):
+    """Bỏ dấu, chữ thường, tách thành các từ khóa chỉ gồm chữ cái và chữ số"""
+    text = unicodedata.normalize('NFD', str(text).replace('Đ', 'D').replace('đ', 'd'))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return [token for token in _SPLIT.split(text) if token]
+
+
+def _overlap(top, bottom, other_top, other_bottom):
+    return min(bottom, other_bottom) - max(top, other_top)
+
+
+def _join(rows):
+    return '\n'.join(' '.join(word.text for word in row) for row in rows if row)
+
+
+def _value_conf(rows, value):
+    """Độ tin cậy OCR thấp nhất của các từ tạo nên value"""
+    tokens = set(normalize(value))
+    confs = [word.conf for row in rows for word in row if tokens.intersection(normalize(word.text))]
+    return min(confs) if confs else 0.0
+
+
+def same_row(word, top, bottom):
+    """Word nằm cùng hàng với dải [top, bottom]: chồng lên ít nhất ROW_OVERLAP chiều cao nhỏ hơn"""
+    height = min(word.bottom - word.top, bottom - top)
+    return height > 0 and _overlap(word.top, word.bottom, top, bottom) >= ROW_OVERLAP * height
+
+
+class LayoutIndex:
+    """Chỉ mục word boxes của một tài liệu (dict các cột image_to_data, có thể nhiều trang)"""
+
+    def __init__(self, words):
+        self.words = []
+        # Chuỗi từ khóa theo thứ tự đọc của từng dòng Tesseract: [(token, chỉ số từ)]
+        self.lines = []
+        # token -> [(chỉ số dòng, vị trí trong dòng)]
+        self.tokens = defaultdict(list)
+        # trang -> chỉ số các từ sắp theo top, và danh sách top tương ứng để bisect
+        self.by_top = defaultdict(list)
+        self.tops = {}
+
+        line_of = {}
+        texts = words.get('text', []) if words else []
+        for i, text in enumerate(texts):
+            if not text or not str(text).strip():
+                continue
+            conf = float(words['conf'][i]) if 'conf' in words else 100.0
+            word = Word(words['page_num'][i], words['left'][i], words['top'][i],
+                        words['left'][i] + words['width'][i], words['top'][i] + words['height'][i],
+                        str(text).strip(), conf)
+            index = len(self.words)
+            self.words.append(word)
+            line_key = (words['page_num'][i], words['block_num'][i], words['par_num'][i], words['line_num'][i])
+            if line_key not in line_of:
+                line_of[line_key] = len(self.lines)
+                self.lines.append([])
+            line = self.lines[line_of[line_key]]
+            for token in normalize(text):
+                self.tokens[token].append((line_of[line_key], len(line)))
+                line.append((token, index))
+            self.by_top[word.page].append(index)
+
+        for page, indices in self.by_top.items():
+            indices.sort(key=lambda index: self.words[index].top)
+            self.tops[page] = [self.words[index].top for index in indices]
+
+        heights = sorted(word.bottom - word.top for word in self.words)
+        # Chiều cao dòng điển hình (trung vị chiều cao các từ)
+        self.line_height = heights[len(heights) // 2] if heights else 0
+
+    def find(self, label):
+        """Các vị trí của nhãn (cụm từ, so khớp sau khi bỏ dấu), theo thứ tự đọc"""
+        wanted = normalize(label)
+        if not wanted:
+            return []
+        found = []
+        for line_index, position in self.tokens.get(wanted[0], ()):
+            line = self.lines[line_index]
+            if [token for token, _ in line[position:position + len(wanted)]] != wanted:
+                continue
+            matched = [self.words[index] for _, index in line[position:position + len(wanted)]]
+            found.append(Label(matched[0].page, min(w.left for w in matched), min(w.top for w in matched),
+                               max(w.right for w in matched), max(w.bottom for w in matched)))
+        return found
+
+    def _box(self, indices):
+        matched = [self.words[index] for index in indices]
+        return Label(matched[0].page, min(w.left for w in matched), min(w.top for w in matched),
+                     max(w.right for w in matched), max(w.bottom for w in matched))
+
+    def _locate_line(self, tokens):
+        """Khung các từ của dòng Tesseract đầu tiên chứa chuỗi token.
+
+        Thử khớp liền (bỏ qua dấu phân cách giữa các token) trên mọi dòng trước, sau đó mới
+        cho phép tối đa MAX_SKIP token xen giữa hai token liên tiếp.
+        """
+        compact = ''.join(tokens)
+        for line in self.lines:
+            line_compact = ''.join(token for token, _ in line)
+            start = line_compact.find(compact)
+            if start < 0:
+                continue
+            # Các token của dòng phủ lên đoạn [start, start + len(compact))
+            position = 0
+            indices = []
+            for token, index in line:
+                if position < start + len(compact) and position + len(token) > start:
+                    indices.append(index)
+                position += len(token)
+            return self._box(indices)
+        for line in self.lines:
+            line_tokens = [token for token, _ in line]
+            for first in (i for i, token in enumerate(line_tokens) if token == tokens[0]):
+                positions = [first]
+                for token in tokens[1:]:
+                    window = line_tokens[positions[-1] + 1:positions[-1] + 2 + MAX_SKIP]
+                    if token not in window:
+                        break
+                    positions.append(positions[-1] + 1 + window.index(token))
+                if len(positions) == len(tokens):
+                    return self._box([line[i][1] for i in positions])
+        return None
+
+    def locate(self, value):
+        """Khung bao của một giá trị trên trang (so khớp không dấu), None nếu không tìm thấy.
+
+        Giá trị nhiều dòng được tìm từng dòng rồi gộp khung (chỉ các dòng cùng trang với dòng
+        đầu tiên tìm thấy). Chữ số so khớp bỏ qua dấu phân cách: "1100000" khớp "1.100.000".
+        """
+        boxes = [box for box in (self._locate_line(normalize(part)) for part in str(value).splitlines()
+                                 if normalize(part)) if box is not None]
+        if not boxes:
+            return None
+        boxes = [box for box in boxes if box.page == boxes[0].page]
+        return Label(boxes[0].page, min(b.left for b in boxes), min(b.top for b in boxes),
+                     max(b.right for b in boxes), max(b.bottom for b in boxes))
+
+    def _band(self, page, top, bottom):
+        """Chỉ số các từ của trang có top trong [top, bottom]"""
+        tops = self.tops.get(page, [])
+        indices = self.by_top.get(page, [])
+        return indices[bisect_left(tops, top):bisect_right(tops, bottom)]
+
+    def _row_words(self, page, left, top, bottom):
+        """Các từ cùng hàng với khung [top, bottom], bắt đầu từ left, dừng ở khoảng trống lớn"""
+        height = bottom - top
+        candidates = sorted((self.words[i] for i in self._band(page, top - height, bottom)
+                             if self.words[i].right > left and same_row(self.words[i], top, bottom)),
+                            key=lambda word: word.left)
+        row = []
+        edge = left
+        for word in candidates:
+            if word.left < edge - height:
+                # Từ chồng lên nhãn (cùng một nhãn dài): bỏ qua
+                continue
+            if row and word.left - edge > MAX_GAP * height:
+                break
+            row.append(word)
+            edge = max(edge, word.right)
+        return row
+
+    def right_of(self, label):
+        """Text cùng hàng bên phải nhãn"""
+        return _join([self._row_words(label.page, label.right, label.top, label.bottom)])
+
+    def _cluster(self, anchor):
+        """Các từ cùng hàng với anchor, nối liền với anchor về hai phía (không qua khoảng trống lớn)"""
+        height = anchor.bottom - anchor.top
+        row = sorted((self.words[i] for i in self._band(anchor.page, anchor.top - height, anchor.bottom)
+                      if same_row(self.words[i], anchor.top, anchor.bottom)),
+                     key=lambda word: word.left)
+        start = end = row.index(anchor)
+        while start > 0 and row[start].left - row[start - 1].right <= MAX_GAP * height:
+            start -= 1
+        while end < len(row) - 1 and row[end + 1].left - row[end].right <= MAX_GAP * height:
+            end += 1
+        return row[start:end + 1]
+
+    def below(self, label, lines=1):
+        """Text của tối đa lines hàng ngay dưới nhãn (cụm từ chồng lên cột của nhãn)"""
+        return _join(self._below_rows(label, lines))
+
+    def _below_rows(self, label, lines):
+        height = label.bottom - label.top
+        rows = []
+        top = label.bottom
+        for _ in range(lines):
+            # Hàng tiếp theo: từ cao nhất nằm dưới nhãn và chồng lên cột của nhãn
+            below = [self.words[i] for i in self._band(label.page, top - height / 2, top + 4 * height)
+                     if self.words[i].top >= top - height / 2
+                     and self.words[i].right > label.left and self.words[i].left < label.right]
+            if not below:
+                break
+            words = self._cluster(min(below, key=lambda word: word.top))
+            rows.append(words)
+            top = max(word.bottom for word in words)
+        return rows
+
+    def value(self, labels, pattern=None, direction='right', lines=1, min_conf=0):
+        """Giá trị của trường theo nhãn đầu tiên tìm thấy (labels là chuỗi hoặc danh sách nhãn thay thế).
+
+        direction: 'right' (cùng hàng), 'below' (lines hàng dưới) hoặc 'right_below' (phần
+        cùng hàng nối tiếp lines - 1 hàng dưới; bên phải trống thì lấy lines hàng dưới).
+        pattern (regex) lọc giá trị: lấy nhóm 1 nếu có, nếu không lấy cả phần khớp.
+        min_conf: bỏ qua giá trị có từ nào độ tin cậy OCR thấp hơn mức này.
+        Trả về '' nếu không tìm thấy.
+        """
+        if isinstance(labels, str):
+            labels = [labels]
+        for label_text in labels:
+            for label in self.find(label_text):
+                if direction == 'right':
+                    rows = [self._row_words(label.page, label.right, label.top, label.bottom)]
+                elif direction == 'below':
+                    rows = self._below_rows(label, lines)
+                else:
+                    # Giá trị bắt đầu bên phải nhãn và có thể xuống dòng; bên phải trống thì đọc ở dưới
+                    right = self._row_words(label.page, label.right, label.top, label.bottom)
+                    rows = [right] + self._below_rows(label, lines - 1) if right else self._below_rows(label, lines)
+                text = _ALIAS.sub('', _join(rows)).strip(' :.-|/')
+                if not text:
+                    continue
+                if pattern is not None:
+                    match = re.search(pattern, text, re.IGNORECASE)
+                    if not match:
+                        continue
+                    text = (match.group(1) if match.re.groups else match.group(0)).strip()
+                if min_conf and _value_conf(rows, text) < min_conf:
+                    continue
+                return text
+        return ''
@@ -0,0 +1,220 @@
+"""Mẫu bố cục học được cho hóa đơn của các nhà cung cấp quen thuộc.
+
+Khi người dùng xác nhận (lưu) một hóa đơn đã OCR toàn trang, vị trí của từng giá trị
+trên trang được tìm lại trong word boxes và lưu thành mẫu, gắn với hash cảm quan
+của phần đầu trang (logo, khối thông tin người bán ít thay đổi giữa các hóa đơn).
+Hóa đơn sau có đầu trang giống mẫu chỉ cần OCR các vùng đã lưu; giá trị của trường
+neo (tên đơn vị) phải khớp với mẫu thì mới dùng kết quả, nếu không thì OCR toàn
+trang như bình thường. Số lần dùng được/không dùng được của từng mẫu được ghi lại.
+
+Mẫu lưu trong file JSON (TEMPLATES_FILE), tọa độ vùng theo tỉ lệ 0..1 của trang.
+"""
+import difflib
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils import ocr
+from utils.image_hash import dhash, from_hex, hamming, to_hex
+from utils.layout_index import LayoutIndex, normalize
+
+TEMPLATES_FILE = os.environ.get("INVOICE_TEMPLATES_FILE", "invoice_templates.json")
+
+# Hash 16x16 bit của phần đầu trang (HEADER_RATIO chiều cao)
+HASH_SIZE = 16
+HEADER_RATIO = 0.4
+
+# Khoảng cách Hamming tối đa (trên HASH_SIZE^2 bit) để coi là cùng mẫu
+MAX_DISTANCE = 40
+
+# Tỉ lệ cạnh trang phải gần như nhau
+ASPECT_TOLERANCE = 0.03
+
+# Tỉ lệ tối thiểu ký tự của giá trị trường neo trong mẫu đọc lại được ở vùng neo (so khớp không dấu)
+ANCHOR_SIMILARITY = 0.8
+
+# Lề thêm quanh vùng giá trị (theo chiều cao dòng) để chịu được lệch nhỏ giữa các hóa đơn
+MARGIN_LINES = 1.0
+
+# Số thread OCR các vùng (số job Tesseract thực sự chạy do ocr_scheduler giới hạn)
+REGION_WORKERS = 4
+
+# Vùng bảng hàng hóa theo mẫu: vùng nội dung nới lên trên (tỉ lệ chiều cao trang) để có cả dòng tiêu đề bảng
+TABLE_HEADER_MARGIN = 0.08
+
+
+def layout_hash(page):
+    """Hash cảm quan phần đầu trang (dạng hex)"""
+    header = page.crop((0, 0, page.width, max(1, int(page.height * HEADER_RATIO))))
+    return to_hex(dhash(header, HASH_SIZE), HASH_SIZE * HASH_SIZE)
+
+
+def page_layout(page, words):
+    """Thông tin bố cục của trang đã OCR toàn trang, đủ để học mẫu khi người dùng xác nhận"""
+    return {'hash': layout_hash(page), 'aspect': page.width / page.height, 'size': page.size, 'words': words}
+
+
+def _coverage(text, value):
+    """Tỉ lệ ký tự (không dấu) của value xuất hiện theo thứ tự trong text"""
+    value = ' '.join(normalize(value))
+    if not value:
+        return 0.0
+    matcher = difflib.SequenceMatcher(None, ' '.join(normalize(text)), value, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / len(value)
+
+
+class TemplateStore:
+    """Kho mẫu bố cục theo loại chứng từ (kind, ví dụ tên sheet HD_MV)"""
+
+    def __init__(self, path=TEMPLATES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._templates = None
+
+    def _load(self):
+        if self._templates is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._templates = json.load(f)
+            except (OSError, ValueError):
+                self._templates = []
+        return self._templates
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._templates, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Mẫu chỉ để tăng tốc, lỗi ghi không được làm hỏng luồng xử lý chính
+            pass
+
+    def candidates(self, kind, page):
+        """Các mẫu cùng loại có đầu trang giống page, gần nhất trước"""
+        page_hash = from_hex(layout_hash(page))
+        aspect = page.width / page.height
+        with self._lock:
+            templates = [t for t in self._load() if t['kind'] == kind
+                         and abs(t['aspect'] - aspect) <= ASPECT_TOLERANCE * aspect]
+        scored = [(hamming(page_hash, from_hex(t['hash'])), t) for t in templates]
+        return [t for distance, t in sorted(scored, key=lambda item: item[0]) if distance <= MAX_DISTANCE]
+
+    def learn(self, kind, layout, values, anchor, stretch=None):
+        """Tạo/cập nhật mẫu từ hóa đơn đã xác nhận.
+
+        layout là kết quả page_layout của trang đã OCR; values: {tên trường: giá trị người
+        dùng đã xác nhận}; anchor là tên trường dùng để đối chiếu khi áp mẫu. stretch
+        {trường: trường khác} kéo dài vùng xuống sát vùng của trường khác và sang hết mép
+        phải trang (bảng hàng hóa dài ngắn khác nhau giữa các hóa đơn). Trả về mẫu, hoặc None nếu không tìm lại
+        được vị trí trường neo trên trang.
+        """
+        width, height = layout['size']
+        index = LayoutIndex(layout['words'])
+        margin = MARGIN_LINES * index.line_height
+        regions = {}
+        for field, value in values.items():
+            box = index.locate(value) if value else None
+            if box is not None:
+                regions[field] = [max(0.0, (box.left - margin) / width), max(0.0, (box.top - margin) / height),
+                                  min(1.0, (box.right + margin) / width), min(1.0, (box.bottom + margin) / height)]
+        if anchor not in regions:
+            return None
+        for field, limit in (stretch or {}).items():
+            if field in regions and limit in regions and regions[limit][1] > regions[field][3]:
+                regions[field][3] = regions[limit][1]
+                # Nội dung các dòng cũng dài ngắn khác nhau: lấy hết bề ngang còn lại của trang
+                regions[field][2] = 1.0
+
+        page_hash = layout['hash']
+        with self._lock:
+            templates = self._load()
+            existing = next((t for t in templates if t['kind'] == kind and t['anchor_value'] == values[anchor]
+                             and hamming(from_hex(t['hash']), from_hex(page_hash)) <= MAX_DISTANCE), None)
+            template = existing or {'id': uuid.uuid4().hex[:12], 'kind': kind, 'hits': 0, 'misses': 0,
+                                    'created': datetime.now().isoformat(timespec='seconds')}
+            template.update({'hash': page_hash, 'aspect': layout['aspect'], 'anchor': anchor,
+                             'anchor_value': values[anchor], 'regions': regions,
+                             'updated': datetime.now().isoformat(timespec='seconds')})
+            if existing is None:
+                templates.append(template)
+            self._save()
+        return template
+
+    def record(self, template, hit):
+        """Ghi nhận một lần áp mẫu thành công (hit) hoặc phải OCR toàn trang (miss)"""
+        with self._lock:
+            for stored in self._load():
+                if stored['id'] == template['id']:
+                    stored['hits' if hit else 'misses'] += 1
+                    stored['last_used'] = datetime.now().isoformat(timespec='seconds')
+                    break
+            self._save()
+
+    def stats(self, kind=None):
+        """Danh sách mẫu kèm số lần dùng và tỉ lệ dùng được"""
+        with self._lock:
+            templates = [t for t in self._load() if kind is None or t['kind'] == kind]
+        return [{'id': t['id'], 'kind': t['kind'], 'anchor_value': t['anchor_value'], 'hits': t['hits'],
+                 'misses': t['misses'],
+                 'hit_rate': t['hits'] / (t['hits'] + t['misses']) if t['hits'] + t['misses'] else None}
+                for t in templates]
+
+
+def read_regions(page, template, lang=ocr.DEFAULT_LANG, engine=None, profile=None):
+    """OCR song song các vùng của mẫu trên trang, trả về {tên trường: text}"""
+    def read(item):
+        field, (left, top, right, bottom) = item
+        crop = page.crop((int(left * page.width), int(top * page.height),
+                          int(right * page.width), int(bottom * page.height)))
+        return field, ocr.image_to_string(crop, lang=lang, config='--psm 6', engine=engine,
+                                          profile=profile).strip()
+
+    with ThreadPoolExecutor(max_workers=REGION_WORKERS) as executor:
+        return dict(executor.map(read, template['regions'].items()))
+
+
+def table_words(page, template, field='content', lang=ocr.DEFAULT_LANG, engine=None, profile=None):
+    """Word boxes (tọa độ trang) của vùng bảng hàng hóa theo mẫu, để tách dòng hàng hóa mà không OCR toàn trang.
+
+    Vùng bảng là vùng field của mẫu (đã kéo dài tới dòng tổng tiền khi học) nới lên trên
+    TABLE_HEADER_MARGIN và lấy hết bề ngang trang. Trả về None nếu mẫu không có vùng này.
+    """
+    region = template['regions'].get(field)
+    if region is None:
+        return None
+    top = int(max(0.0, region[1] - TABLE_HEADER_MARGIN) * page.height)
+    bottom = int(region[3] * page.height)
+    words = ocr.image_to_data(page.crop((0, top, page.width, bottom)), lang=lang, engine=engine, profile=profile)
+    return {**words, 'top': [value + top for value in words['top']]}
+
+
+def apply_template(store, kind, page, lang=ocr.DEFAULT_LANG, engine=None, profile=None):
+    """Tìm mẫu khớp với trang và OCR các vùng của mẫu.
+
+    Trả về (mẫu, {tên trường: text}) nếu trường neo đọc được khớp với mẫu, nếu không
+    trả về (None, None). Mẫu có đầu trang giống nhưng trường neo không khớp được ghi
+    nhận là miss.
+    """
+    for template in store.candidates(kind, page):
+        texts = read_regions(page, template, lang, engine, profile)
+        if _coverage(texts.get(template['anchor'], ''), template['anchor_value']) >= ANCHOR_SIMILARITY:
+            return template, texts
+        store.record(template, hit=False)
+    return None, None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_template_store():
+    """Trả về kho mẫu dùng chung trong toàn tiến trình"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TemplateStore()
+        return _store
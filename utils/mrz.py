@@ -0,0 +1,139 @@
+"""Đọc vùng MRZ (TD1, 3 dòng x 30 ký tự) ở mặt sau CCCD gắn chip.
+
+MRZ có chữ số kiểm tra (trọng số 7-3-1) cho số giấy tờ, ngày sinh, ngày hết hạn
+và cả vùng, nên khi các chữ số kiểm tra khớp thì số CCCD, ngày sinh, giới tính đã
+được xác thực mà không cần OpenAI. Họ tên trong MRZ không dấu, chỉ dùng để đối
+chiếu với họ tên đọc ở mặt trước.
+"""
+import re
+import unicodedata
+from datetime import date
+
+from PIL import ImageOps
+
+from utils import ocr
+from utils.cccd_layout import normalize_card
+
+TD1_LENGTH = 30
+
+# MRZ nằm ở khoảng 40% dưới của mặt sau thẻ
+MRZ_BAND = (0.0, 0.60, 1.0, 1.0)
+
+_MRZ_CONFIG = '--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<'
+
+# Ký tự chữ OCR hay đọc nhầm ở vị trí chỉ có chữ số
+_TO_DIGIT = str.maketrans('OQDIZSBGL', '000125861')
+
+_WEIGHTS = (7, 3, 1)
+
+
+def char_value(ch):
+    """Giá trị ký tự trong MRZ: 0-9, A=10 .. Z=35, '<' = 0"""
+    if ch.isdigit():
+        return int(ch)
+    if 'A' <= ch <= 'Z':
+        return ord(ch) - ord('A') + 10
+    return 0
+
+
+def check_digit(data):
+    """Chữ số kiểm tra ICAO 9303: tổng giá trị nhân trọng số 7, 3, 1 lặp lại, lấy mod 10"""
+    return str(sum(char_value(ch) * _WEIGHTS[i % 3] for i, ch in enumerate(data)) % 10)
+
+
+def _digits(text):
+    return text.translate(_TO_DIGIT)
+
+
+def _format_date(yymmdd, future=False):
+    """YYMMDD -> DD/MM/YYYY; năm sinh không thể ở tương lai, ngày hết hạn thì có thể"""
+    if not yymmdd.isdigit():
+        return ''
+    yy, mm, dd = int(yymmdd[:2]), int(yymmdd[2:4]), int(yymmdd[4:])
+    century = 2000 if future or 2000 + yy <= date.today().year else 1900
+    try:
+        return date(century + yy, mm, dd).strftime('%d/%m/%Y')
+    except ValueError:
+        return ''
+
+
+def find_td1_lines(text):
+    """Tìm 3 dòng MRZ TD1 trong text OCR (dòng đầu bắt đầu bằng ID/I<), None nếu không thấy"""
+    lines = []
+    for line in (text or '').upper().splitlines():
+        line = re.sub(r'\s', '', line).replace('«', '<')
+        if len(line) >= TD1_LENGTH - 3 and re.fullmatch(r'[A-Z0-9<]+', line):
+            lines.append(line[:TD1_LENGTH].ljust(TD1_LENGTH, '<'))
+    for i in range(len(lines) - 2):
+        if lines[i].startswith(('ID', 'I<')):
+            return lines[i:i + 3]
+    return None
+
+
+def parse_td1(lines):
+    """Phân tích 3 dòng TD1, trả về dict các trường kèm kết quả chữ số kiểm tra"""
+    line1, line2, line3 = lines
+    document_number = line1[5:14]
+    document_check = _digits(line1[14])
+    optional1 = line1[15:30]
+    birth = _digits(line2[0:6])
+    birth_check = _digits(line2[6])
+    sex = line2[7]
+    expiry = _digits(line2[8:14])
+    expiry_check = _digits(line2[14])
+    nationality = line2[15:18]
+    optional2 = line2[18:29]
+    composite_check = _digits(line2[29])
+
+    # CCCD ghi số giấy tờ là 9 số cuối của số định danh 12 số, số đầy đủ ở đầu vùng tùy chọn
+    document_number = _digits(document_number)
+    id_number = _digits(optional1[:12])
+    if not (id_number.isdigit() and id_number.endswith(document_number)):
+        id_number = ''
+
+    surname, _, given = line3.partition('<<')
+    name = ' '.join(f"{surname} {given}".replace('<', ' ').split())
+
+    composite = (document_number + document_check + optional1
+                 + birth + birth_check + expiry + expiry_check + optional2)
+    checks = {
+        'document_number': check_digit(document_number) == document_check,
+        'birth_date': check_digit(birth) == birth_check,
+        'expiry_date': check_digit(expiry) == expiry_check,
+        'composite': check_digit(composite) == composite_check,
+    }
+    return {
+        'document_number': document_number,
+        'id_number': id_number,
+        'birth_date': _format_date(birth),
+        'sex': {'M': 'Nam', 'F': 'Nữ'}.get(sex, ''),
+        'expiry_date': _format_date(expiry, future=True),
+        'nationality': nationality,
+        'name': name,
+        'checks': checks,
+        'valid': all(checks.values()),
+    }
+
+
+def read_mrz(image_back, engine=None, profile=None):
+    """OCR dải MRZ ở mặt sau CCCD và phân tích, trả về dict của parse_td1 hoặc None.
+
+    engine/profile: engine và hồ sơ OCR của trang gọi (whitelist MRZ được giữ nguyên).
+    """
+    card = normalize_card(image_back, engine)
+    if card is None:
+        card = ImageOps.exif_transpose(image_back).convert('RGB')
+    width, height = card.size
+    left, top, right, bottom = MRZ_BAND
+    band = card.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+    text = ocr.image_to_string(band, lang='eng', config=_MRZ_CONFIG,
+                               preprocess={'deskew': False, 'fix_orientation': False}, engine=engine,
+                               profile=profile)
+    lines = find_td1_lines(text)
+    return parse_td1(lines) if lines else None
+
+
+def strip_accents(text):
+    """Bỏ dấu tiếng Việt và viết hoa (như họ tên trong MRZ)"""
+    text = unicodedata.normalize('NFD', text.replace('Đ', 'D').replace('đ', 'd'))
+    return ' '.join(''.join(ch for ch in text if not unicodedata.combining(ch)).upper().split())
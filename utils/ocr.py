@@ -0,0 +1,112 @@
+"""Các hàm OCR dùng chung cho các trang, có cache kết quả trên đĩa.
+
+OCR chạy trên engine chọn theo tên (utils.ocr_engines, mặc định Tesseract: pool engine
+trong tiến trình nếu có tesserocr, nếu không thì gọi tesseract qua pytesseract).
+"""
+import time
+
+from utils import ocr_profiles
+from utils import preprocess as preprocessing
+from utils.ocr_engines import get_engine
+from utils.ocr_cache import get_cache, image_fingerprint, make_key
+
+DEFAULT_LANG = 'vie+eng'
+
+
+def _preprocess_options(preprocess):
+    """True -> tùy chọn mặc định, dict -> ghi đè tùy chọn, False (hoặc OCR_PREPROCESS=0) -> None"""
+    if not preprocess or not preprocessing.ENABLED:
+        return None
+    return {**preprocessing.DEFAULT_OPTIONS, **(preprocess if isinstance(preprocess, dict) else {})}
+
+
+def prepare_image(image, preprocess=True, engine=None):
+    """Ảnh mà engine OCR sẽ nhận với tùy chọn preprocess (ảnh gốc nếu tắt tiền xử lý).
+
+    Dùng khi cần OCR nhiều lần trên cùng một ảnh đã tiền xử lý (tọa độ word boxes và
+    các vùng cắt ra cùng một hệ tọa độ).
+    """
+    options = _preprocess_options(preprocess)
+    return preprocessing.preprocess_image(image, engine=engine, **options) if options else image
+
+
+def _timed(profile, run):
+    """Chạy OCR và cộng thời gian vào thống kê của hồ sơ (chỉ khi thực sự OCR, không tính cache)"""
+    start = time.perf_counter()
+    result = run()
+    ocr_profiles.get_stats().record(profile['name'] if profile else ocr_profiles.DEFAULT_PROFILE,
+                                    time.perf_counter() - start)
+    return result
+
+
+def image_to_string(image, lang=DEFAULT_LANG, config='', preprocess=False, engine=None, profile=None):
+    """OCR ảnh thành text, dùng lại kết quả cache nếu ảnh đã được xử lý.
+
+    preprocess=True (hoặc dict tùy chọn) chạy utils.preprocess trước khi OCR; khóa cache
+    tính trên ảnh gốc nên lần sau không cần tiền xử lý lại. engine là tên engine OCR
+    (utils.ocr_engines), None là engine mặc định; profile là hồ sơ OCR đã resolve
+    (utils.ocr_profiles), None giữ nguyên lang/config.
+    """
+    options = _preprocess_options(preprocess)
+    engine = get_engine(engine)
+    lang, config = ocr_profiles.apply(profile, lang, config)
+    cache = get_cache()
+    key = make_key(image_fingerprint(image), kind='text', lang=lang, config=config, preprocess=options,
+                   engine=engine.name)
+    text = cache.get_text(key)
+    if text is None:
+        if options:
+            image = preprocessing.preprocess_image(image, engine=engine.name, **options)
+        text = _timed(profile, lambda: engine.image_to_string(image, lang=lang, config=config))
+        cache.put_text(key, text)
+    return text
+
+
+def image_to_data(image, lang=DEFAULT_LANG, config='', preprocess=False, engine=None, profile=None):
+    """OCR ảnh thành danh sách word boxes (dict các cột của image_to_data), có cache.
+
+    Khi có preprocess, tọa độ word boxes tính trên ảnh đã tiền xử lý (đã thu nhỏ/xoay).
+    """
+    options = _preprocess_options(preprocess)
+    engine = get_engine(engine)
+    lang, config = ocr_profiles.apply(profile, lang, config)
+    cache = get_cache()
+    key = make_key(image_fingerprint(image), kind='words', lang=lang, config=config, preprocess=options,
+                   engine=engine.name)
+    words = cache.get_words(key)
+    if words is None:
+        if options:
+            image = preprocessing.preprocess_image(image, engine=engine.name, **options)
+        words = _timed(profile, lambda: engine.image_to_data(image, lang=lang, config=config))
+        cache.put_words(key, words)
+    return words
+
+
+def words_to_text(words):
+    """Ghép word boxes thành text theo dòng (giống image_to_string), các khối cách nhau một dòng trống"""
+    lines = []
+    current = []
+    current_line = None
+    for i, word in enumerate(words.get('text', [])):
+        if not word or not str(word).strip():
+            continue
+        line_key = (words['page_num'][i], words['block_num'][i], words['par_num'][i], words['line_num'][i])
+        if line_key != current_line:
+            if current:
+                lines.append(' '.join(current))
+                # Sang khối mới thì thêm dòng trống
+                if line_key[:2] != current_line[:2]:
+                    lines.append('')
+            current = []
+            current_line = line_key
+        current.append(str(word))
+    if current:
+        lines.append(' '.join(current))
+    return '\n'.join(lines)
+
+
+def image_to_document(image, lang=DEFAULT_LANG, config='', preprocess=False, engine=None, profile=None):
+    """OCR một lần, trả về cả text và word boxes"""
+    words = image_to_data(image, lang=lang, config=config, preprocess=preprocess, engine=engine, profile=profile)
+    return words_to_text(words), words
+
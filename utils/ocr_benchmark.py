@@ -0,0 +1,173 @@
+"""So sánh các engine và hồ sơ OCR trên bộ ảnh mẫu: thông lượng, độ trễ và độ chính xác các trường.
+
+    python -m utils.ocr_benchmark <thư mục ảnh> [--doc-type invoice|cccd] [--engines tesseract,onnx]
+                                  [--profiles fast,balanced,accurate] [--workers 4] [--repeat 1]
+                                  [--json ket_qua.json]
+
+Mỗi ảnh (png/jpg/jpeg/tif) có thể kèm file đáp án cùng tên <ảnh>.json, ví dụ hóa đơn
+{"number": "00000788", "date": "17/01/2026", "party": "CÔNG TY ...", "total": "1100000"},
+CCCD {"Số CCCD": "...", "Họ và tên": "..."}. Các trường được đọc như trên trang
+(utils.invoice_layout, utils.cccd_layout) và so khớp không dấu, không phân biệt hoa thường.
+OCR gọi thẳng engine, không qua cache, để đo đúng thời gian nhận dạng; ảnh được tiền
+xử lý một lần trước khi đo.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from utils import ocr, ocr_profiles
+from utils.cccd_layout import parse_layout
+from utils.invoice_layout import parse_invoice_words
+from utils.layout_index import normalize
+from utils.ocr_engines import ENGINES
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+PERCENTILES = (50, 90, 99)
+
+
+def load_corpus(folder):
+    """[(tên file, ảnh đã tiền xử lý, đáp án hoặc None)]"""
+    corpus = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(folder, name)
+        truth = None
+        truth_path = os.path.splitext(path)[0] + '.json'
+        if os.path.exists(truth_path):
+            with open(truth_path, 'r', encoding='utf-8') as f:
+                truth = json.load(f)
+        with Image.open(path) as image:
+            corpus.append((name, ocr.prepare_image(image, preprocess=True), truth))
+    return corpus
+
+
+def read_fields(words, doc_type, party='seller'):
+    if doc_type == 'cccd':
+        return parse_layout(words, {})
+    return parse_invoice_words(words, party=party)
+
+
+def _same(value, expected):
+    return normalize(str(value or '')) == normalize(str(expected or ''))
+
+
+def run_engine(engine, corpus, doc_type, lang, workers, repeat, party='seller', profile=None):
+    """Chạy một engine (với hồ sơ OCR profile đã resolve) trên toàn bộ ảnh, trả về dict thống kê"""
+    jobs = [item for _ in range(repeat) for item in corpus]
+    lang, config = ocr_profiles.apply(profile, lang, '')
+    latencies = []
+    errors = []
+
+    def run(item):
+        name, image, truth = item
+        start = time.perf_counter()
+        try:
+            words = engine.image_to_data(image, lang=lang, config=config)
+        except Exception as e:
+            return name, None, truth, time.perf_counter() - start, str(e)
+        return name, words, truth, time.perf_counter() - start, None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(run, jobs))
+    wall = time.perf_counter() - started
+
+    field_hits = {}
+    seen = set()
+    for name, words, truth, latency, error in results:
+        latencies.append(latency)
+        if error:
+            errors.append(f"{name}: {error}")
+            continue
+        # Độ chính xác tính một lần cho mỗi ảnh (các lần lặp cho cùng kết quả)
+        if truth is None or name in seen:
+            continue
+        seen.add(name)
+        fields = read_fields(words, doc_type, party)
+        for field, expected in truth.items():
+            hits, total = field_hits.get(field, (0, 0))
+            field_hits[field] = (hits + _same(fields.get(field), expected), total + 1)
+
+    hits = sum(hit for hit, _ in field_hits.values())
+    total = sum(count for _, count in field_hits.values())
+    return {
+        'engine': engine.name,
+        'profile': profile['name'] if profile else ocr_profiles.DEFAULT_PROFILE,
+        'images': len(jobs),
+        'errors': errors,
+        'pages_per_second': len(jobs) / wall if wall else 0.0,
+        'latency_ms': {f"p{p}": float(np.percentile(latencies, p)) * 1000 for p in PERCENTILES} if latencies else {},
+        'field_accuracy': hits / total if total else None,
+        'fields': {field: hit / count for field, (hit, count) in field_hits.items()},
+    }
+
+
+def format_report(results):
+    lines = [f"{'engine':<10} {'hồ sơ':<9} {'ảnh':>5} {'lỗi':>4} {'trang/s':>8} "
+             + ' '.join(f"{'p' + str(p) + ' ms':>9}" for p in PERCENTILES) + f" {'đúng trường':>12}"]
+    for result in results:
+        accuracy = result['field_accuracy']
+        lines.append(f"{result['engine']:<10} {result['profile']:<9} {result['images']:>5} {len(result['errors']):>4} "
+                     f"{result['pages_per_second']:>8.2f} "
+                     + ' '.join(f"{result['latency_ms'].get(f'p{p}', 0):>9.0f}" for p in PERCENTILES)
+                     + f" {'-' if accuracy is None else f'{accuracy:.1%}':>12}")
+    for result in results:
+        for field, accuracy in sorted(result['fields'].items()):
+            lines.append(f"  {result['engine']}/{result['profile']}: {field} {accuracy:.1%}")
+        for error in result['errors'][:5]:
+            lines.append(f"  {result['engine']}/{result['profile']} lỗi: {error}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m utils.ocr_benchmark',
+                                     description="So sánh các engine OCR trên bộ ảnh hóa đơn/CCCD mẫu")
+    parser.add_argument('folder', help="Thư mục ảnh (kèm <ảnh>.json đáp án nếu có)")
+    parser.add_argument('--doc-type', choices=('invoice', 'cccd'), default='invoice')
+    parser.add_argument('--party', choices=('seller', 'buyer'), default='seller',
+                        help="Trường đơn vị của hóa đơn: người bán (mua vào) hoặc người mua (bán ra)")
+    parser.add_argument('--engines', default=','.join(ENGINES), help="Danh sách engine, cách nhau bằng dấu phẩy")
+    parser.add_argument('--profiles', default=ocr_profiles.DEFAULT_PROFILE,
+                        help="Danh sách hồ sơ OCR (fast, balanced, accurate), cách nhau bằng dấu phẩy")
+    parser.add_argument('--lang', default=ocr.DEFAULT_LANG)
+    parser.add_argument('--workers', type=int, default=1, help="Số ảnh OCR đồng thời")
+    parser.add_argument('--repeat', type=int, default=1, help="Số lần lặp bộ ảnh khi đo")
+    parser.add_argument('--json', help="Ghi kết quả chi tiết ra file JSON")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.folder)
+    if not corpus:
+        print(f"Không có ảnh trong {args.folder}", file=sys.stderr)
+        return 1
+
+    # Loại chứng từ của hồ sơ OCR (user-patterns): hóa đơn mua vào/bán ra theo trường đơn vị
+    document_type = 'cccd' if args.doc_type == 'cccd' else (
+        'purchase_invoice' if args.party == 'seller' else 'sales_invoice')
+    results = []
+    for name in args.engines.split(','):
+        name = name.strip()
+        engine = ENGINES[name]() if name in ENGINES else None
+        if engine is None or not engine.available():
+            print(f"Bỏ qua engine '{name}': chưa cài hoặc thiếu mô hình", file=sys.stderr)
+            continue
+        for profile_name in args.profiles.split(','):
+            profile = ocr_profiles.resolve(profile_name.strip(), document_type)
+            results.append(run_engine(engine, corpus, args.doc_type, args.lang, args.workers, args.repeat,
+                                      args.party, profile))
+
+    print(format_report(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
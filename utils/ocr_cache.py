@@ -0,0 +1,173 @@
+"""Bộ nhớ đệm OCR trên đĩa, dùng chung cho tất cả các trang.
+
+Mỗi mục được định danh bằng hash nội dung (bytes của file/ảnh + tham số OCR),
+nên một tài liệu đã xử lý sẽ được trả về ngay khi upload lại, kể cả sau khi
+khởi động lại ứng dụng. Dung lượng bị giới hạn, mục ít dùng nhất bị xóa trước (LRU).
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+
+from PIL import Image
+
+# Thư mục và dung lượng tối đa của cache (có thể đổi qua biến môi trường)
+CACHE_DIR = os.environ.get("OCR_CACHE_DIR", ".ocr_cache")
+MAX_CACHE_BYTES = int(os.environ.get("OCR_CACHE_MAX_MB", "500")) * 1024 * 1024
+
+# Khi vượt giới hạn, xóa bớt cho đến khi còn tỉ lệ này của dung lượng tối đa
+EVICT_TARGET_RATIO = 0.9
+
+
+def make_key(data, **settings):
+    """Tạo khóa cache từ bytes nội dung và các tham số OCR"""
+    h = hashlib.sha256()
+    h.update(data)
+    h.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+
+def image_fingerprint(image):
+    """Hash nội dung điểm ảnh của ảnh PIL (không phụ thuộc định dạng file gốc)"""
+    h = hashlib.blake2b(digest_size=32)
+    h.update(f"{image.mode}|{image.size[0]}x{image.size[1]}".encode('ascii'))
+    h.update(image.tobytes())
+    return h.digest()
+
+
+class OCRCache:
+    """Kho lưu trang đã raster hóa và kết quả OCR (text, word boxes) theo hash nội dung"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _read(self, key, name):
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, name), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Cập nhật thời gian truy cập cho LRU
+        try:
+            os.utime(entry_dir, None)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, key, files):
+        """Ghi các file của một mục cache (ghi file tạm rồi đổi tên để an toàn giữa các session)"""
+        entry_dir = self._entry_dir(key)
+        added = 0
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            for name, data in files:
+                path = os.path.join(entry_dir, name)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                added += len(data)
+        except OSError:
+            # Cache chỉ để tăng tốc, lỗi ghi không được làm hỏng luồng xử lý chính
+            return
+        self._account(added)
+
+    def get_text(self, key):
+        data = self._read(key, 'text.txt')
+        return data.decode('utf-8') if data is not None else None
+
+    def put_text(self, key, text):
+        self._write(key, [('text.txt', (text or '').encode('utf-8'))])
+
+    def get_words(self, key):
+        data = self._read(key, 'words.json')
+        return json.loads(data.decode('utf-8')) if data is not None else None
+
+    def put_words(self, key, words):
+        self._write(key, [('words.json', json.dumps(words, ensure_ascii=False).encode('utf-8'))])
+
+    def get_pages(self, key):
+        """Đọc các trang đã raster hóa, trả về None nếu chưa có trong cache"""
+        manifest = self._read(key, 'pages.json')
+        if manifest is None:
+            return None
+        images = []
+        for i in range(json.loads(manifest.decode('utf-8'))['count']):
+            data = self._read(key, f'page_{i:03d}.png')
+            if data is None:
+                return None
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            images.append(image)
+        return images
+
+    def put_pages(self, key, images):
+        files = []
+        for i, image in enumerate(images):
+            buf = io.BytesIO()
+            image.save(buf, format='PNG')
+            files.append((f'page_{i:03d}.png', buf.getvalue()))
+        # Manifest ghi sau cùng để chỉ đánh dấu mục hoàn chỉnh
+        files.append(('pages.json', json.dumps({'count': len(images)}).encode('utf-8')))
+        self._write(key, files)
+
+    def _scan(self):
+        """Liệt kê các mục cache: (thời gian truy cập, dung lượng, đường dẫn)"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    size = sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+                    entries.append((os.stat(entry_dir).st_mtime, size, entry_dir))
+                except OSError:
+                    continue
+        return entries
+
+    def _account(self, added):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += added
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Xóa các mục ít được dùng gần đây nhất cho đến khi dưới giới hạn"""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        for _, size, entry_dir in entries:
+            if total <= target:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+        self._total_bytes = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Trả về cache dùng chung trong toàn tiến trình"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OCRCache()
+        return _cache
@@ -0,0 +1,111 @@
+"""Giao diện chung cho các engine OCR và chọn engine theo loại chứng từ.
+
+Mọi lời gọi OCR của các trang đi qua utils.ocr, utils.ocr gọi engine qua giao diện
+ở đây nên đổi engine không phải sửa code trang. Có hai engine:
+
+- 'tesseract': Tesseract qua pool tesserocr hoặc pytesseract (utils.tesseract_engine)
+- 'onnx': mô hình phát hiện + nhận dạng chạy bằng onnxruntime trên CPU (utils.onnx_ocr)
+
+Engine mặc định đặt bằng OCR_ENGINE, riêng từng loại chứng từ bằng OCR_ENGINE_<LOẠI>
+(ví dụ OCR_ENGINE_INVOICE=onnx). Engine chưa cài/thiếu mô hình thì dùng Tesseract.
+So sánh các engine trên bộ ảnh mẫu bằng `python -m utils.ocr_benchmark`.
+"""
+import os
+import threading
+
+from PIL import Image
+
+from utils import onnx_ocr, tesseract_engine
+
+DEFAULT_ENGINE = os.environ.get("OCR_ENGINE", "tesseract")
+
+# Các loại chứng từ được chọn engine riêng
+DOCUMENT_TYPES = ('invoice', 'cccd', 'contract')
+
+# Độ tin cậy tối thiểu của Tesseract OSD để lật ảnh 180 độ
+OSD_MIN_CONF = 2.0
+# Engine không có OSD: ảnh lật 180 độ phải đọc được với độ tin cậy trung bình cao hơn tỉ lệ này mới lật
+FLIP_CONF_MARGIN = 0.1
+# và chỉ đọc dải giữa ảnh (tỉ lệ chiều cao) thay vì cả trang
+FLIP_BAND = 0.25
+
+
+def _mean_conf(words):
+    confs = [float(conf) for conf, text in zip(words.get('conf', []), words.get('text', []))
+             if str(text).strip() and float(conf) >= 0]
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+class OCREngine:
+    """Engine OCR: image_to_data trả về dict word boxes theo định dạng pytesseract Output.DICT"""
+
+    name = ''
+
+    def available(self):
+        return True
+
+    def image_to_data(self, image, lang, config=''):
+        raise NotImplementedError
+
+    def image_to_string(self, image, lang, config=''):
+        from utils.ocr import words_to_text
+        return words_to_text(self.image_to_data(image, lang, config))
+
+    def is_upside_down(self, image):
+        """Ảnh có bị lộn ngược 180 độ không: so độ tin cậy trung bình khi đọc dải giữa ảnh và
+        dải đó lật lại. Chỉ được gọi khi hình dạng dòng chữ không đủ để quyết định
+        (utils.preprocess.analyze).
+        """
+        top = int(image.height * (1 - FLIP_BAND) / 2)
+        band = image.crop((0, top, image.width, top + max(1, int(image.height * FLIP_BAND))))
+        upright = _mean_conf(self.image_to_data(band, lang=''))
+        flipped = _mean_conf(self.image_to_data(band.transpose(Image.ROTATE_180), lang=''))
+        return flipped > upright * (1 + FLIP_CONF_MARGIN)
+
+
+class TesseractEngine(OCREngine):
+    name = 'tesseract'
+
+    def image_to_data(self, image, lang, config=''):
+        return tesseract_engine.image_to_data(image, lang=lang, config=config)
+
+    def image_to_string(self, image, lang, config=''):
+        return tesseract_engine.image_to_string(image, lang=lang, config=config)
+
+    def is_upside_down(self, image):
+        rotate, conf = tesseract_engine.detect_rotation(image)
+        return rotate == 180 and conf >= OSD_MIN_CONF
+
+
+class OnnxEngine(OCREngine):
+    """Ngôn ngữ do bảng ký tự của mô hình quyết định; lang và config của Tesseract
+    (psm, whitelist) không áp dụng"""
+
+    name = 'onnx'
+
+    def available(self):
+        return onnx_ocr.models_available()
+
+    def image_to_data(self, image, lang, config=''):
+        return onnx_ocr.image_to_data(image)
+
+
+ENGINES = {engine.name: engine for engine in (TesseractEngine, OnnxEngine)}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name=None):
+    """Engine theo tên (mặc định DEFAULT_ENGINE); engine không dùng được thì trả về Tesseract"""
+    name = name or DEFAULT_ENGINE
+    with _engines_lock:
+        if name not in _engines:
+            engine = ENGINES.get(name, TesseractEngine)()
+            _engines[name] = engine if engine.available() else TesseractEngine()
+        return _engines[name]
+
+
+def engine_for(document_type):
+    """Tên engine dùng cho loại chứng từ (OCR_ENGINE_<LOẠI>, nếu không có thì OCR_ENGINE)"""
+    return os.environ.get(f"OCR_ENGINE_{document_type.upper()}", DEFAULT_ENGINE)
@@ -0,0 +1,132 @@
+"""Hồ sơ OCR theo tốc độ/độ chính xác ("fast", "balanced", "accurate") và chọn hồ sơ theo loại chứng từ.
+
+Mỗi hồ sơ chọn bộ traineddata (tessdata_fast nhanh, tessdata_best chính xác, thư mục
+đặt bằng OCR_TESSDATA_FAST, OCR_TESSDATA_BEST; chưa đặt thì dùng tessdata mặc định),
+tập ngôn ngữ, chế độ phân đoạn trang (psm) và file user-patterns theo loại chứng từ
+(utils/ocr_patterns/<loại>.patterns). Hồ sơ chỉ bổ sung vào lời gọi OCR: lời gọi đã có
+psm/whitelist riêng (ô bảng, trường CCCD) hay lang khác mặc định ('eng' cho ô số) được
+giữ nguyên.
+
+Hồ sơ cho từng loại chứng từ đặt bằng OCR_PROFILE_<LOẠI> (ví dụ
+OCR_PROFILE_PURCHASE_INVOICE=fast, OCR_PROFILE_CONTRACT=accurate). Thời gian OCR thực tế
+(không tính cache) được cộng dồn theo hồ sơ để so sánh trên giao diện.
+"""
+import os
+import shlex
+import threading
+
+DEFAULT_LANG = 'vie+eng'
+
+TESSDATA_DIRS = {
+    'fast': os.environ.get("OCR_TESSDATA_FAST") or None,
+    'best': os.environ.get("OCR_TESSDATA_BEST") or None,
+}
+
+PATTERNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr_patterns')
+
+PROFILES = {
+    # Mô hình nhanh, chỉ tiếng Việt (đã gồm chữ Latin), coi trang là một khối chữ (bỏ phân tích bố cục)
+    'fast': {'tessdata': 'fast', 'lang': 'vie', 'psm': 6, 'patterns': False},
+    # Như trước khi có hồ sơ: tessdata mặc định, vie+eng, tự phân tích bố cục
+    'balanced': {'tessdata': None, 'lang': None, 'psm': None, 'patterns': False},
+    # Mô hình chính xác nhất, thêm user-patterns (số CCCD, ngày, số tiền) của loại chứng từ
+    'accurate': {'tessdata': 'best', 'lang': 'vie+eng', 'psm': None, 'patterns': True},
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# Loại chứng từ -> file user-patterns trong PATTERNS_DIR
+DOCUMENT_PATTERNS = {
+    'purchase_invoice': 'invoice.patterns',
+    'sales_invoice': 'invoice.patterns',
+    'cccd': 'cccd.patterns',
+    'contract': 'cccd.patterns',
+}
+
+
+def profile_for(document_type):
+    """Tên hồ sơ dùng cho loại chứng từ (OCR_PROFILE_<LOẠI>, mặc định DEFAULT_PROFILE)"""
+    name = os.environ.get(f"OCR_PROFILE_{document_type.upper()}", DEFAULT_PROFILE)
+    return name if name in PROFILES else DEFAULT_PROFILE
+
+
+def resolve(name, document_type=None):
+    """Cấu hình cụ thể của hồ sơ cho loại chứng từ: dict name, lang, options (chuỗi config
+    thêm vào lời gọi) và psm. Là dict thuần nên dùng được làm khóa cache và gửi sang
+    tiến trình OCR con."""
+    profile = PROFILES.get(name) or PROFILES[DEFAULT_PROFILE]
+    options = []
+    tessdata_dir = TESSDATA_DIRS.get(profile['tessdata'])
+    if tessdata_dir:
+        options += ['--tessdata-dir', tessdata_dir]
+    patterns = DOCUMENT_PATTERNS.get(document_type)
+    if profile['patterns'] and patterns and os.path.exists(os.path.join(PATTERNS_DIR, patterns)):
+        options += ['--user-patterns', os.path.join(PATTERNS_DIR, patterns)]
+    return {
+        'name': name if name in PROFILES else DEFAULT_PROFILE,
+        'lang': profile['lang'],
+        'psm': profile['psm'],
+        'options': shlex.join(options),
+    }
+
+
+def apply(profile, lang, config):
+    """(lang, config) của lời gọi OCR sau khi áp hồ sơ (profile là kết quả resolve hoặc None)"""
+    if not profile:
+        return lang, config
+    if profile['lang'] and lang == DEFAULT_LANG:
+        lang = profile['lang']
+    parts = [profile['options']] if profile['options'] else []
+    if profile['psm'] is not None and '--psm' not in (config or ''):
+        parts.append(f"--psm {profile['psm']}")
+    if config:
+        parts.append(config)
+    return lang, ' '.join(parts)
+
+
+class ProfileStats:
+    """Số lần OCR và tổng thời gian theo hồ sơ trong tiến trình"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, seconds):
+        self.merge({name: (1, seconds)})
+
+    def merge(self, delta):
+        """Cộng thêm thống kê {hồ sơ: (số lần, số giây)} (ví dụ từ tiến trình OCR con)"""
+        with self._lock:
+            for name, (count, seconds) in delta.items():
+                total_count, total_seconds = self._stats.get(name, (0, 0.0))
+                self._stats[name] = (total_count + count, total_seconds + seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def since(self, snapshot):
+        """Phần tăng thêm so với một snapshot trước đó"""
+        delta = {}
+        for name, (count, seconds) in self.snapshot().items():
+            old_count, old_seconds = snapshot.get(name, (0, 0.0))
+            if count > old_count:
+                delta[name] = (count - old_count, seconds - old_seconds)
+        return delta
+
+
+_stats = ProfileStats()
+
+
+def get_stats():
+    """Thống kê thời gian OCR theo hồ sơ dùng chung trong tiến trình"""
+    return _stats
+
+
+def format_stats(stats=None):
+    """Một dòng thời gian OCR trung bình của từng hồ sơ để hiển thị trên giao diện"""
+    stats = stats or get_stats().snapshot()
+    if not stats:
+        return "Hồ sơ OCR: chưa có lần OCR nào"
+    return "Hồ sơ OCR: " + " · ".join(f"{name} {seconds / count:.2f}s/lần ({count} lần)"
+                                     for name, (count, seconds) in sorted(stats.items()))
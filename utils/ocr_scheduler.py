@@ -0,0 +1,104 @@
+"""Giới hạn số job Tesseract chạy đồng thời trong toàn ứng dụng.
+
+Mỗi session Streamlit chạy OCR trên thread riêng, mỗi tiến trình Tesseract lại có
+thể mở nhiều thread OpenMP, nên khi nhiều người upload cùng lúc máy bị quá tải và
+mọi yêu cầu đều chậm. Scheduler cấp một số slot CPU cố định, job vượt quá phải
+xếp hàng; mỗi job chỉ được dùng OCR_THREADS_PER_JOB thread. Độ dài hàng đợi và
+thời gian chờ được thống kê để hiển thị trên giao diện.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Số job OCR chạy đồng thời (mặc định: số core trừ một core cho Streamlit)
+CPU_SLOTS = max(1, int(os.environ.get("OCR_CPU_SLOTS", "0")) or (os.cpu_count() or 2) - 1)
+
+# Số thread mỗi job Tesseract được dùng
+THREADS_PER_JOB = int(os.environ.get("OCR_THREADS_PER_JOB", "1"))
+
+# Tesseract (kể cả tiến trình con và tesserocr) đọc biến này khi khởi tạo OpenMP,
+# nên phải đặt trước khi nạp thư viện
+os.environ.setdefault("OMP_THREAD_LIMIT", str(THREADS_PER_JOB))
+
+
+class OCRScheduler:
+    """Cấp slot CPU cho các job OCR theo thứ tự đến trước, kèm thống kê hàng đợi"""
+
+    def __init__(self, slots=CPU_SLOTS):
+        self.slots = slots
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+        self._jobs = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._next_ticket = 0
+        self._serving = 0
+
+    def acquire(self):
+        """Chờ đến lượt và chiếm một slot, trả về số giây đã chờ"""
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._waiting += 1
+            # Phục vụ theo vé để job đến trước được chạy trước
+            while ticket != self._serving or self._running >= self.slots:
+                self._cond.wait()
+            self._serving += 1
+            self._waiting -= 1
+            self._running += 1
+            waited = time.monotonic() - start
+            self._jobs += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._cond.notify_all()
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Chạy khối lệnh trong một slot CPU"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Thống kê hiện tại: slots, running, queued, jobs, avg_wait, max_wait (giây)"""
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'running': self._running,
+                'queued': self._waiting,
+                'jobs': self._jobs,
+                'avg_wait': self._total_wait / self._jobs if self._jobs else 0.0,
+                'max_wait': self._max_wait,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Scheduler dùng chung cho mọi session trong tiến trình (khởi tạo một lần)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OCRScheduler()
+        return _scheduler
+
+
+def format_stats(stats=None):
+    """Một dòng mô tả tải OCR để hiển thị trên giao diện"""
+    stats = stats or get_scheduler().stats()
+    return (f"OCR: {stats['running']}/{stats['slots']} slot đang chạy, {stats['queued']} job đang chờ · "
+            f"chờ trung bình {stats['avg_wait']:.2f}s, lâu nhất {stats['max_wait']:.2f}s "
+            f"({stats['jobs']} job)")
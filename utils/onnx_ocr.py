@@ -0,0 +1,212 @@
+"""Engine OCR thay thế chạy trên CPU bằng onnxruntime: phát hiện dòng chữ (DB) + nhận dạng (CRNN/CTC).
+
+Dùng các mô hình dạng PP-OCR xuất ra ONNX: mô hình phát hiện trả về bản đồ xác suất
+điểm chữ, các vùng liên thông trên ngưỡng là các dòng chữ; mô hình nhận dạng đọc
+từng dòng đã cắt và giải mã CTC theo bảng ký tự (mỗi dòng một ký tự, có dấu tiếng
+Việt). Đường dẫn mô hình đặt bằng biến môi trường ONNX_DET_MODEL, ONNX_REC_MODEL,
+ONNX_CHARSET. Kết quả trả về cùng định dạng word boxes với Tesseract (image_to_data)
+để các bước đọc trường theo vị trí dùng chung.
+"""
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from utils.ocr_scheduler import THREADS_PER_JOB, get_scheduler
+
+# Import onnxruntime (optional)
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+DET_MODEL = os.environ.get("ONNX_DET_MODEL", "models/ocr_det.onnx")
+REC_MODEL = os.environ.get("ONNX_REC_MODEL", "models/ocr_rec.onnx")
+CHARSET_FILE = os.environ.get("ONNX_CHARSET", "models/ocr_charset.txt")
+
+# Cạnh dài tối đa của ảnh đưa vào mô hình phát hiện (bội số của 32)
+DET_MAX_SIDE = 960
+# Ngưỡng xác suất điểm chữ và điểm trung bình tối thiểu của một dòng
+DET_THRESHOLD = 0.3
+BOX_THRESHOLD = 0.6
+# Nới hộp dòng chữ (bản đồ xác suất co hẹp hơn chữ thật), theo tỉ lệ diện tích/chu vi
+UNCLIP_RATIO = 1.5
+MIN_BOX_SIZE = 3
+
+# Chiều cao dòng đưa vào mô hình nhận dạng và số dòng mỗi lô
+REC_HEIGHT = 48
+REC_BATCH = 8
+
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def label_boxes(mask):
+    """Hộp bao (left, top, right, bottom) của các vùng liên thông trong mask 2 chiều.
+
+    Gán nhãn theo đoạn chạy trên từng hàng rồi hợp các đoạn chồng nhau ở hàng liền kề
+    (union-find), không cần OpenCV/scipy.
+    """
+    runs = []
+    parent = []
+    previous = []
+    for y, row in enumerate(mask):
+        padded = np.concatenate(([0], row.astype(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(padded))
+        current = []
+        for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            index = len(runs)
+            runs.append((y, start, end))
+            parent.append(index)
+            for other in previous:
+                _, other_start, other_end = runs[other]
+                if other_start < end and start < other_end:
+                    a, b = _find(parent, index), _find(parent, other)
+                    if a != b:
+                        parent[a] = b
+            current.append(index)
+        previous = current
+
+    boxes = {}
+    for index, (y, start, end) in enumerate(runs):
+        root = _find(parent, index)
+        left, top, right, bottom = boxes.get(root, (start, y, end, y + 1))
+        boxes[root] = (min(left, start), min(top, y), max(right, end), max(bottom, y + 1))
+    return list(boxes.values())
+
+
+class OnnxOCR:
+    """Cặp mô hình phát hiện + nhận dạng, nạp một lần và dùng chung giữa các thread"""
+
+    def __init__(self, det_model=DET_MODEL, rec_model=REC_MODEL, charset_file=CHARSET_FILE):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = THREADS_PER_JOB
+        options.inter_op_num_threads = 1
+        providers = ['CPUExecutionProvider']
+        self.det = onnxruntime.InferenceSession(det_model, options, providers=providers)
+        self.rec = onnxruntime.InferenceSession(rec_model, options, providers=providers)
+        with open(charset_file, 'r', encoding='utf-8') as f:
+            # Chỉ số 0 là ký tự trống của CTC, ký tự cuối là dấu cách
+            self.charset = [''] + [line.rstrip('\n') for line in f] + [' ']
+
+    def detect(self, image):
+        """Hộp các dòng chữ trên ảnh (tọa độ ảnh gốc), sắp theo thứ tự đọc"""
+        width, height = image.size
+        scale = min(1.0, DET_MAX_SIDE / max(width, height))
+        det_width = max(32, int(round(width * scale / 32)) * 32)
+        det_height = max(32, int(round(height * scale / 32)) * 32)
+        pixels = np.asarray(image.convert('RGB').resize((det_width, det_height), Image.BILINEAR),
+                            dtype=np.float32) / 255.0
+        tensor = ((pixels - _MEAN) / _STD).transpose(2, 0, 1)[np.newaxis]
+        probability = self.det.run(None, {self.det.get_inputs()[0].name: tensor})[0][0, 0]
+
+        scale_x, scale_y = width / det_width, height / det_height
+        boxes = []
+        for left, top, right, bottom in label_boxes(probability > DET_THRESHOLD):
+            box_width, box_height = right - left, bottom - top
+            if min(box_width, box_height) < MIN_BOX_SIZE:
+                continue
+            if probability[top:bottom, left:right].mean() < BOX_THRESHOLD:
+                continue
+            offset = box_width * box_height * UNCLIP_RATIO / (2 * (box_width + box_height))
+            boxes.append((max(0, int((left - offset) * scale_x)), max(0, int((top - offset) * scale_y)),
+                          min(width, int((right + offset) * scale_x)), min(height, int((bottom + offset) * scale_y))))
+        return sorted(boxes, key=lambda box: (box[1], box[0]))
+
+    def _decode(self, output):
+        """Giải mã CTC tham lam: bỏ ký tự lặp liền nhau và ký tự trống; conf là xác suất trung bình"""
+        indices = output.argmax(axis=1)
+        probabilities = output.max(axis=1)
+        chars, confs = [], []
+        previous = 0
+        for index, probability in zip(indices, probabilities):
+            if index != 0 and index != previous and index < len(self.charset):
+                chars.append(self.charset[index])
+                confs.append(float(probability))
+            previous = index
+        return ''.join(chars), (100.0 * sum(confs) / len(confs) if confs else 0.0)
+
+    def recognize(self, image, boxes):
+        """Đọc text của từng hộp dòng chữ, trả về [(text, conf)]"""
+        crops = []
+        for box in boxes:
+            crop = image.crop(box).convert('RGB')
+            crop_width = max(1, int(round(crop.width * REC_HEIGHT / max(1, crop.height))))
+            crops.append(crop.resize((crop_width, REC_HEIGHT), Image.BILINEAR))
+        results = []
+        for start in range(0, len(crops), REC_BATCH):
+            batch = crops[start:start + REC_BATCH]
+            batch_width = max(crop.width for crop in batch)
+            tensor = np.zeros((len(batch), 3, REC_HEIGHT, batch_width), dtype=np.float32)
+            for i, crop in enumerate(batch):
+                pixels = np.asarray(crop, dtype=np.float32) / 255.0
+                tensor[i, :, :, :crop.width] = ((pixels - 0.5) / 0.5).transpose(2, 0, 1)
+            outputs = self.rec.run(None, {self.rec.get_inputs()[0].name: tensor})[0]
+            results.extend(self._decode(output) for output in outputs)
+        return results
+
+
+def to_words(boxes, lines):
+    """Chuyển các dòng đã đọc thành dict word boxes kiểu image_to_data.
+
+    Hộp từng từ chia theo tỉ lệ số ký tự trên hộp dòng; các dòng cùng hàng (hộp chồng
+    nhau theo chiều dọc) giữ chung line_num để ghép text giống Tesseract.
+    """
+    columns = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+    words = {column: [] for column in columns}
+    line_num = 0
+    row_bottom = None
+    for (left, top, right, bottom), (text, conf) in zip(boxes, lines):
+        if not text.strip():
+            continue
+        if row_bottom is None or top >= row_bottom - (bottom - top) / 2:
+            line_num += 1
+            row_bottom = bottom
+        else:
+            row_bottom = max(row_bottom, bottom)
+        char_width = (right - left) / max(1, len(text))
+        position = 0
+        for word_num, word in enumerate(text.split(' '), start=1):
+            if word:
+                for column, value in zip(columns, (5, 1, 1, 1, line_num, word_num,
+                                                   int(left + position * char_width), top,
+                                                   max(1, int(len(word) * char_width)), bottom - top,
+                                                   round(conf, 2), word)):
+                    words[column].append(value)
+            position += len(word) + 1
+    return words
+
+
+_ocr = None
+_ocr_lock = threading.Lock()
+
+
+def get_ocr():
+    """Mô hình ONNX dùng chung trong tiến trình (nạp một lần)"""
+    global _ocr
+    with _ocr_lock:
+        if _ocr is None:
+            _ocr = OnnxOCR()
+        return _ocr
+
+
+def models_available():
+    return ONNXRUNTIME_AVAILABLE and all(os.path.exists(path) for path in (DET_MODEL, REC_MODEL, CHARSET_FILE))
+
+
+def image_to_data(image):
+    """OCR ảnh thành dict word boxes (cùng định dạng pytesseract Output.DICT)"""
+    with get_scheduler().slot():
+        model = get_ocr()
+        boxes = model.detect(image)
+        return to_words(boxes, model.recognize(image, boxes))
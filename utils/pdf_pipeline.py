@@ -0,0 +1,249 @@
+"""Raster hóa và OCR tất cả các trang của PDF theo kiểu pipeline.
+
+Trang N+1 được raster hóa ở tiến trình chính trong khi trang N đang được OCR
+trong process pool. Số trang nằm trong bộ nhớ cùng lúc bị giới hạn bởi số worker,
+không phụ thuộc vào số trang của PDF. Trang có lớp text dùng được (hóa đơn
+điện tử xuất trực tiếp ra PDF) được đọc thẳng, không raster hóa và không OCR.
+Ở chế độ DPI thích ứng, trang được OCR ở DPI thấp rồi chỉ render lại các vùng
+kém tin cậy ở DPI cao (xem utils.dpi_cascade).
+"""
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from utils import dpi_cascade, ocr, ocr_profiles
+from utils.ocr_cache import get_cache, make_key
+from utils.ocr_engines import get_engine
+from utils.ocr_scheduler import CPU_SLOTS, get_scheduler
+from utils.pdf_render import get_renderer, has_text_layer
+
+# Số tiến trình OCR song song (không vượt quá số slot CPU dành cho OCR)
+OCR_WORKERS = max(1, min(4, CPU_SLOTS))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process pool dùng chung cho mọi session (khởi tạo một lần)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Dùng "spawn" để tiến trình con không kế thừa các thread của Streamlit
+            _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _ocr_page(image, lang, engine=None, profile=None):
+    """Chạy trong tiến trình con: OCR một trang, trả về (word boxes, thời gian OCR theo hồ sơ)"""
+    stats = ocr_profiles.get_stats()
+    before = stats.snapshot()
+    words = ocr.image_to_data(image, lang=lang, engine=engine, profile=profile)
+    return words, stats.since(before)
+
+
+def _page_words(future):
+    """Word boxes của một trang đã OCR xong; thời gian OCR ở tiến trình con được cộng vào
+    thống kê hồ sơ của tiến trình chính để hiển thị"""
+    words, timing = future.result()
+    ocr_profiles.get_stats().merge(timing)
+    return words
+
+
+def _submit_page(executor, image, lang, engine=None, profile=None):
+    """Gửi một ảnh vào process pool sau khi được scheduler cấp slot; slot trả lại khi OCR xong.
+
+    Job chạy trong tiến trình con nên slot phải giữ ở tiến trình chính để các session
+    khác thấy đúng tải hiện tại.
+    """
+    scheduler = get_scheduler()
+    scheduler.acquire()
+    try:
+        future = executor.submit(_ocr_page, image, lang, engine, profile)
+    except Exception:
+        scheduler.release()
+        raise
+    future.add_done_callback(lambda _: scheduler.release())
+    return future
+
+
+def ocr_images(images, lang=ocr.DEFAULT_LANG, engine=None, profile=None):
+    """OCR song song các ảnh trong process pool, trả về word boxes theo thứ tự ảnh"""
+    futures = [_submit_page(get_executor(), image, lang, engine, profile) for image in images]
+    return [_page_words(future) for future in futures]
+
+
+def merge_pages(page_words):
+    """Gộp word boxes của từng trang thành một tài liệu, đánh lại page_num theo thứ tự trang"""
+    merged = {}
+    for page_index, words in enumerate(page_words):
+        count = len(words.get('text', []))
+        for column, values in words.items():
+            if column == 'page_num':
+                values = [page_index + 1] * count
+            merged.setdefault(column, []).extend(values)
+    return merged
+
+
+def _preview_key(pdf_bytes, dpi):
+    return make_key(pdf_bytes, kind='preview', dpi=dpi)
+
+
+def _preview_dpi(document, dpi, dpi_mode):
+    """DPI của ảnh trang đầu đã render: trang scan ở chế độ adaptive được render ở LOW_DPI"""
+    if dpi_mode == 'adaptive' and document['sources'] and document['sources'][0] == 'ocr':
+        return dpi_cascade.LOW_DPI
+    return dpi
+
+
+def _ocr_pages(renderer, dpi, lang, on_page, save_preview, dpi_mode, engine=None, profile=None, page_indices=None):
+    """Vòng lặp pipeline: raster hóa trang tiếp theo trong khi các trang trước đang OCR.
+
+    Tối đa OCR_WORKERS trang scan đã render nằm trong bộ nhớ cùng lúc. page_indices là
+    các trang cần đọc (mặc định mọi trang). save_preview(image, image_dpi) nhận ảnh trang
+    đầu tiên đúng như đã render (không render lại), None nếu không cần ảnh xem trước.
+    Trả về (page_words, sources, dpi_stats) theo thứ tự page_indices, với sources[i] là
+    'text' (lớp text của PDF) hoặc 'ocr', dpi_stats[i] là thống kê DPI của trang (None
+    nếu không OCR).
+    """
+    if page_indices is None:
+        page_indices = range(renderer.page_count())
+    page_indices = list(page_indices)
+    page_count = len(page_indices)
+    page_words = [None] * page_count
+    sources = ['ocr'] * page_count
+    dpi_stats = [None] * page_count
+    image_sizes = {}
+    executor = get_executor()
+    pending = {}
+    next_position = 0
+    done_count = 0
+    adaptive = dpi_mode == 'adaptive'
+    render_dpi = dpi_cascade.LOW_DPI if adaptive else dpi
+
+    def map_images(images):
+        return ocr_images(images, lang, engine, profile)
+
+    def page_done(position):
+        nonlocal done_count
+        done_count += 1
+        if on_page:
+            on_page(done_count, page_count, page_indices[position], ocr.words_to_text(page_words[position]))
+
+    while next_position < page_count or pending:
+        while next_position < page_count and len(pending) < OCR_WORKERS:
+            page_index = page_indices[next_position]
+            # Ưu tiên lớp text có sẵn trong PDF, chỉ OCR trang scan
+            text_words = renderer.extract_words(page_index, dpi)
+            if has_text_layer(text_words):
+                if next_position == 0 and save_preview:
+                    save_preview(renderer.render_page(page_index, dpi), dpi)
+                page_words[next_position] = text_words
+                sources[next_position] = 'text'
+                page_done(next_position)
+            else:
+                image = renderer.render_page(page_index, render_dpi)
+                if image is not None:
+                    if next_position == 0 and save_preview:
+                        save_preview(image, render_dpi)
+                    image_sizes[next_position] = image.size
+                    pending[_submit_page(executor, image, lang, engine, profile)] = next_position
+                else:
+                    page_words[next_position] = {}
+            next_position += 1
+        if not pending:
+            continue
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            position = pending.pop(future)
+            words = _page_words(future)
+            if adaptive:
+                # Render lại ở DPI cao chỉ các vùng có độ tin cậy thấp
+                words, dpi_stats[position] = dpi_cascade.cascade_page(
+                    renderer, page_indices[position], lang, words=words,
+                    image_size=image_sizes[position], map_func=map_images, engine=engine, profile=profile)
+            else:
+                dpi_stats[position] = {'dpi': dpi, 'high_dpi': dpi, 'rerenders': 0, 'full_page_rerender': False}
+            page_words[position] = words
+            page_done(position)
+    return page_words, sources, dpi_stats
+
+
+def ocr_pdf(pdf_bytes, dpi=200, lang=ocr.DEFAULT_LANG, on_page=None, dpi_mode='fixed', engine=None,
+            profile=None):
+    """OCR toàn bộ các trang PDF, trả về dict: text, words, page_texts, page_count, preview, source, dpi_stats.
+
+    dpi_mode='fixed' render mọi trang ở dpi, 'adaptive' dùng tầng DPI (utils.dpi_cascade).
+    engine là tên engine OCR cho các trang scan (utils.ocr_engines), profile là hồ sơ OCR
+    đã resolve (utils.ocr_profiles).
+
+    source là 'text' nếu mọi trang đều đọc từ lớp text (không cần sửa dấu do OCR),
+    'ocr' nếu mọi trang phải OCR, 'mixed' nếu có cả hai.
+
+    on_page(so_trang_xong, tong_so_trang, page_index, page_text) được gọi mỗi khi
+    một trang OCR xong (trên thread gọi hàm), dùng để hiển thị kết quả từng phần.
+    """
+    cache = get_cache()
+    key = make_key(pdf_bytes, kind='pdf_document', dpi=dpi, lang=lang, text_layer=True, dpi_mode=dpi_mode,
+                   cascade=(dpi_cascade.LOW_DPI, dpi_cascade.HIGH_DPI, dpi_cascade.CONF_THRESHOLD),
+                   engine=get_engine(engine).name, profile=profile)
+
+    def save_preview(image, image_dpi):
+        cache.put_pages(_preview_key(pdf_bytes, image_dpi), [image])
+
+    # Ảnh xem trước lưu theo DPI thực sự đã render trang đầu
+    document = cache.get_words(key)
+    preview = None
+    if document is not None:
+        preview = cache.get_pages(_preview_key(pdf_bytes, _preview_dpi(document, dpi, dpi_mode)))
+    if document is None or preview is None:
+        with get_renderer(pdf_bytes) as renderer:
+            if document is None:
+                page_words, sources, dpi_stats = _ocr_pages(renderer, dpi, lang, on_page, save_preview,
+                                                            dpi_mode, engine, profile)
+                document = {'pages': page_words, 'sources': sources, 'dpi_stats': dpi_stats}
+                cache.put_words(key, document)
+            elif document['pages']:
+                preview_dpi = _preview_dpi(document, dpi, dpi_mode)
+                save_preview(renderer.render_page(0, preview_dpi), preview_dpi)
+        preview = cache.get_pages(_preview_key(pdf_bytes, _preview_dpi(document, dpi, dpi_mode)))
+    page_words = document['pages']
+    sources = set(document['sources'])
+
+    page_texts = [ocr.words_to_text(words) for words in page_words]
+    return {
+        'text': '\n\n'.join(page_texts),
+        'words': merge_pages(page_words),
+        'page_texts': page_texts,
+        'page_count': len(page_words),
+        'preview': preview[0] if preview else None,
+        'source': sources.pop() if len(sources) == 1 else ('mixed' if sources else 'ocr'),
+        'dpi_stats': document['dpi_stats'],
+    }
+
+
+def ocr_page_range(pdf_bytes, page_indices, dpi=200, lang=ocr.DEFAULT_LANG, dpi_mode='fixed', engine=None,
+                   profile=None):
+    """Word boxes của một nhóm trang (ví dụ các trang của một hóa đơn trong PDF nhiều hóa đơn).
+
+    Trang có lớp text đọc thẳng, trang scan OCR trong process pool theo cùng pipeline với
+    ocr_pdf (tối đa OCR_WORKERS trang trong bộ nhớ, tầng DPI nếu dpi_mode='adaptive').
+    Trả về dict pages (word boxes từng trang theo page_indices) và sources ('text'/'ocr'
+    từng trang); có cache theo nội dung PDF và danh sách trang.
+    """
+    page_indices = list(page_indices)
+    cache = get_cache()
+    key = make_key(pdf_bytes, kind='pdf_page_range', pages=page_indices, dpi=dpi, lang=lang, dpi_mode=dpi_mode,
+                   cascade=(dpi_cascade.LOW_DPI, dpi_cascade.HIGH_DPI, dpi_cascade.CONF_THRESHOLD),
+                   engine=get_engine(engine).name, profile=profile)
+    document = cache.get_words(key)
+    if document is not None:
+        return document
+
+    with get_renderer(pdf_bytes) as renderer:
+        page_words, sources, _ = _ocr_pages(renderer, dpi, lang, None, None, dpi_mode, engine, profile,
+                                            page_indices)
+    document = {'pages': page_words, 'sources': sources}
+    cache.put_words(key, document)
+    return document
@@ -0,0 +1,202 @@
+"""Raster hóa trang PDF với backend có thể thay thế.
+
+Mặc định dùng pypdfium2 (render trực tiếp trong tiến trình vào bộ nhớ). Nếu
+chưa cài pypdfium2 hoặc không mở được file thì dùng pdf2image/poppler.
+Với PDF hóa đơn điện tử có sẵn lớp text, extract_words đọc trực tiếp text kèm
+tọa độ mà không cần raster hóa và OCR.
+"""
+import threading
+
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+
+# Import pypdfium2 (optional)
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+# PDFium không thread-safe, các session Streamlit chạy trên nhiều thread
+_PDFIUM_LOCK = threading.Lock()
+
+
+class PdfRenderer:
+    """Giao diện chung của các backend raster hóa PDF.
+
+    Vùng (bbox) là tuple (left, top, right, bottom) theo tỉ lệ 0..1 của trang.
+    """
+
+    name = 'base'
+
+    def __init__(self, pdf_bytes):
+        self.pdf_bytes = pdf_bytes
+
+    def page_count(self):
+        raise NotImplementedError
+
+    def render_page(self, page_index, dpi=200):
+        raise NotImplementedError
+
+    def extract_words(self, page_index, dpi=200):
+        """Đọc word boxes từ lớp text của PDF (tọa độ pixel ở dpi tương ứng).
+
+        Trả về dict cùng định dạng với image_to_data, hoặc None nếu backend không hỗ trợ.
+        """
+        return None
+
+    def render_region(self, page_index, bbox, dpi=200):
+        """Raster hóa một vùng của trang (mặc định: render cả trang rồi cắt)"""
+        image = self.render_page(page_index, dpi)
+        left, top, right, bottom = bbox
+        width, height = image.size
+        return image.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PdfiumRenderer(PdfRenderer):
+    """Render bằng PDFium trong tiến trình, không ghi file tạm, không fork tiến trình con"""
+
+    name = 'pypdfium2'
+
+    def __init__(self, pdf_bytes):
+        super().__init__(pdf_bytes)
+        with _PDFIUM_LOCK:
+            self._pdf = pdfium.PdfDocument(pdf_bytes)
+
+    def page_count(self):
+        return len(self._pdf)
+
+    def _render(self, page_index, dpi, crop=None):
+        with _PDFIUM_LOCK:
+            page = self._pdf[page_index]
+            try:
+                kwargs = {}
+                if crop is not None:
+                    # crop của PDFium tính bằng point, là phần bị cắt bỏ ở mỗi cạnh (trái, dưới, phải, trên)
+                    width, height = page.get_size()
+                    left, top, right, bottom = crop
+                    kwargs['crop'] = (left * width, (1 - bottom) * height, (1 - right) * width, top * height)
+                bitmap = page.render(scale=dpi / 72, **kwargs)
+                image = bitmap.to_pil()
+                image.load()
+                return image.convert('RGB')
+            finally:
+                page.close()
+
+    def render_page(self, page_index, dpi=200):
+        return self._render(page_index, dpi)
+
+    def render_region(self, page_index, bbox, dpi=200):
+        return self._render(page_index, dpi, crop=bbox)
+
+    def extract_words(self, page_index, dpi=200):
+        with _PDFIUM_LOCK:
+            page = self._pdf[page_index]
+            textpage = page.get_textpage()
+            try:
+                page_height = page.get_size()[1]
+                char_count = textpage.count_chars()
+                text = textpage.get_text_range(0, char_count)
+                if len(text) != char_count:
+                    # Không khớp chỉ số ký tự với hộp ký tự thì không dùng được tọa độ
+                    return None
+                boxes = [textpage.get_charbox(i) for i in range(char_count)]
+            finally:
+                textpage.close()
+                page.close()
+        return _chars_to_words(text, boxes, page_height, dpi / 72)
+
+    def close(self):
+        with _PDFIUM_LOCK:
+            self._pdf.close()
+
+
+class Pdf2ImageRenderer(PdfRenderer):
+    """Render bằng pdf2image (gọi pdftoppm của poppler), dùng khi không có pypdfium2"""
+
+    name = 'pdf2image'
+
+    def __init__(self, pdf_bytes):
+        super().__init__(pdf_bytes)
+        self._page_count = None
+
+    def page_count(self):
+        if self._page_count is None:
+            self._page_count = pdfinfo_from_bytes(self.pdf_bytes)['Pages']
+        return self._page_count
+
+    def render_page(self, page_index, dpi=200):
+        images = convert_from_bytes(self.pdf_bytes, dpi=dpi,
+                                    first_page=page_index + 1, last_page=page_index + 1)
+        return images[0] if images else None
+
+
+def _chars_to_words(text, boxes, page_height, scale):
+    """Gom ký tự (kèm hộp tọa độ PDF) thành word boxes theo định dạng image_to_data"""
+    words = {column: [] for column in ('level', 'page_num', 'block_num', 'par_num', 'line_num',
+                                        'word_num', 'left', 'top', 'width', 'height', 'conf', 'text')}
+    line_num = 1
+    word_num = 0
+    current = []
+
+    def flush():
+        nonlocal word_num
+        if not current:
+            return
+        word_num += 1
+        left = min(b[0] for _, b in current)
+        bottom = min(b[1] for _, b in current)
+        right = max(b[2] for _, b in current)
+        top = max(b[3] for _, b in current)
+        for column, value in (('level', 5), ('page_num', 1), ('block_num', 1), ('par_num', 1),
+                              ('line_num', line_num), ('word_num', word_num),
+                              ('left', int(left * scale)), ('top', int((page_height - top) * scale)),
+                              ('width', int((right - left) * scale)), ('height', int((top - bottom) * scale)),
+                              ('conf', 100), ('text', ''.join(ch for ch, _ in current))):
+            words[column].append(value)
+        current.clear()
+
+    for ch, box in zip(text, boxes):
+        if ch in '\r\n':
+            flush()
+            if ch == '\n':
+                line_num += 1
+                word_num = 0
+        elif ch.isspace():
+            flush()
+        else:
+            current.append((ch, box))
+    flush()
+    return words
+
+
+def has_text_layer(words, min_chars=30, min_valid_ratio=0.9):
+    """Kiểm tra lớp text có dùng được không (đủ ký tự và không phải font mất bảng mã)"""
+    if not words:
+        return False
+    chars = ''.join(words.get('text', []))
+    if len(chars) < min_chars:
+        return False
+    # Font nhúng không có ToUnicode thường cho ra ký tự thay thế hoặc vùng private-use
+    valid = sum(1 for ch in chars if ch != '\ufffd' and not ('\ue000' <= ch <= '\uf8ff') and ch.isprintable())
+    return valid / len(chars) >= min_valid_ratio
+
+
+def get_renderer(pdf_bytes, backend=None):
+    """Tạo renderer cho PDF: backend 'pypdfium2', 'pdf2image' hoặc None (tự chọn)"""
+    if backend in (None, 'pypdfium2') and PDFIUM_AVAILABLE:
+        try:
+            return PdfiumRenderer(pdf_bytes)
+        except Exception:
+            # File PDFium không đọc được thì thử lại với poppler
+            if backend == 'pypdfium2':
+                raise
+    return Pdf2ImageRenderer(pdf_bytes)
@@ -0,0 +1,244 @@
+"""Tiền xử lý ảnh chụp (hóa đơn, CCCD) trước khi đưa vào Tesseract.
+
+Ảnh chụp điện thoại thường 12 MP, bị xoay, ánh sáng không đều. Thời gian OCR
+tỉ lệ với số điểm ảnh và nhiễu, nên ảnh được thu nhỏ về chiều cao dòng chữ mục
+tiêu, chuyển xám, nhị phân hóa thích ứng, sửa hướng (xoay 90/180 độ) và chỉnh
+nghiêng. Các bước phân tích chạy trên bản thu nhỏ bằng phép toán mảng NumPy.
+"""
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils.ocr_cache import get_cache, image_fingerprint, make_key
+from utils.ocr_engines import get_engine
+
+# Tắt tiền xử lý cho toàn ứng dụng bằng OCR_PREPROCESS=0
+ENABLED = os.environ.get("OCR_PREPROCESS", "1") != "0"
+
+DEFAULT_OPTIONS = {
+    'target_text_height': 36,  # Chiều cao dòng chữ (pixel) sau khi thu nhỏ
+    'max_upscale': 2.0,        # Ảnh chữ quá nhỏ được phóng to tối đa bấy nhiêu lần
+    'max_side': 3500,          # Cạnh dài tối đa của ảnh sau khi thu nhỏ/phóng to
+    'binarize': True,
+    'deskew': True,
+    'fix_orientation': True,
+    'max_skew': 10.0,          # Góc nghiêng tối đa được dò (độ)
+}
+
+# Cạnh dài của bản thu nhỏ dùng để phân tích hướng, góc nghiêng và chiều cao chữ
+ANALYSIS_SIDE = 1000
+SKEW_STEP = 0.5
+
+# Dò lộn ngược bằng hình dạng dòng chữ: tỉ lệ mực phía trên/phía dưới dải giữa dòng (hoặc
+# ngược lại) tối thiểu để quyết định, và số dòng tối thiểu; không đủ thì mới hỏi engine OCR
+ORIENTATION_RATIO = 1.5
+ORIENTATION_MIN_LINES = 3
+
+# Số điểm mực tối đa dùng khi dò góc nghiêng (lấy mẫu đều nếu nhiều hơn)
+MAX_SKEW_POINTS = 200000
+
+
+def to_grayscale(image):
+    """Áp dụng hướng EXIF của ảnh chụp, bỏ kênh alpha (nền trắng) và chuyển xám"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert('L')
+
+
+def _box_sum(values, radius, axis):
+    """Tổng trượt cửa sổ 2*radius+1 theo một trục (cửa sổ bị cắt ở mép), bằng tổng tích lũy"""
+    length = values.shape[axis]
+    shape = list(values.shape)
+    shape[axis] = 1
+    cumulative = np.concatenate((np.zeros(shape, dtype=np.int32), values.cumsum(axis=axis, dtype=np.int32)),
+                                axis=axis)
+    index = np.arange(length)
+    upper = np.minimum(index + radius + 1, length)
+    lower = np.maximum(index - radius, 0)
+    return np.take(cumulative, upper, axis=axis) - np.take(cumulative, lower, axis=axis), upper - lower
+
+
+def adaptive_threshold(gray, window=31, offset=10):
+    """Nhị phân hóa thích ứng theo trung bình cục bộ (bộ lọc hộp tách theo hàng rồi cột).
+
+    Trả về mảng bool, True là nền (sáng hơn trung bình cửa sổ trừ offset).
+    """
+    radius = window // 2
+    sums, col_counts = _box_sum(gray, radius, axis=1)
+    sums, row_counts = _box_sum(sums, radius, axis=0)
+    counts = np.outer(row_counts, col_counts)
+    return gray.astype(np.int32) * counts > sums - offset * counts
+
+
+def _profile_score(profile):
+    """Độ "nhọn" của hình chiếu mực: dòng chữ rõ cho phương sai lớn so với trung bình"""
+    mean = profile.mean()
+    return profile.var() / (mean * mean) if mean > 0 else 0.0
+
+
+def _crop_to_ink(ink):
+    """Cắt mảng mực về khung bao quanh vùng có mực (bỏ lề trắng)"""
+    rows = np.nonzero(ink.any(axis=1))[0]
+    cols = np.nonzero(ink.any(axis=0))[0]
+    if not len(rows):
+        return ink
+    return ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+
+def is_sideways(ink):
+    """Dòng chữ chạy dọc (ảnh bị xoay 90 độ) nếu hình chiếu theo cột rõ hơn theo hàng"""
+    ink = _crop_to_ink(ink)
+    return _profile_score(ink.sum(axis=0)) > 1.5 * _profile_score(ink.sum(axis=1))
+
+
+def estimate_skew(ink, max_angle=10.0, step=SKEW_STEP):
+    """Dò góc nghiêng (độ, ngược chiều kim đồng hồ để sửa) cho hình chiếu hàng nhọn nhất"""
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > MAX_SKEW_POINTS:
+        stride = len(ys) // MAX_SKEW_POINTS + 1
+        ys, xs = ys[::stride], xs[::stride]
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32)
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        theta = np.deg2rad(angle)
+        # Tọa độ hàng của điểm mực sau khi xoay ảnh một góc angle
+        rows = ys * np.cos(theta) - xs * np.sin(theta)
+        profile = np.bincount((rows - rows.min()).astype(np.int64))
+        # Tổng số điểm không đổi nên tổng bình phương lớn nhất khi mực dồn vào ít hàng nhất
+        score = np.square(profile, dtype=np.float64).sum()
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _text_lines(ink):
+    """Các đoạn hàng liên tiếp có mực (dòng chữ), trả về danh sách (top, bottom)"""
+    profile = ink.sum(axis=1)
+    if not profile.any():
+        return []
+    has_ink = profile > max(2, 0.05 * profile.max())
+    # Vị trí bắt đầu/kết thúc của các đoạn True
+    edges = np.diff(np.concatenate(([0], has_ink.astype(np.int8), [0])))
+    starts = np.nonzero(edges == 1)[0]
+    ends = np.nonzero(edges == -1)[0]
+    return [(top, bottom) for top, bottom in zip(starts, ends) if bottom - top >= 3]
+
+
+def guess_upside_down(ink):
+    """Đoán ảnh có lộn ngược không từ hình dạng các dòng chữ (chỉ phép toán mảng).
+
+    Chữ Latin/tiếng Việt có nét lên (b, d, h, chữ hoa) và dấu thanh phía trên dải giữa
+    dòng nhiều hơn nét xuống (g, p, y) phía dưới. Trả về True/False, hoặc None nếu
+    không đủ chắc (ít dòng, chữ in hoa toàn bộ...).
+    """
+    above = below = 0
+    lines = _text_lines(ink)
+    for top, bottom in lines:
+        profile = ink[top:bottom].sum(axis=1)
+        core = np.nonzero(profile >= 0.5 * profile.max())[0]
+        above += int(profile[:core[0]].sum())
+        below += int(profile[core[-1] + 1:].sum())
+    if len(lines) < ORIENTATION_MIN_LINES:
+        return None
+    if above >= ORIENTATION_RATIO * max(below, 1):
+        return False
+    if below >= ORIENTATION_RATIO * max(above, 1):
+        return True
+    return None
+
+
+def is_upside_down(gray, engine=None):
+    """Hỏi engine OCR sẽ đọc ảnh (utils.ocr_engines) ảnh có bị lộn ngược 180 độ không.
+
+    Hình chiếu mực không phân biệt được 0 và 180 độ. Tesseract dùng OSD, engine khác
+    so độ tin cậy khi đọc ảnh và ảnh lật; không xác định được thì coi như ảnh đứng thẳng.
+    """
+    return get_engine(engine).is_upside_down(gray)
+
+
+def estimate_text_height(ink):
+    """Chiều cao trung vị của các dòng chữ (pixel), None nếu không tìm thấy dòng nào"""
+    heights = [bottom - top for top, bottom in _text_lines(ink)]
+    return float(np.median(heights)) if heights else None
+
+
+def analyze(gray, engine=None, **options):
+    """Phân tích bản thu nhỏ của ảnh xám, trả về dict: rotation, skew, text_height, scale.
+
+    engine là tên engine OCR sẽ đọc ảnh, chỉ được hỏi khi hình dạng dòng chữ không đủ
+    để biết ảnh có lộn ngược không.
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    work_scale = min(1.0, ANALYSIS_SIDE / max(gray.size))
+    work = gray
+    if work_scale < 1.0:
+        work = gray.resize((max(1, round(gray.width * work_scale)), max(1, round(gray.height * work_scale))),
+                           Image.BILINEAR)
+    ink = ~adaptive_threshold(np.asarray(work), window=25, offset=15)
+
+    rotation = 0
+    if options['fix_orientation'] and is_sideways(ink):
+        rotation = 90
+        work = work.transpose(Image.ROTATE_90)
+        ink = np.rot90(ink)
+    skew = estimate_skew(ink, options['max_skew']) if options['deskew'] else 0.0
+    if skew:
+        work = work.rotate(skew, resample=Image.BILINEAR, expand=True, fillcolor=255)
+        ink = ~adaptive_threshold(np.asarray(work), window=25, offset=15)
+    if options['fix_orientation']:
+        upside_down = guess_upside_down(ink)
+        if upside_down is None:
+            upside_down = is_upside_down(work, engine)
+        if upside_down:
+            rotation = (rotation + 180) % 360
+
+    text_height = estimate_text_height(ink)
+    if text_height:
+        text_height /= work_scale
+        scale = min(options['target_text_height'] / text_height, options['max_upscale'])
+    else:
+        scale = 1.0
+    # Chữ nhỏ trên ảnh lớn cũng không được phóng to quá max_side
+    scale = min(scale, options['max_side'] / max(gray.size))
+    return {'rotation': rotation, 'skew': skew, 'text_height': text_height, 'scale': scale}
+
+
+def preprocess_image(image, engine=None, **options):
+    """Tiền xử lý ảnh cho OCR (engine: tên engine sẽ đọc ảnh), trả về ảnh PIL mode 'L' (đen trắng nếu binarize)"""
+    options = {**DEFAULT_OPTIONS, **options}
+    gray = to_grayscale(image)
+    # Kết quả phân tích (kể cả lần hỏi engine về hướng ảnh) lưu cache theo nội dung ảnh
+    cache = get_cache()
+    key = make_key(image_fingerprint(gray), kind='preprocess_analysis', options=options,
+                   engine=get_engine(engine).name)
+    params = cache.get_words(key)
+    if params is None:
+        params = analyze(gray, engine, **options)
+        cache.put_words(key, params)
+
+    # Thu nhỏ trước để các bước xoay và nhị phân hóa chạy trên ít điểm ảnh hơn
+    if abs(params['scale'] - 1.0) > 0.05:
+        size = (max(1, round(gray.width * params['scale'])), max(1, round(gray.height * params['scale'])))
+        gray = gray.resize(size, Image.LANCZOS if params['scale'] < 1 else Image.BICUBIC)
+    # Cùng thứ tự với analyze: xoay 90, chỉnh nghiêng, rồi lật 180
+    if params['rotation'] in (90, 270):
+        gray = gray.transpose(Image.ROTATE_90)
+    if params['skew']:
+        gray = gray.rotate(params['skew'], resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if params['rotation'] in (180, 270):
+        gray = gray.transpose(Image.ROTATE_180)
+
+    if options['binarize']:
+        # Cửa sổ khoảng hai lần chiều cao dòng chữ mục tiêu
+        window = 2 * options['target_text_height'] + 1
+        background = adaptive_threshold(np.asarray(gray), window=window, offset=10)
+        gray = Image.fromarray(np.where(background, 255, 0).astype(np.uint8))
+    return gray
@@ -0,0 +1,35 @@
+"""Ghi nhớ kết quả xử lý file upload trong session, tránh chạy lại khi Streamlit rerun"""
+import streamlit as st
+
+from utils.upload_store import content_hash
+
+# Số hash nội dung file upload nhớ trong mỗi session
+MAX_UPLOAD_HASHES = 32
+
+
+def _upload_hash(uploaded_file):
+    """sha256 nội dung file; file có file_id (mỗi lần upload một id) chỉ băm một lần cho mỗi session"""
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id is None:
+        return content_hash(uploaded_file)
+    hashes = st.session_state.setdefault('_upload_hashes', {})
+    if file_id not in hashes:
+        if len(hashes) >= MAX_UPLOAD_HASHES:
+            hashes.clear()
+        hashes[file_id] = content_hash(uploaded_file)
+    return hashes[file_id]
+
+
+def upload_key(uploaded_file, *extra):
+    """Khóa memo của một file upload: file id + hash nội dung + các tham số xử lý"""
+    file_id = getattr(uploaded_file, 'file_id', None) or uploaded_file.name
+    return (file_id, _upload_hash(uploaded_file)) + tuple(extra)
+
+
+def session_memo(name, key, compute):
+    """Chạy compute() một lần cho mỗi key; các lần rerun sau dùng lại kết quả trong session_state"""
+    memo = st.session_state.get(name)
+    if memo is None or memo['key'] != key:
+        memo = {'key': key, 'value': compute()}
+        st.session_state[name] = memo
+    return memo['value']
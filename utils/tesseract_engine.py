@@ -0,0 +1,196 @@
+"""Pool các engine Tesseract sống lâu trong tiến trình (qua tesserocr).
+
+pytesseract gọi một tiến trình tesseract mới cho mỗi lần OCR: nạp lại traineddata
+vie+eng và ghi ảnh ra file tạm. Với tesserocr, mỗi engine giữ sẵn mô hình ngôn ngữ
+trong bộ nhớ và nhận trực tiếp ảnh PIL; các engine được tái sử dụng giữa các lần
+gọi (kể cả trong các tiến trình OCR của process pool). Nếu chưa cài tesserocr hoặc
+không khởi tạo được engine thì dùng pytesseract như cũ.
+"""
+import os
+import queue
+import shlex
+import threading
+from contextlib import contextmanager
+
+import pytesseract
+from pytesseract.pytesseract import file_to_dict
+
+# Import scheduler trước tesserocr để OMP_THREAD_LIMIT có hiệu lực khi nạp Tesseract
+from utils.ocr_scheduler import get_scheduler
+
+# Import tesserocr (optional)
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+# Cấu hình tesseract (nếu cần)
+# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# Số engine tối đa cho mỗi cấu hình (lang + config) trong một tiến trình
+POOL_SIZE = int(os.environ.get("OCR_ENGINE_POOL_SIZE", "4"))
+
+# Header TSV của tesseract (GetTSVText không trả về dòng header)
+_TSV_HEADER = '\t'.join(('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                         'left', 'top', 'width', 'height', 'conf', 'text'))
+
+
+# Biến chỉ có hiệu lực khi khởi tạo engine (không đặt được bằng SetVariable sau đó)
+_INIT_VARIABLES = ('user_patterns_file', 'user_words_file')
+
+
+def parse_config(config):
+    """Tách chuỗi config kiểu dòng lệnh tesseract thành (psm, oem, variables, tessdata_dir)"""
+    psm, oem, variables, tessdata_dir = None, None, {}, None
+    args = shlex.split(config or '')
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--psm' and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 1
+        elif arg == '--oem' and i + 1 < len(args):
+            oem = int(args[i + 1])
+            i += 1
+        elif arg == '-c' and i + 1 < len(args) and '=' in args[i + 1]:
+            name, value = args[i + 1].split('=', 1)
+            variables[name] = value
+            i += 1
+        elif arg == '--tessdata-dir' and i + 1 < len(args):
+            tessdata_dir = args[i + 1]
+            i += 1
+        elif arg == '--user-patterns' and i + 1 < len(args):
+            variables['user_patterns_file'] = args[i + 1]
+            i += 1
+        i += 1
+    return psm, oem, variables, tessdata_dir
+
+
+class EnginePool:
+    """Pool engine tesserocr theo từng cấu hình (lang, config).
+
+    Engine rảnh được giữ trong hàng đợi; nếu tất cả đang bận và chưa đủ POOL_SIZE
+    thì tạo thêm, nếu đã đủ thì chờ engine được trả lại.
+    """
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._created = {}
+
+    def _create(self, lang, config):
+        psm, oem, variables, tessdata_dir = parse_config(config)
+        kwargs = {'lang': lang}
+        if psm is not None:
+            kwargs['psm'] = psm
+        if oem is not None:
+            kwargs['oem'] = oem
+        if tessdata_dir:
+            kwargs['path'] = tessdata_dir
+        init_variables = {name: value for name, value in variables.items() if name in _INIT_VARIABLES}
+        if init_variables:
+            kwargs['variables'] = init_variables
+        api = tesserocr.PyTessBaseAPI(**kwargs)
+        for name, value in variables.items():
+            if name not in _INIT_VARIABLES:
+                api.SetVariable(name, value)
+        return api
+
+    @contextmanager
+    def engine(self, lang, config=''):
+        """Mượn một engine đã khởi tạo cho (lang, config), trả lại pool khi dùng xong"""
+        key = (lang, config)
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.LifoQueue())
+            create = idle.empty() and self._created.get(key, 0) < self.size
+            if create:
+                self._created[key] = self._created.get(key, 0) + 1
+        if create:
+            try:
+                api = self._create(lang, config)
+            except Exception:
+                with self._lock:
+                    self._created[key] -= 1
+                raise
+        else:
+            api = idle.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            idle.put(api)
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                while not idle.empty():
+                    idle.get().End()
+            self._idle.clear()
+            self._created.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_engine_failed = False
+
+
+def get_pool():
+    """Pool engine dùng chung trong tiến trình (khởi tạo một lần)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = EnginePool()
+        return _pool
+
+
+def _use_engine():
+    return TESSEROCR_AVAILABLE and not _engine_failed
+
+
+def _run(image, lang, config, read):
+    """Chạy read(api) trên một engine của pool; khởi tạo lỗi thì chuyển hẳn sang pytesseract"""
+    global _engine_failed
+    try:
+        with get_pool().engine(lang, config) as api:
+            api.SetImage(image)
+            return read(api)
+    except RuntimeError:
+        # Thường do không tìm thấy tessdata của tesserocr: không thử lại ở các lần sau
+        _engine_failed = True
+        return None
+
+
+def image_to_string(image, lang, config=''):
+    """OCR ảnh thành text (tương đương pytesseract.image_to_string)"""
+    with get_scheduler().slot():
+        if _use_engine():
+            text = _run(image, lang, config, lambda api: api.GetUTF8Text())
+            if text is not None:
+                return text
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+
+def detect_rotation(image):
+    """(góc xoay để ảnh đứng thẳng, độ tin cậy) theo Tesseract OSD.
+
+    Cần osd.traineddata; không có hoặc OSD lỗi (ảnh quá ít chữ) thì trả về (0, 0.0).
+    """
+    with get_scheduler().slot():
+        try:
+            osd = pytesseract.image_to_osd(image, config='--psm 0', output_type=pytesseract.Output.DICT)
+        except (pytesseract.TesseractError, EnvironmentError):
+            return 0, 0.0
+    return osd.get('rotate', 0), osd.get('orientation_conf', 0.0)
+
+
+def image_to_data(image, lang, config=''):
+    """OCR ảnh thành dict word boxes (cùng định dạng pytesseract Output.DICT)"""
+    with get_scheduler().slot():
+        if _use_engine():
+            tsv = _run(image, lang, config, lambda api: api.GetTSVText(0))
+            if tsv is not None:
+                return file_to_dict(_TSV_HEADER + '\n' + tsv, '\t', -1)
+        return pytesseract.image_to_data(image, lang=lang, config=config,
+                                         output_type=pytesseract.Output.DICT)
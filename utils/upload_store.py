@@ -0,0 +1,90 @@
+"""Đọc file upload tiết kiệm bộ nhớ: đọc theo khối, spool ra đĩa, giải mã JPEG thu nhỏ, ảnh xem trước nhỏ.
+
+Streamlit giữ file upload trong bộ nhớ; các bước xử lý ở đây tránh tạo thêm bản sao
+lớn của nó. Băm nội dung đọc theo từng khối; bản sao cần cho xử lý (ví dụ mở ZIP) là
+SpooledTemporaryFile, vượt SPOOL_MAX_SIZE thì nằm trên đĩa. Ảnh JPEG lớn được giải mã
+thẳng ở 1/2, 1/4 hoặc 1/8 kích thước (draft) thay vì giải mã đầy đủ rồi thu nhỏ. Giao
+diện chỉ nhận ảnh xem trước JPEG nhỏ, không gửi ảnh độ phân giải OCR lên trình duyệt
+ở mỗi lần rerun.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+# Bản sao file upload lớn hơn ngưỡng này (MB) được ghi ra file tạm trên đĩa
+SPOOL_MAX_SIZE = int(float(os.environ.get("UPLOAD_SPOOL_MB", "8")) * 1024 * 1024)
+CHUNK_SIZE = 1024 * 1024
+
+# Cạnh dài tối thiểu giữ lại khi giải mã ảnh để OCR (JPEG lớn hơn nhiều lần thì giải mã thu nhỏ)
+OCR_MAX_SIDE = int(os.environ.get("UPLOAD_OCR_MAX_SIDE", "3000"))
+# Cạnh dài và chất lượng JPEG của ảnh xem trước trên giao diện
+PREVIEW_SIDE = int(os.environ.get("UPLOAD_PREVIEW_SIDE", "800"))
+PREVIEW_QUALITY = 80
+
+
+def iter_chunks(fileobj, chunk_size=CHUNK_SIZE):
+    """Đọc file từ đầu theo từng khối, trả lại vị trí đầu file khi xong"""
+    fileobj.seek(0)
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.seek(0)
+
+
+def content_hash(fileobj):
+    """sha256 (hex) của nội dung file, đọc theo khối"""
+    sha = hashlib.sha256()
+    for chunk in iter_chunks(fileobj):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def spool(fileobj):
+    """Bản sao đọc được của file: trong bộ nhớ nếu nhỏ hơn SPOOL_MAX_SIZE, lớn hơn thì trên đĩa"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    for chunk in iter_chunks(fileobj):
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def open_image(fileobj, max_side=OCR_MAX_SIDE):
+    """Mở ảnh upload (chưa giải mã cho tới khi dùng).
+
+    JPEG có cạnh dài gấp hai lần max_side trở lên được giải mã ở kích thước nhỏ hơn bằng
+    draft, cạnh dài sau giải mã vẫn không nhỏ hơn max_side.
+    """
+    fileobj.seek(0)
+    image = Image.open(fileobj)
+    if image.format == 'JPEG' and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        image.draft(image.mode, (max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+    return image
+
+
+def preview_bytes(image, side=PREVIEW_SIDE):
+    """Ảnh xem trước JPEG (bytes) cạnh dài tối đa side, đã xoay theo EXIF"""
+    preview = ImageOps.exif_transpose(image)
+    if preview.mode in ('RGBA', 'LA', 'P'):
+        preview = preview.convert('RGBA')
+        background = Image.new('RGBA', preview.size, (255, 255, 255, 255))
+        preview = Image.alpha_composite(background, preview)
+    # convert luôn tạo bản sao, thumbnail không sửa ảnh gốc
+    preview = preview.convert('RGB')
+    preview.thumbnail((side, side))
+    buf = io.BytesIO()
+    preview.save(buf, format='JPEG', quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+def upload_preview(fileobj, side=PREVIEW_SIDE):
+    """Ảnh xem trước của một file ảnh upload, JPEG được giải mã ở kích thước nhỏ nhất có thể"""
+    with open_image(fileobj, side) as image:
+        return preview_bytes(image, side)